@@ -1,97 +1,165 @@
 
 import numpy as np
-from tqdm import tqdm
-from simulation import simulate_restaurant_outbreak_v3
+from worker import imap_into_buffer, result_buffer, release_buffer, task_seeds
+from streaming import (MEMORY_BUDGET, count_percentiles, size_counts,
+                       stream_sizes)
 
-def calculate_score(real_sizes, sim_sizes):
-    r = np.percentile(real_sizes, [10,25,50,75,90,95,99])
-    s = np.percentile(sim_sizes,  [10,25,50,75,90,95,99])
-    w = np.array([1,1.5,2.5,1.5,2,2.5,3.5])
-    return np.average(np.abs(r - s), weights=w)
+PERCENTILES = [10,25,50,75,90,95,99]
+WEIGHTS = np.array([1,1.5,2.5,1.5,2,2.5,3.5])
 
-def calibrate_fast_for_kfold(train_sizes):
+def calculate_score(real_sizes, sim_sizes):
+    r = np.percentile(real_sizes, PERCENTILES)
+    s = np.percentile(sim_sizes,  PERCENTILES)
+    return np.average(np.abs(r - s), weights=WEIGHTS)
+
+def score_rows(real_sizes, sims):
+    """calculate_score for every row of a (cells, draws) array, in place."""
+    r = np.percentile(real_sizes, PERCENTILES)
+    s = np.percentile(sims, PERCENTILES, axis=1).T
+    return np.average(np.abs(r - s), axis=1, weights=WEIGHTS)
+
+def score_counts(real_sizes, counts):
+    """calculate_score against a size histogram (see streaming.py)."""
+    r = np.percentile(real_sizes, PERCENTILES)
+    s = count_percentiles(counts, PERCENTILES)
+    return np.average(np.abs(r - s), weights=WEIGHTS)
+
+def score_stream(real_sizes, params, n_sims, executor=None, sampling=None,
+                 memory_budget=MEMORY_BUDGET):
+    """
+    Score one parameter set on n_sims baseline outbreaks, consumed as a
+    stream, so n_sims is bounded by time rather than memory.
+    """
+    counts = size_counts(stream_sizes('baseline', params, n_sims, executor,
+                                      sampling, memory_budget))
+    return score_counts(real_sizes, counts)
+
+def simulate_grid(cells, n_sims, executor=None, progress=None,
+                  sampling=None):
+    """
+    Simulate n_sims baseline outbreaks for every parameter cell, written
+    by the workers straight into a shared (cells, n_sims) buffer.
+    sampling: restaurant configuration scheme (see worker.simulate_sizes).
+    Returns (spec, buffer); release_buffer(spec) when done.
+    """
+
+    spec, buf = result_buffer((len(cells), n_sims), executor)
+    tasks = [
+        (i, 0, 'baseline', cell, n_sims, seed, sampling)
+        for i, (cell, seed) in enumerate(zip(cells, task_seeds(len(cells))))
+    ]
+    for _ in imap_into_buffer(tasks, spec, buf, executor):
+        if progress is not None:
+            progress(1)
+    return spec, buf
+
+def kfold_cells():
+    """The fast k-fold calibration grid (240 cells)."""
 
     betas_handler = np.linspace(0.015,0.035,5)
     probs = np.linspace(0.10,0.22,4)
     means = np.linspace(35,65,3)
     betas_staff = [0.01, 0.05, 0.1, 0.2]
 
-    best_sc = np.inf
-    best_par = None
-
-    for bh in betas_handler:
-        for p in probs:
-            for m in means:
-                for bs in betas_staff:
-
-                    sims = np.array([
-                        simulate_restaurant_outbreak_v3(
-                            beta_handler_patron=bh,
-                            prob_food_contamination=p,
-                            contamination_size_mean=m,
-                            contamination_size_std=30,
-                            beta_staff_staff=bs
-                        )
-                        for _ in range(200)
-                    ])
-
-                    sc = calculate_score(train_sizes, sims)
-
-                    if sc < best_sc:
-                        best_sc = sc
-                        best_par = {
-                            'beta_handler_patron': bh,
-                            'prob_food_contamination': p,
-                            'contamination_size_mean': m,
-                            'beta_staff_staff': bs
-                        }
-
+    return [
+        {
+            'beta_handler_patron': bh,
+            'prob_food_contamination': p,
+            'contamination_size_mean': m,
+            'beta_staff_staff': bs
+        }
+        for bh in betas_handler
+        for p in probs
+        for m in means
+        for bs in betas_staff
+    ]
+
+def calibrate_fast_for_kfold(train_sizes, executor=None, sampling=None):
+
+    cells = kfold_cells()
+
+    # contamination_size_std fixed at 30 in the simulations
+    spec, sims = simulate_grid(
+        [dict(cell, contamination_size_std=30) for cell in cells], 200,
+        executor, sampling=sampling)
+
+    scores = score_rows(train_sizes, sims)
+    best = int(np.argmin(scores))
+    best_par, best_sc = cells[best], scores[best]
+
+    del sims
+    release_buffer(spec)
     return best_par, best_sc
 
-def calibrate_model(train_sizes, n_sims=500, desc="Calibrating full grid"):
+def calibrate_design(train_sizes, space=None, budget=1024, design='sobol',
+                     n_sims=500, desc="Calibrating design",
+                     executor=None, sampling=None):
+    """
+    Calibration over an arbitrary parameter space (ranges or priors per
+    simulator kwarg, see parameter_space.py; default DEFAULT_SPACE),
+    scoring a fixed-size Sobol / Halton / LHS design of `budget` points
+    instead of a full grid. Returns (best_params, best_sim, best_score)
+    like calibrate_model.
+    """
+
+    from tqdm import tqdm
+    from parameter_space import DEFAULT_SPACE, sample_space, to_params
+
+    space = DEFAULT_SPACE if space is None else space
+    names, X = sample_space(space, budget, design)
+    fixed = {} if 'contamination_size_std' in names else \
+        {'contamination_size_std': 30}
+    cells = [to_params(space, x, fixed) for x in X]
+
+    pbar = tqdm(total=len(cells), desc=desc)
+    spec, sims = simulate_grid(cells, n_sims, executor, progress=pbar.update,
+                               sampling=sampling)
+    pbar.close()
+
+    scores = score_rows(train_sizes, sims)
+    best = int(np.argmin(scores))
+    best_params, best_score = cells[best], scores[best]
+    best_sim = np.array(sims[best])
+
+    del sims
+    release_buffer(spec)
+    return best_params, best_sim, best_score
+
+def calibrate_model(train_sizes, n_sims=500, desc="Calibrating full grid",
+                    executor=None, sampling=None):
+
+    from tqdm import tqdm
 
     betas_handler = np.linspace(0.015,0.035,8)
     probs = np.linspace(0.10,0.22,6)
     means = np.linspace(35,65,5)
     betas_staff = [0.01, 0.03, 0.05, 0.1, 0.2]
 
-    best_score = np.inf
-    best_params = None
-    best_sim = None
-
-    total_it = len(betas_handler)*len(probs)*len(means)*len(betas_staff)
-    pbar = tqdm(total=total_it, desc=desc)
-
-    for bh in betas_handler:
-        for p in probs:
-            for m in means:
-                for bs in betas_staff:
-
-                    sims = np.array([
-                        simulate_restaurant_outbreak_v3(
-                            beta_handler_patron=bh,
-                            prob_food_contamination=p,
-                            contamination_size_mean=m,
-                            contamination_size_std=30,
-                            beta_staff_staff=bs
-                        )
-                        for _ in range(n_sims)
-                    ])
-
-                    sc = calculate_score(train_sizes, sims)
-
-                    if sc < best_score:
-                        best_score = sc
-                        best_params = {
-                            'beta_handler_patron': bh,
-                            'beta_staff_staff': bs,
-                            'prob_food_contamination': p,
-                            'contamination_size_mean': m,
-                            'contamination_size_std': 30
-                        }
-                        best_sim = sims
-
-                    pbar.update(1)
-
+    cells = [
+        {
+            'beta_handler_patron': bh,
+            'beta_staff_staff': bs,
+            'prob_food_contamination': p,
+            'contamination_size_mean': m,
+            'contamination_size_std': 30
+        }
+        for bh in betas_handler
+        for p in probs
+        for m in means
+        for bs in betas_staff
+    ]
+
+    pbar = tqdm(total=len(cells), desc=desc)
+    spec, sims = simulate_grid(cells, n_sims, executor, progress=pbar.update,
+                               sampling=sampling)
     pbar.close()
+
+    # Score all cells in place on the shared buffer
+    scores = score_rows(train_sizes, sims)
+    best = int(np.argmin(scores))
+    best_params, best_score = cells[best], scores[best]
+    best_sim = np.array(sims[best])
+
+    del sims
+    release_buffer(spec)
     return best_params, best_sim, best_score
@@ -0,0 +1,368 @@
+"""
+Compiled outbreak kernel
+
+One scalar kernel for both simulators (the baseline is the policy model
+with no policy), written over integer state arrays so Numba can compile
+it: staff states are int8 codes, the exclusion / return state machine is
+a boolean array, and the early break on first infection and the 50%
+symptomatic dropout per shift are plain branches. Outbreaks in a batch
+run in parallel with prange.
+
+Every outbreak has its own MRG32k3a random streams, seeded from the
+batch seed and its index, so a batch gives the same sizes on any number
+of threads. Exclusion and return decisions use a second stream of their
+own, so outbreaks with the same seed under different exclusion
+compliance share every transmission draw until an exclusion actually
+changes who is on site (common random numbers for policy comparisons).
+When Numba is not installed the same kernel runs as plain Python, on
+the same random streams, at Python speed.
+
+The streams differ from numpy's, so kernel sizes follow the same
+distribution as simulate_restaurant_outbreak_v3 / simulate_outbreak_policy
+but are not draw-for-draw identical. Rare-event (is_*) and trajectory
+modes stay with the Python simulators.
+
+    sizes = simulate_kernel('policy', params, 100000, seed=1)
+"""
+
+import numpy as np
+
+from simulation import (
+    FOOD_HANDLERS_TABLE,
+    OTHER_STAFF_TABLE,
+    INIT_INFECTED_TABLE,
+    PATRONS_TABLE
+)
+from policy_simulation import policy_rates
+
+try:
+    from numba import njit, prange
+    NUMBA = True
+except ImportError:
+    NUMBA = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+# Simulator kwargs the kernel understands (shift_hours is unused by both
+# simulators)
+KERNEL_PARAMS = {
+    'n_food_handlers', 'n_other_staff', 'init_infected',
+    'patrons_per_shift', 'shift_hours', 'shifts_per_day',
+    'patrons_per_handler', 'max_days', 'latent_period',
+    'infectious_period', 'prob_symptomatic', 'beta_staff_staff',
+    'beta_handler_patron', 'beta_other_patron', 'prob_food_contamination',
+    'contamination_size_mean', 'contamination_size_std',
+    'policy_exclusion', 'policy_hygiene', 'compliance', 'xi_max', 'omega',
+    'beta_mult',
+}
+
+# Staff state codes
+S, E, IA, IS, R = 0, 1, 2, 3, 4
+
+# MRG32k3a (L'Ecuyer 1999); every product stays below 2^63
+M1 = 4294967087
+M2 = 4294944443
+NORM = 2.328306549295727688e-10
+
+
+def supports(params):
+    """True if the kernel can simulate these simulator kwargs."""
+    return set(params) <= KERNEL_PARAMS
+
+
+# RANDOM NUMBERS
+
+@njit(cache=True)
+def _uniform(st):
+    p1 = (1403580 * st[1] - 810728 * st[0]) % M1
+    st[0] = st[1]
+    st[1] = st[2]
+    st[2] = p1
+    p2 = (527612 * st[5] - 1370589 * st[3]) % M2
+    st[3] = st[4]
+    st[4] = st[5]
+    st[5] = p2
+    if p1 > p2:
+        return (p1 - p2) * NORM
+    return (p1 - p2 + M1) * NORM
+
+
+@njit(cache=True)
+def _normal(st):
+    # Box-Muller, one variate per pair
+    u1 = 1.0 - _uniform(st)
+    u2 = _uniform(st)
+    return np.sqrt(-2.0 * np.log(u1)) * np.cos(2.0 * np.pi * u2)
+
+
+@njit(cache=True)
+def _binomial(st, n, p):
+    # Inversion; n <= a few hundred and p small here, so O(n p) steps
+    if p <= 0.0:
+        return 0
+    if p >= 1.0:
+        return n
+    q = 1.0 - p
+    f = q ** n
+    u = _uniform(st)
+    k = 0
+    while u > f and k < n:
+        u -= f
+        f *= (n - k) / (k + 1) * p / q
+        k += 1
+    return k
+
+
+@njit(cache=True)
+def _table_draw(st, values, cdf):
+    u = _uniform(st)
+    for j in range(len(cdf) - 1):
+        if u < cdf[j]:
+            return values[j]
+    return values[len(cdf) - 1]
+
+
+# KERNEL
+
+@njit(cache=True)
+def _simulate_one(st, pt, config, tables, cdfs, p, exclusion):
+
+    patrons_per_handler = int(p[0])
+    shifts_per_day = int(p[1])
+    max_days = int(p[2])
+    latent_period, infectious_period, prob_symptomatic = p[3], p[4], p[5]
+    beta_ss, beta_hp, beta_op = p[6], p[7], p[8]
+    prob_contam, c_mean, c_std = p[9], p[10], p[11]
+    xi_eff, omega = p[12], p[13]
+
+    # Restaurant configuration (-1: draw from its table)
+    drawn = np.empty(4, dtype=np.int64)
+    for j in range(4):
+        if config[j] >= 0:
+            drawn[j] = config[j]
+        else:
+            drawn[j] = _table_draw(st, tables[j], cdfs[j])
+    n_handlers, n_other, init_infected, patrons_per_shift = \
+        drawn[0], drawn[1], drawn[2], drawn[3]
+
+    total_staff = n_handlers + n_other
+    state = np.zeros(total_staff, dtype=np.int8)
+    infection_day = np.zeros(total_staff)
+    excluded = np.zeros(total_staff, dtype=np.bool_)
+    infectious = np.empty(total_staff, dtype=np.int64)
+    susceptible = np.empty(total_staff, dtype=np.int64)
+
+    # Seed infections (partial Fisher-Yates)
+    perm = np.arange(total_staff)
+    for j in range(init_infected):
+        k = j + int(_uniform(st) * (total_staff - j))
+        perm[j], perm[k] = perm[k], perm[j]
+        state[perm[j]] = E
+
+    staff_inf = init_infected
+    pat_inf = 0
+
+    sig = np.sqrt(np.log(1 + (c_std / c_mean) ** 2))
+    mu = np.log(c_mean) - sig ** 2 / 2
+
+    for day in range(max_days):
+
+        # Disease progression
+        for i in range(total_staff):
+            if state[i] == E:
+                if day - infection_day[i] >= latent_period:
+                    if _uniform(st) < prob_symptomatic:
+                        state[i] = IS
+                    else:
+                        state[i] = IA
+            elif state[i] == IA or state[i] == IS:
+                if day - infection_day[i] >= \
+                        latent_period + infectious_period:
+                    state[i] = R
+
+        # Staff exclusion and return
+        if exclusion:
+            for i in range(total_staff):
+                if state[i] == IS and not excluded[i]:
+                    if _uniform(pt) < xi_eff:
+                        excluded[i] = True
+            for i in range(total_staff):
+                if excluded[i] and _uniform(pt) < omega:
+                    excluded[i] = False
+                    state[i] = R
+
+        n_inf = 0
+        n_sus = 0
+        for i in range(total_staff):
+            if excluded[i]:
+                continue
+            if state[i] == IA or state[i] == IS:
+                infectious[n_inf] = i
+                n_inf += 1
+            elif state[i] == S:
+                susceptible[n_sus] = i
+                n_sus += 1
+
+        # Staff-to-staff transmission (first successful contact wins)
+        for a in range(n_sus):
+            s = susceptible[a]
+            for b in range(n_inf):
+                if state[infectious[b]] == IS and _uniform(st) < 0.5:
+                    continue
+                if _uniform(st) < beta_ss:
+                    state[s] = E
+                    infection_day[s] = day + _uniform(st)
+                    staff_inf += 1
+                    break
+
+        # Shifts
+        for sh in range(shifts_per_day):
+            n_inf_handlers = 0
+            n_inf_other = 0
+            for b in range(n_inf):
+                i = infectious[b]
+                # Symptomatic staff miss half their shifts
+                if state[i] == IS and _uniform(st) < 0.5:
+                    continue
+                if i < n_handlers:
+                    n_inf_handlers += 1
+                else:
+                    n_inf_other += 1
+
+            for _ in range(n_inf_handlers):
+                pat_inf += _binomial(st, patrons_per_handler, beta_hp)
+
+            if n_inf_other > 0:
+                pat_inf += _binomial(st, patrons_per_shift,
+                                     beta_op * n_inf_other)
+
+            if n_inf_handlers > 0 and _uniform(st) < prob_contam:
+                size = int(np.exp(mu + sig * _normal(st)))
+                size = max(10, min(size, int(patrons_per_shift * 0.9)))
+                pat_inf += size
+
+    return staff_inf + pat_inf
+
+
+@njit(parallel=True, cache=True)
+def _simulate_batch(states, configs, tables, cdfs, p, exclusion):
+    n = states.shape[0]
+    sizes = np.empty(n, dtype=np.int64)
+    for i in prange(n):
+        st = states[i, :6].copy()
+        pt = states[i, 6:].copy()
+        sizes[i] = _simulate_one(st, pt, configs[i], tables, cdfs, p,
+                                 exclusion)
+    return sizes
+
+
+def _simulate_batch_python(states, configs, tables, cdfs, p, exclusion):
+    # Without Numba: lists keep the generator in (faster) Python ints
+    tables, cdfs, p = tables.tolist(), cdfs.tolist(), p.tolist()
+    return np.array([
+        _simulate_one(st[:6], st[6:], config, tables, cdfs, p, exclusion)
+        for st, config in zip(states.tolist(), configs.tolist())
+    ], dtype=np.int64)
+
+
+# PYTHON ENTRY POINT
+
+_TABLES = [FOOD_HANDLERS_TABLE, OTHER_STAFF_TABLE, INIT_INFECTED_TABLE,
+           PATRONS_TABLE]
+_WIDTH = max(len(t[0]) for t in _TABLES)
+
+
+def _padded_tables():
+    """Tables as (4, width) value / CDF arrays (padding is never drawn)."""
+
+    values = np.zeros((4, _WIDTH), dtype=np.int64)
+    cdfs = np.ones((4, _WIDTH))
+    for j, (v, prob) in enumerate(_TABLES):
+        values[j, :len(v)] = v
+        values[j, len(v):] = v[-1]
+        cdfs[j, :len(v)] = np.cumsum(prob)
+    return values, cdfs
+
+
+TABLE_VALUES, TABLE_CDFS = _padded_tables()
+
+CONFIG_KEYS = ['n_food_handlers', 'n_other_staff', 'init_infected',
+               'patrons_per_shift']
+
+
+def _kernel_inputs(params):
+    """Effective rates as the float vector _simulate_one reads, plus the
+    exclusion flag (same policy arithmetic as simulate_outbreak_policy;
+    the baseline simulator has the same defaults and no policy)."""
+
+    q = dict(patrons_per_handler=30, shifts_per_day=2, max_days=5,
+             latent_period=1.0, infectious_period=3.0, prob_symptomatic=0.7,
+             beta_staff_staff=0.1, beta_handler_patron=0.02,
+             beta_other_patron=0.001, prob_food_contamination=0.15,
+             contamination_size_mean=45, contamination_size_std=30,
+             policy_exclusion=False, policy_hygiene=False, compliance=0.0,
+             xi_max=0.4, omega=0.2, beta_mult=0.70)
+    q.update(params)
+
+    beta_ss, beta_hp, prob_contam, xi_eff = policy_rates(
+        q['beta_staff_staff'], q['beta_handler_patron'],
+        q['prob_food_contamination'], q['policy_exclusion'],
+        q['policy_hygiene'], q['compliance'], q['xi_max'], q['beta_mult'])
+
+    p = np.array([
+        q['patrons_per_handler'], q['shifts_per_day'], q['max_days'],
+        q['latent_period'], q['infectious_period'], q['prob_symptomatic'],
+        beta_ss, beta_hp, q['beta_other_patron'], prob_contam,
+        q['contamination_size_mean'], q['contamination_size_std'],
+        xi_eff, q['omega'],
+    ], dtype=np.float64)
+    return p, bool(q['policy_exclusion'])
+
+
+def stream_states(seed, n):
+    """(n, 12) MRG32k3a states: per outbreak, the main stream (columns
+    0-5) and the exclusion / return stream (columns 6-11)."""
+
+    words = np.random.SeedSequence(seed).generate_state(
+        12 * n, np.uint64).reshape(n, 4, 3)
+    states = np.empty((n, 4, 3), dtype=np.int64)
+    states[:, 0::2] = words[:, 0::2] % np.uint64(M1 - 1) + np.uint64(1)
+    states[:, 1::2] = words[:, 1::2] % np.uint64(M2 - 1) + np.uint64(1)
+    return states.reshape(n, 12)
+
+
+def simulate_kernel(kind, params, n, seed=None, configs=None):
+    """
+    n outbreak sizes from the compiled kernel ('baseline' or 'policy'
+    simulator kwargs, see KERNEL_PARAMS). configs: optional dict of
+    per-draw configuration arrays (simulation.sample_configurations);
+    fixed configuration values in params apply to every draw.
+    """
+
+    if kind not in ('baseline', 'policy'):
+        raise ValueError(f"unknown simulator {kind!r}; use 'baseline' or "
+                         f"'policy'")
+    if not supports(params):
+        raise ValueError("kernel does not support "
+                         f"{sorted(set(params) - KERNEL_PARAMS)}")
+
+    if seed is None:
+        seed = np.random.randint(0, 2**31 - 1)
+
+    cfg = np.full((n, 4), -1, dtype=np.int64)
+    for j, key in enumerate(CONFIG_KEYS):
+        if configs is not None:
+            cfg[:, j] = configs[key]
+        elif params.get(key) is not None:
+            cfg[:, j] = params[key]
+
+    p, exclusion = _kernel_inputs(
+        {k: v for k, v in params.items() if k not in CONFIG_KEYS})
+    batch = _simulate_batch if NUMBA else _simulate_batch_python
+    return batch(stream_states(seed, n), cfg, TABLE_VALUES, TABLE_CDFS, p,
+                 exclusion)
@@ -1,92 +1,672 @@
-
 """
 main execution pipeline
 
-This script runs:
-1. Calibration (k-fold, holdout, full)
-2. Publication plots for calibration
-3. Full policy analysis (16 scenarios + 5 figures)
-
-Make sure the following files exist in SRC/:
-- calibration.py
-- simulation.py
-- plotting.py   (your create_publication_plots + extra_validation_metrics)
-- policy_simulation.py
-- policy_analysis.py
+This script runs, as cached stages:
+1. validate  - k-fold + holdout validation
+2. calibrate - full calibration
+3. policy    - full policy analysis (scenarios.json registry)
+4. figures   - calibration plots, summary table + Figures 1–5
+
+Optional stages (not part of "all"):
+   sensitivity - Sobol indices over policy + transmission parameters
+   surface     - compliance x beta_mult response surface for queries
+   resample    - repeated stratified k-fold + bootstrap .632 validation
+   tails       - importance-sampled large-outbreak probabilities
+
+Usage (from src/):
+    python3 main.py                 # all stages
+    python3 main.py figures         # re-render only; upstream stages cached
+    python3 main.py policy --n-policy-sims 3000
+    python3 main.py all --force     # ignore the cache
+    python3 main.py sensitivity --sa-base 4096
+
+Each stage's outputs are stored under --cache-dir, keyed by its inputs
+(data hash, params, n_sims, seed, simulator source), so only stale
+stages re-execute.
 """
 
-import pandas as pd
-import numpy as np
+import os
 import random
+import argparse
+
+import numpy as np
 
 
 # Import modules
 from validation import (
+    KFOLD_SIMS,
     step1_kfold_validation,
     step2_holdout_validation,
     step3_full_calibration
 )
 
 # Import baseline publication plots
-from plotting import create_publication_plots
+from plotting import create_publication_plots, render_publication_plots
 from metrics import extra_validation_metrics
 
 # Import policy analysis
-from policy_analysis import run_complete_analysis
+from policy_analysis import (
+    SCENARIO_CHUNK,
+    run_comprehensive_policy_analysis,
+    run_ensemble_policy_analysis,
+    baseline_name,
+    create_summary_table,
+    create_ensemble_summary,
+    render_policy_figures,
+    create_figure1_overview,
+    create_figure2_hygiene_comparison,
+    create_figure3_policy_interactions,
+    create_figure4_cost_effectiveness,
+    create_figure5_distribution_comparisons,
+    policy_scenarios
+)
+
+# Stage cache + shared warm worker pool
+from pipeline import cached_stage, data_hash, source_hash, stage_seed
+from worker import ENGINES, get_executor, set_engine, shutdown_executor
+from surrogate import CALIBRATION_BOUNDS, EXTRA_BOUNDS
+from parameter_space import DESIGNS, DEFAULT_SPACE, load_space
+from sensitivity import SA_BOUNDS, SA_POLICY, run_sensitivity_analysis
+from response_surface import (
+    COMPLIANCE_GRID,
+    BETA_MULT_GRID,
+    build_response_surface,
+    surface_arrays,
+    surface_from_run
+)
+from regional import REGION_DEFAULTS, simulate_region, summarize_region
+from policy_optimizer import optimize_policies, plot_policy_frontier
+from rendering import use_headless_backend
+from work_queue import WorkQueueExecutor
+from query_service import PORT, WhatIfService, serve
+from rare_events import THRESHOLDS, estimate_policy_tails
+from resampling import (
+    bootstrap_632,
+    plot_resampling,
+    repeated_kfold,
+    resampling_summary,
+    simulate_cell_table
+)
+
+SEED = 30
+STAGES = ["validate", "calibrate", "policy", "figures", "all",
+          "sensitivity", "surface", "region", "optimize", "serve",
+          "resample", "tails"]
+
+
+def load_sizes(path="NORS_JS1.csv"):
+    import pandas as pd
+    df = pd.read_csv(path, header=None)
+    return df[0].dropna().astype(int).values
+
+
+def _seed(seed, stage):
+    s = stage_seed(seed, stage)
+    np.random.seed(s)
+    random.seed(s)
+
+
+def sim_sources(args, *modules):
+    """source_hash of the simulation modules; the kernel engine adds
+    kernel.py (and so gets its own cache keys)."""
+    if args.engine == 'kernel':
+        modules += ('kernel.py',)
+    return source_hash(*modules)
+
+
+# STAGES
+
+def calibration_options(args):
+    """Calibrator options for --calibration design / surrogate."""
+
+    if args.calibration == 'grid':
+        return None
+
+    if args.param_space:
+        space = load_space(args.param_space)
+    elif args.calibration == 'design':
+        space = DEFAULT_SPACE
+    elif args.extra_params:
+        space = dict(CALIBRATION_BOUNDS, **EXTRA_BOUNDS)
+    else:
+        space = CALIBRATION_BOUNDS
+
+    if args.calibration == 'design':
+        return {'space': space, 'budget': args.budget, 'design': args.design}
+    return {'bounds': space}
+
+
+def stage_validate(sizes, args, executor=None):
+
+    inputs = {
+        'data': data_hash(sizes), 'k': args.folds, 'seed': args.seed,
+        'sampling': args.sampling, 'calibration': args.calibration,
+        'options': calibration_options(args),
+        'sources': sim_sources(args, 'simulation.py', 'calibration.py',
+                               'validation.py', 'worker.py', 'surrogate.py',
+                               'parameter_space.py')
+    }
+
+    def compute():
+        _seed(args.seed, 'validate')
+
+        kfold_results, kmean, kstd = step1_kfold_validation(
+            sizes, k=args.folds, executor=executor, sampling=args.sampling)
+        hold_params, sim_train, train_vals, sim_test, test_vals, hold_ratio = \
+            step2_holdout_validation(sizes, executor=executor,
+                                     sampling=args.sampling,
+                                     method=args.calibration,
+                                     options=calibration_options(args))
+
+        arrays = {'sim_train': sim_train, 'train_vals': train_vals,
+                  'sim_test': sim_test, 'test_vals': test_vals}
+        meta = {'kfold_results': kfold_results, 'kfold_mean': kmean,
+                'kfold_std': kstd, 'holdout_params': hold_params,
+                'holdout_ratio': hold_ratio}
+        return arrays, meta
+
+    return cached_stage(args.cache_dir, 'validate', inputs, compute,
+                        force=args.force)
+
+
+def stage_resample(sizes, args, executor=None):
+    """Repeated k-fold and bootstrap validation, re-scored on one cached
+    simulation of the fast k-fold grid (the table does not depend on the
+    data, so new data or more resamples reuse it)."""
+
+    inputs = {
+        'n_sims': KFOLD_SIMS, 'sampling': args.sampling, 'seed': args.seed,
+        'sources': sim_sources(args, 'simulation.py', 'calibration.py',
+                               'worker.py', 'parameter_space.py')
+    }
+
+    def compute():
+        _seed(args.seed, 'resample')
+        table = simulate_cell_table(executor=executor,
+                                    sampling=args.sampling)
+        return {'sims': table['sims']}, {'cells': table['cells']}
+
+    arrays, meta = cached_stage(args.cache_dir, 'resample', inputs, compute,
+                                force=args.force)
+    table = {'cells': meta['cells'], 'sims': arrays['sims']}
+
+    _seed(args.seed, 'resample-splits')
+    kfold = repeated_kfold(sizes, table, k=args.folds, repeats=args.repeats)
+    boot = bootstrap_632(sizes, table, n_boot=args.bootstrap)
+    summary = resampling_summary(kfold, boot)
+
+    print("\nResampled validation (test / train score ratio):")
+    print(summary.round(3).to_string(index=False))
+    summary.to_csv('Resampled_Validation.csv', index=False)
+    print("✓ Saved: Resampled_Validation.csv")
+    if args.headless:
+        use_headless_backend()
+    plot_resampling(kfold, boot, show=not args.headless)
+    return {'kfold': kfold, 'bootstrap': boot, 'summary': summary}
+
+
+def stage_calibrate(sizes, args, executor=None):
+
+    inputs = {
+        'data': data_hash(sizes), 'n_sims': 500, 'seed': args.seed,
+        'sampling': args.sampling, 'calibration': args.calibration,
+        'options': calibration_options(args),
+        'sources': sim_sources(args, 'simulation.py', 'calibration.py',
+                               'worker.py', 'surrogate.py',
+                               'parameter_space.py')
+    }
+
+    def compute():
+        _seed(args.seed, 'calibrate')
+        final_params, sim_full = step3_full_calibration(
+            sizes, executor=executor, sampling=args.sampling,
+            method=args.calibration, options=calibration_options(args))
+        return {'sim_full': sim_full}, {'params': final_params}
+
+    arrays, meta = cached_stage(args.cache_dir, 'calibrate', inputs, compute,
+                                force=args.force)
+
+    print("\nCalibrated parameters:")
+    for key, val in meta['params'].items():
+        print(f"  {key}: {val}")
+
+    return arrays, meta
+
+
+def stage_policy(final_params, args, executor=None, ensemble=None):
+    """Policy scenarios for the calibrated parameters, or for every member
+    of a parameter ensemble (arrays are then members x runs)."""
+
+    specs = policy_scenarios(args.scenarios)
+
+    inputs = {
+        'params': final_params, 'ensemble': ensemble, 'scenarios': specs,
+        'n_sims': args.n_policy_sims,
+        'tolerance': args.tolerance, 'tail_tolerance': args.tail_tolerance,
+        'max_runs': args.max_runs, 'sampling': args.sampling,
+        'seed': args.seed, 'chunk': SCENARIO_CHUNK,
+        'sources': sim_sources(args, 'simulation.py', 'policy_simulation.py',
+                               'worker.py', 'policy_analysis.py')
+    }
+
+    def compute():
+        _seed(args.seed, 'policy')
+        if ensemble is not None:
+            scenarios = run_ensemble_policy_analysis(
+                ensemble, N_runs=args.n_policy_sims, executor=executor,
+                sampling=args.sampling, specs=specs)
+            return scenarios, {'params': final_params, 'ensemble': ensemble}
+        scenarios = run_comprehensive_policy_analysis(
+            final_params, N_runs=args.n_policy_sims, executor=executor,
+            tolerance=args.tolerance, tail_tolerance=args.tail_tolerance,
+            max_runs=args.max_runs, sampling=args.sampling, specs=specs,
+            store_dir=os.path.join(args.cache_dir, 'scenarios'),
+            seed=args.seed, force=args.force)
+        return scenarios, {'params': final_params}
+
+    return cached_stage(args.cache_dir, 'policy', inputs, compute,
+                        force=args.force)
+
+
+def stage_sensitivity(final_params, args, executor=None):
+
+    inputs = {
+        'params': final_params, 'bounds': SA_BOUNDS, 'policy': SA_POLICY,
+        'n_base': args.sa_base, 'n_reps': args.sa_reps,
+        'sampling': args.sampling, 'seed': args.seed,
+        'sources': sim_sources(args, 'simulation.py', 'policy_simulation.py',
+                               'worker.py', 'sensitivity.py')
+    }
+
+    def compute():
+        _seed(args.seed, 'sensitivity')
+        res = run_sensitivity_analysis(
+            final_params, n_base=args.sa_base, n_reps=args.sa_reps,
+            executor=executor, sampling=args.sampling)
+        arrays = {'X': res['X'], 'sizes': res['sizes']}
+        meta = {'names': res['names'], 'noise_share': res['noise_share'],
+                'indices': res['indices'].to_dict(orient='list')}
+        return arrays, meta
+
+    return cached_stage(args.cache_dir, 'sensitivity', inputs, compute,
+                        force=args.force)
+
+
+def stage_surface(final_params, args, executor=None):
+
+    inputs = {
+        'params': final_params, 'n_runs': args.surface_runs,
+        'compliance': COMPLIANCE_GRID, 'beta_mult': BETA_MULT_GRID,
+        'sampling': args.sampling, 'seed': args.seed,
+        'sources': sim_sources(args, 'simulation.py', 'policy_simulation.py',
+                               'worker.py', 'response_surface.py')
+    }
+
+    def compute():
+        _seed(args.seed, 'surface')
+        surface = build_response_surface(
+            final_params, n_runs=args.surface_runs, executor=executor,
+            sampling=args.sampling)
+        return surface_arrays(surface)
+
+    arrays, meta = cached_stage(args.cache_dir, 'surface', inputs, compute,
+                                force=args.force)
+    return surface_from_run(arrays, meta)
+
+
+def stage_optimize(final_params, args, executor=None):
+
+    inputs = {
+        'params': final_params, 'budget': args.opt_budget,
+        'sampling': args.sampling or 'stratified', 'seed': args.seed,
+        'sources': sim_sources(args, 'simulation.py', 'policy_simulation.py',
+                               'worker.py', 'policy_optimizer.py')
+    }
+
+    def compute():
+        _seed(args.seed, 'optimize')
+        res = optimize_policies(final_params, budget=args.opt_budget,
+                                executor=executor,
+                                sampling=args.sampling or 'stratified',
+                                seed=args.seed)
+        return {}, {'points': res['points'].to_dict(orient='list'),
+                    'simulations': res['simulations']}
+
+    import pandas as pd
+    arrays, meta = cached_stage(args.cache_dir, 'optimize', inputs, compute,
+                                force=args.force)
+    points = pd.DataFrame(meta['points'])
+    frontier = points[points['on_frontier']].sort_values('cost')
+    result = {'points': points, 'frontier': frontier.reset_index(drop=True)}
+
+    points.to_csv('Policy_Optimization_Points.csv', index=False)
+    result['frontier'].to_csv('Policy_Frontier.csv', index=False)
+    print(f"\nOptimized frontier: {len(frontier)} settings from "
+          f"{len(points)} evaluated ({meta['simulations']:,} simulations)")
+    print(result['frontier'].round(3).to_string(index=False))
+    print("✓ Saved: Policy_Frontier.csv, Policy_Optimization_Points.csv")
+    if args.headless:
+        use_headless_backend()
+    plot_policy_frontier(result, show=not args.headless)
+    return result
+
+
+def stage_tails(final_params, args, executor=None):
+
+    inputs = {
+        'params': final_params, 'n': args.tail_runs,
+        'thresholds': THRESHOLDS,
+        'scenarios': policy_scenarios(args.scenarios),
+        'seed': args.seed,
+        'sources': source_hash('simulation.py', 'policy_simulation.py',
+                               'worker.py', 'rare_events.py')
+    }
+
+    def compute():
+        _seed(args.seed, 'tails')
+        estimates = estimate_policy_tails(
+            final_params, n=args.tail_runs, executor=executor,
+            registry=args.scenarios)
+        return {}, {'estimates': estimates}
+
+    import pandas as pd
+    arrays, meta = cached_stage(args.cache_dir, 'tails', inputs, compute,
+                                force=args.force)
+    rows = [dict(scenario=name, threshold=int(t), **est)
+            for name, by_t in meta['estimates'].items()
+            for t, est in by_t.items()]
+    df = pd.DataFrame(rows)
+    print("\n" + df.round(4).to_string(index=False))
+    df.to_csv('Policy_Tail_Probabilities.csv', index=False)
+    print("✓ Saved: Policy_Tail_Probabilities.csv")
+    return meta['estimates']
+
+
+def stage_serve(final_params, surface, args, executor=None):
+
+    import asyncio
+
+    service = WhatIfService(final_params, executor=executor,
+                            surface=surface,
+                            store_dir=os.path.join(args.cache_dir, 'query'),
+                            n_runs=args.n_policy_sims,
+                            sampling=args.sampling, seed=args.seed)
+    try:
+        asyncio.run(serve(service, port=args.port))
+    except KeyboardInterrupt:
+        print(f"\nStopped; answered {service.counts}")
+
+
+def stage_region(final_params, args, executor=None):
+
+    specs = {name: (desc, policy)
+             for name, desc, policy in policy_scenarios(args.scenarios)}
+    names = args.region_scenarios.split(",")
+    region = dict(REGION_DEFAULTS, n_restaurants=args.region_size,
+                  days=args.season_days)
+
+    inputs = {
+        'params': final_params, 'region': region,
+        'scenarios': {name: specs[name][1] for name in names},
+        'seed': args.seed,
+        'sources': source_hash('simulation.py', 'policy_simulation.py',
+                               'regional.py')
+    }
+
+    def compute():
+        arrays, summaries = {}, {}
+        for name in names:
+            # Same seed per scenario: common supplier days and restaurants
+            _seed(args.seed, 'region')
+            out = simulate_region({**final_params, **specs[name][1]},
+                                  region, executor=executor)
+            arrays[f'{name}_daily'] = out['daily']
+            arrays[f'{name}_cases'] = out['restaurant_cases']
+            summaries[name] = summarize_region(out)
+        return arrays, {'summaries': summaries}
+
+    arrays, meta = cached_stage(args.cache_dir, 'region', inputs, compute,
+                                force=args.force)
+
+    print(f"\nRegion: {args.region_size:,} restaurants, "
+          f"{args.season_days} days")
+    for name, summary in meta['summaries'].items():
+        print(f"  {name}: {summary['total_cases']:,} cases, "
+              f"{summary['restaurants_with_outbreak']:,} restaurants "
+              f"with an outbreak, peak {summary['peak_active_restaurants']:,}"
+              f" with infectious staff")
+    return arrays, meta
+
+
+def stage_figures(sizes, calib, valid, policy, args):
+
+    sim_full = calib[0]['sim_full']
+    kfold_results = valid[1]['kfold_results']
+    hold_ratio = valid[1]['holdout_ratio']
+    scenarios = policy[0]
+    baseline = baseline_name(policy_scenarios(args.scenarios))
+
+    # Parameter ensemble: summarize uncertainty, then plot the pooled runs
+    if np.ndim(scenarios[baseline]) == 2:
+        ensemble_df = create_ensemble_summary(scenarios, baseline)
+        print("\n" + ensemble_df.to_string(index=False))
+        ensemble_df.to_csv('Ensemble_Policy_Summary.csv', index=False)
+        print("\n✓ Saved: Ensemble_Policy_Summary.csv")
+        scenarios = {name: np.asarray(data).ravel()
+                     for name, data in scenarios.items()}
+
+    # Calibration figures + metrics
+    if args.headless:
+        render_publication_plots(sizes, sim_full, kfold_results, hold_ratio,
+                                 force=args.force)
+    else:
+        create_publication_plots(sizes, sim_full, kfold_results, hold_ratio)
+    extra_validation_metrics(sizes, sim_full)
+
+    # Policy summary + figures
+    summary_df = create_summary_table(scenarios, baseline)
+    print("\n" + summary_df.to_string(index=False))
+    summary_df.to_csv('Comprehensive_Policy_Summary.csv', index=False)
+    print("\n✓ Saved: Comprehensive_Policy_Summary.csv")
+
+    if args.headless:
+        render_policy_figures(scenarios, summary_df, force=args.force)
+    else:
+        create_figure1_overview(scenarios, summary_df)
+        create_figure2_hygiene_comparison(scenarios)
+        create_figure3_policy_interactions(scenarios)
+        create_figure4_cost_effectiveness(scenarios)
+        create_figure5_distribution_comparisons(scenarios)
+
+    return summary_df
 
 
 # main
 
-def main():
+def parse_args(argv=None):
+
+    parser = argparse.ArgumentParser(
+        description="Norovirus calibration → policy analysis pipeline")
+    parser.add_argument("stage", nargs="?", default="all", choices=STAGES)
+    parser.add_argument("--data", default="NORS_JS1.csv")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--folds", type=int, default=5,
+                        help="k of the k-fold validation (all folds run "
+                             "together on the workers)")
+    parser.add_argument("--repeats", type=int, default=20,
+                        help="resample: repetitions of the k-fold split")
+    parser.add_argument("--bootstrap", type=int, default=500,
+                        help="resample: bootstrap samples")
+    parser.add_argument("--n-policy-sims", type=int, default=1500)
+    parser.add_argument("--tolerance", type=float, default=None,
+                        help="adaptive policy runs: stop each scenario once "
+                             "its mean-reduction 95%% CI is within ± this "
+                             "many percentage points")
+    parser.add_argument("--tail-tolerance", type=float, default=0.05,
+                        help="adaptive policy runs: relative 95%% CI "
+                             "half-width for the 95th percentile")
+    parser.add_argument("--max-runs", type=int, default=None,
+                        help="adaptive policy runs: cap per scenario "
+                             "(default 10 x --n-policy-sims)")
+    parser.add_argument("--scenarios", default=None,
+                        help="policy: scenario registry JSON "
+                             "(default src/scenarios.json)")
+    parser.add_argument("--ensemble", default=None, choices=["kfold"],
+                        help="policy: simulate every scenario for each "
+                             "k-fold parameter set and report between-"
+                             "parameter uncertainty")
+    parser.add_argument("--sampling", default=None,
+                        choices=["stratified", "antithetic",
+                                 "stratified-antithetic"],
+                        help="variance-reduced sampling of restaurant "
+                             "configurations (default: iid)")
+    parser.add_argument("--calibration", default="grid",
+                        choices=["grid", "design", "surrogate"],
+                        help="holdout/full calibration: full grid search, "
+                             "quasi-random design over a parameter space, "
+                             "or surrogate-assisted (GP + expected "
+                             "improvement)")
+    parser.add_argument("--param-space", default=None,
+                        help="design/surrogate calibration: JSON parameter "
+                             "space (ranges or priors per simulator kwarg)")
+    parser.add_argument("--design", default="sobol", choices=DESIGNS,
+                        help="design calibration: point set")
+    parser.add_argument("--budget", type=int, default=1024,
+                        help="design calibration: number of design points")
+    parser.add_argument("--extra-params", action="store_true",
+                        help="surrogate calibration: also calibrate "
+                             "latent_period, infectious_period and "
+                             "prob_symptomatic")
+    parser.add_argument("--sa-base", type=int, default=1024,
+                        help="sensitivity: Sobol base points (power of 2)")
+    parser.add_argument("--sa-reps", type=int, default=4,
+                        help="sensitivity: runs per design point")
+    parser.add_argument("--surface-runs", type=int, default=500,
+                        help="surface: runs per lattice node")
+    parser.add_argument("--port", type=int, default=PORT,
+                        help="serve: port of the what-if query service")
+    parser.add_argument("--opt-budget", type=int, default=72000,
+                        help="optimize: total simulations for the "
+                             "frontier search")
+    parser.add_argument("--tail-runs", type=int, default=20000,
+                        help="tails: importance-sampled runs per scenario")
+    parser.add_argument("--region-size", type=int, default=100000,
+                        help="region: number of restaurants")
+    parser.add_argument("--season-days", type=int, default=120,
+                        help="region: days simulated")
+    parser.add_argument("--region-scenarios",
+                        default="A_Baseline,D_Strict_Combined_60%",
+                        help="region: comma-separated scenario names")
+    parser.add_argument("--engine", default="python", choices=ENGINES,
+                        help="simulation engine: Python simulators or the "
+                             "compiled batch kernel (Numba if installed)")
+    parser.add_argument("--cache-dir", default="results_store")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="worker processes shared by all stages "
+                             "(1 = run inline)")
+    parser.add_argument("--queue-dir", default=None,
+                        help="run simulations as work units in this shared "
+                             "directory, served by --workers local "
+                             "processes and by `python3 work_queue.py "
+                             "DIR` on other nodes")
+    parser.add_argument("--queue-workers", type=int, default=None,
+                        help="total queue workers across nodes (sizes "
+                             "work units; default --workers)")
+    parser.add_argument("--force", action="store_true",
+                        help="re-run the requested stages even if cached")
+    parser.add_argument("--headless", action="store_true",
+                        help="render figures with Agg, never call plt.show()")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+
+    args = parse_args(argv)
+    if args.ensemble and args.tolerance is not None:
+        raise SystemExit("--ensemble runs a fixed number of simulations; "
+                         "drop --tolerance")
 
-    np.random.seed(30)
-    random.seed(30)
-    
     print("\n" + "="*70)
     print(" FULL EPIDEMIC PIPELINE: CALIBRATION → POLICY ANALYSIS ")
     print("="*70)
 
     # load outbreak data
-    print("\n[1] Loading NORS data...")
-    df = pd.read_csv("NORS_JS1.csv", header=None)
-    sizes = df[0].dropna().astype(int).values
+    print("\nLoading NORS data...")
+    sizes = load_sizes(args.data)
     print(f"Loaded {len(sizes)} outbreak sizes.")
 
-    # STEP 1 — K-FOLD VALIDATION
-    print("\n[2] Running Step 1: K-Fold Validation...")
-    kfold_results, kmean, kstd = step1_kfold_validation(sizes)
+    stage = args.stage
+    results = {}
 
-    # STEP 2 — HOLDOUT VALIDATION
-    print("\n[3] Running Step 2: Holdout Validation...")
-    hold_params, sim_train, train_vals, sim_test, test_vals, hold_ratio = \
-        step2_holdout_validation(sizes)
+    # One warm pool for every stage (started lazily, only if a stage runs),
+    # or a work queue shared with other nodes
+    set_engine(args.engine)
+    if args.queue_dir:
+        executor = WorkQueueExecutor(args.queue_dir, n_local=args.workers,
+                                     workers=args.queue_workers)
+    else:
+        executor = get_executor(args.workers)
 
-    # STEP 3 — FULL CALIBRATION
-    print("\n[4] Running Step 3: Full Calibration...")
-    final_params, sim_full = step3_full_calibration(sizes)
+    try:
+        if stage in ("validate", "figures", "all") or \
+                (stage == "policy" and args.ensemble == "kfold"):
+            results['validate'] = stage_validate(sizes, args, executor)
 
-    print("\nCalibrated parameters (from Step 3):")
-    for key, val in final_params.items():
-        print(f"  {key}: {val}")
+        if stage in ("calibrate", "policy", "figures", "all",
+                     "sensitivity", "surface", "region", "optimize",
+                     "serve", "tails"):
+            results['calibrate'] = stage_calibrate(sizes, args, executor)
 
+        if stage in ("policy", "figures", "all"):
+            final_params = results['calibrate'][1]['params']
+            ensemble = None
+            if args.ensemble == "kfold":
+                ensemble = [fold['params'] for fold in
+                            results['validate'][1]['kfold_results']]
+            results['policy'] = stage_policy(final_params, args, executor,
+                                             ensemble)
 
-    # PLOTTING CALIBRATION RESULTS
-    print("\n[5] Creating baseline publication plots...")
-    create_publication_plots(sizes, sim_full, kfold_results, hold_ratio)
-    extra_validation_metrics(sizes, sim_full)
-    print("✓ Calibration figures saved.")
+        if stage == "sensitivity":
+            final_params = results['calibrate'][1]['params']
+            results['sensitivity'] = stage_sensitivity(final_params, args,
+                                                       executor)
+
+        if stage in ("surface", "serve"):
+            final_params = results['calibrate'][1]['params']
+            results['surface'] = stage_surface(final_params, args, executor)
+
+        if stage == "serve":
+            stage_serve(final_params, results['surface'], args, executor)
+
+        if stage == "optimize":
+            final_params = results['calibrate'][1]['params']
+            results['optimize'] = stage_optimize(final_params, args,
+                                                 executor)
+
+        if stage == "tails":
+            final_params = results['calibrate'][1]['params']
+            results['tails'] = stage_tails(final_params, args, executor)
+
+        if stage == "resample":
+            results['resample'] = stage_resample(sizes, args, executor)
 
- 
-    # RUN POLICY ANALYSIS
-    print("\n[6] Running comprehensive policy analysis...")
-    scenarios, summary_df = run_complete_analysis(final_params, n_sims=1500)
+        if stage == "region":
+            final_params = results['calibrate'][1]['params']
+            results['region'] = stage_region(final_params, args, executor)
+    finally:
+        if args.queue_dir:
+            executor.shutdown()
+        shutdown_executor()
 
-    print("\nDONE. All calibration + policy results generated.")
+    if stage in ("figures", "all"):
+        stage_figures(sizes, results['calibrate'], results['validate'],
+                      results['policy'], args)
 
     print("\n" + "="*70)
-    print(" FULL PIPELINE COMPLETE ")
+    print(f" PIPELINE COMPLETE ({stage}) ")
     print("="*70)
 
+    return results
 
 
 # ENTRY POINT
@@ -1,9 +1,10 @@
 
 import numpy as np
-from scipy.stats import ks_2samp, wasserstein_distance
 
 def extra_validation_metrics(obs, sim):
 
+    from scipy.stats import ks_2samp, wasserstein_distance
+
     print("\n" + "="*70)
     print(" EXTRA VALIDATION METRICS")
     print("="*70)
@@ -0,0 +1,137 @@
+"""
+Parameter spaces and space-filling designs
+
+A parameter space maps simulator kwargs to a range or a prior:
+
+    space = {
+        'beta_handler_patron': (0.015, 0.035),              # uniform
+        'latent_period': {'dist': 'normal', 'mean': 1.0, 'sd': 0.3,
+                          'low': 0.25, 'high': 2.5},        # truncated
+        'beta_other_patron': {'dist': 'loguniform',
+                              'low': 1e-4, 'high': 1e-2},
+        'max_days': {'dist': 'uniform', 'low': 3, 'high': 7,
+                     'integer': True},
+    }
+
+Distributions: uniform, loguniform, normal (optionally truncated to
+low/high) and beta (on [low, high], default [0, 1]). Spaces can be
+loaded from JSON (load_space). sample_space() draws a fixed-size Sobol,
+Halton, Latin hypercube or plain random design on the unit cube and maps
+it through each marginal's inverse CDF, so the cost of exploring the
+space is set by the design size, not by the number of parameters.
+"""
+
+import json
+
+import numpy as np
+
+
+DESIGNS = ['sobol', 'halton', 'lhs', 'random']
+
+# Calibration grid parameters plus the other uncertain simulator inputs
+DEFAULT_SPACE = {
+    'beta_handler_patron': (0.015, 0.035),
+    'prob_food_contamination': (0.10, 0.22),
+    'contamination_size_mean': (35, 65),
+    'beta_staff_staff': (0.01, 0.2),
+    'contamination_size_std': (15, 45),
+    'beta_other_patron': {'dist': 'loguniform', 'low': 2e-4, 'high': 5e-3},
+    'latent_period': (0.5, 2.0),
+    'infectious_period': (1.5, 5.0),
+    'prob_symptomatic': (0.4, 0.9),
+}
+
+
+def normalize_space(space):
+    """Spec dict for every parameter ((low, high) -> uniform)."""
+
+    out = {}
+    for name, spec in space.items():
+        if isinstance(spec, dict):
+            spec = dict(spec)
+            spec.setdefault('dist', 'uniform')
+        else:
+            low, high = spec
+            spec = {'dist': 'uniform', 'low': low, 'high': high}
+        if spec['dist'] not in ('uniform', 'loguniform', 'normal', 'beta'):
+            raise ValueError(f"{name}: unknown distribution {spec['dist']!r}")
+        out[name] = spec
+    return out
+
+
+def load_space(path):
+    """Parameter space from a JSON file (lists are read as (low, high))."""
+    with open(path) as f:
+        return normalize_space(json.load(f))
+
+
+def unit_design(n, d, method='sobol'):
+    """n points on [0, 1)^d from a scrambled quasi-random design."""
+
+    from scipy.stats import qmc
+
+    seed = np.random.randint(0, 2**31 - 1)
+    if method == 'sobol':
+        m = int(np.ceil(np.log2(max(n, 2))))
+        return qmc.Sobol(d=d, scramble=True, seed=seed).random_base2(m)[:n]
+    if method == 'halton':
+        return qmc.Halton(d=d, scramble=True, seed=seed).random(n)
+    if method == 'lhs':
+        return qmc.LatinHypercube(d=d, seed=seed).random(n)
+    if method == 'random':
+        return np.random.random_sample((n, d))
+    raise ValueError(f"unknown design {method!r}; use one of {DESIGNS}")
+
+
+def _ppf(spec, u):
+
+    from scipy import stats
+
+    dist = spec['dist']
+    if dist == 'uniform':
+        x = spec['low'] + u * (spec['high'] - spec['low'])
+    elif dist == 'loguniform':
+        lo, hi = np.log(spec['low']), np.log(spec['high'])
+        x = np.exp(lo + u * (hi - lo))
+    elif dist == 'normal':
+        m, sd = spec['mean'], spec['sd']
+        a = (spec.get('low', -np.inf) - m) / sd
+        b = (spec.get('high', np.inf) - m) / sd
+        x = stats.truncnorm.ppf(u, a, b, loc=m, scale=sd)
+    else:
+        lo, hi = spec.get('low', 0.0), spec.get('high', 1.0)
+        x = lo + (hi - lo) * stats.beta.ppf(u, spec['a'], spec['b'])
+
+    if spec.get('integer'):
+        if dist == 'uniform':
+            # Each integer in [low, high] gets an equal share of the range
+            x = np.minimum(np.floor(
+                spec['low'] + u * (spec['high'] - spec['low'] + 1)),
+                spec['high'])
+        else:
+            x = np.round(x)
+    return x
+
+
+def to_values(space, U):
+    """Map unit-cube points U (n, d) to parameter values (n, d)."""
+    space = normalize_space(space)
+    return np.column_stack([_ppf(spec, U[:, i])
+                            for i, spec in enumerate(space.values())])
+
+
+def sample_space(space, n, method='sobol'):
+    """Design of n points over the space. Returns (names, X)."""
+    space = normalize_space(space)
+    U = unit_design(n, len(space), method)
+    return list(space), to_values(space, U)
+
+
+def to_params(space, x, fixed=None):
+    """Simulator kwargs for one design row (integers cast to int)."""
+
+    space = normalize_space(space)
+    params = dict(fixed or {})
+    for (name, spec), v in zip(space.items(), x):
+        params[name] = int(v) if spec.get('integer') else float(v)
+    return params
@@ -1,39 +1,52 @@
 
+import os
 import numpy as np
-import matplotlib.pyplot as plt
 
-def create_publication_plots(obs, sim, kfold_results, holdout_ratio):
+from rendering import render_figures
+from streaming import count_cdf, count_percentiles, count_values, size_summary
+
+def create_publication_plots(obs, sim, kfold_results, holdout_ratio,
+                             out_dir='.', show=True):
+    """obs / sim: raw size samples or size summaries
+    (streaming.size_summary); panels are drawn from the summaries."""
+
+    import matplotlib.pyplot as plt
+
+    obs = size_summary(obs)['counts']
+    sim = size_summary(sim)['counts']
 
     fig, axes = plt.subplots(2,2, figsize=(12,10))
     ax1, ax2, ax3, ax4 = axes.flatten()
 
     # A. Distribution comparison
-    ax1.hist(obs, bins=40, density=True, alpha=0.6, label="Observed (NORS)")
-    ax1.hist(sim, bins=40, density=True, alpha=0.6, label="Simulated (Model)")
+    for counts, label in [(obs, "Observed (NORS)"),
+                          (sim, "Simulated (Model)")]:
+        values, weights = count_values(counts)
+        ax1.hist(values, bins=40, weights=weights, density=True, alpha=0.6,
+                 label=label)
     ax1.set_title("A. Distribution Comparison")
     ax1.set_xlabel("Outbreak Size (cases)")
     ax1.set_ylabel("Probability Density")
     ax1.legend()
 
     # B. CDF
-    sorted_obs = np.sort(obs)
-    sorted_sim = np.sort(sim)
-    ax2.plot(sorted_obs, np.linspace(0,1,len(sorted_obs)), label="Observed")
-    ax2.plot(sorted_sim, np.linspace(0,1,len(sorted_sim)), linestyle="--", label="Simulated")
+    ax2.plot(*count_cdf(obs), drawstyle="steps-post", label="Observed")
+    ax2.plot(*count_cdf(sim), drawstyle="steps-post", linestyle="--",
+             label="Simulated")
     ax2.set_title("B. CDF")
     ax2.legend()
 
     # C. QQ plot
-    q_obs = np.percentile(obs, np.linspace(0,100,120))
-    q_sim = np.percentile(sim, np.linspace(0,100,120))
+    q_obs = count_percentiles(obs, np.linspace(0,100,120))
+    q_sim = count_percentiles(sim, np.linspace(0,100,120))
     ax3.scatter(q_obs, q_sim, alpha=0.6, color="purple")
     ax3.plot([0,max(q_obs)], [0,max(q_obs)], 'r--')
     ax3.set_title("C. QQ Plot")
 
     # D. Percentile comparison
     pct_list = [25,50,75,90,95,99]
-    obs_p = np.percentile(obs, pct_list)
-    sim_p = np.percentile(sim, pct_list)
+    obs_p = count_percentiles(obs, pct_list)
+    sim_p = count_percentiles(sim, pct_list)
     x = np.arange(len(pct_list))
     width = 0.35
 
@@ -45,11 +58,14 @@ def create_publication_plots(obs, sim, kfold_results, holdout_ratio):
     ax4.legend()
 
     plt.tight_layout()
-    fig.savefig("Calibration_Figure1_Distributions_CDF_QQ.png",
+    fig.savefig(os.path.join(out_dir, "Calibration_Figure1_Distributions_CDF_QQ.png"),
                 dpi=300, bbox_inches="tight")
-    fig.savefig("Calibration_Figure1_Distributions_CDF_QQ.pdf",
+    fig.savefig(os.path.join(out_dir, "Calibration_Figure1_Distributions_CDF_QQ.pdf"),
                 bbox_inches="tight")
-    plt.show()
+    if show:
+        plt.show()
+    else:
+        plt.close(fig)
 
     # K-fold ratios + holdout
     ratios = [r["ratio"] for r in kfold_results]
@@ -65,6 +81,27 @@ def create_publication_plots(obs, sim, kfold_results, holdout_ratio):
     axB.set_title("Validation Summary")
 
     plt.tight_layout()
-    fig.savefig("Calibration_Figure2_Validation.png", dpi=300, bbox_inches="tight")
-    fig.savefig("Calibration_Figure2_Validation.pdf", bbox_inches="tight")
-    plt.show()
+    fig.savefig(os.path.join(out_dir, "Calibration_Figure2_Validation.png"),
+                dpi=300, bbox_inches="tight")
+    fig.savefig(os.path.join(out_dir, "Calibration_Figure2_Validation.pdf"),
+                bbox_inches="tight")
+    if show:
+        plt.show()
+    else:
+        plt.close(fig)
+
+def render_publication_plots(obs, sim, kfold_results, holdout_ratio,
+                             out_dir='.', force=False):
+    """Headless version of create_publication_plots (skips if unchanged)."""
+
+    jobs = [{
+        'name': 'Calibration',
+        'func': create_publication_plots,
+        'args': (size_summary(obs), size_summary(sim), kfold_results,
+                 holdout_ratio),
+        'outputs': ["Calibration_Figure1_Distributions_CDF_QQ.png",
+                    "Calibration_Figure1_Distributions_CDF_QQ.pdf",
+                    "Calibration_Figure2_Validation.png",
+                    "Calibration_Figure2_Validation.pdf"]
+    }]
+    return render_figures(jobs, out_dir=out_dir, parallel=False, force=force)
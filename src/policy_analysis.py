@@ -1,102 +1,438 @@
 
+import os
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
-from tqdm import tqdm
-from matplotlib.gridspec import GridSpec
 
-from policy_simulation import simulate_outbreak_policy
+# pandas / matplotlib / tqdm are imported inside the functions that use
+# them, so simulation-only processes (workers) only pay for numpy.
+
+from worker import imap_into_buffer, result_buffer, release_buffer, task_seeds
+from rendering import render_figures
+from results_store import save_run, load_run
+from scenarios import load_scenarios, scenario_key, scenario_seed
+from streaming import (count_bxp, count_cdf, count_exceed, count_mean,
+                       count_percentiles, count_stats, count_std,
+                       count_values, size_summaries)
 
 
 # SCENARIO RUNNER
 
+SCENARIO_CHUNK = 250   # simulations per worker task
+BASELINE = 'A_Baseline'
+
+
+def policy_scenarios(path=None):
+    """The scenarios as (name, description, policy kwargs), in run order,
+    from the registry (scenarios.json unless path is given)."""
+    return [(spec['name'], spec['description'], spec['policy'])
+            for spec in load_scenarios(path)]
+
+
+def baseline_index(specs):
+    """Position of the reference scenario for reductions in specs:
+    A_Baseline, or else the first scenario without a policy."""
+
+    names = [name for name, _, _ in specs]
+    if BASELINE in names:
+        return names.index(BASELINE)
+    for i, (_, _, policy) in enumerate(specs):
+        if not policy:
+            return i
+    raise ValueError(f"no baseline scenario: add {BASELINE!r} (or a "
+                     f"scenario with an empty policy) to the registry")
+
+
+def baseline_name(specs):
+    """Name of the reference scenario in specs (see baseline_index)."""
+    return specs[baseline_index(specs)][0]
 
-def run_comprehensive_policy_analysis(calibrated_params, N_runs=1500):
+
+def run_comprehensive_policy_analysis(calibrated_params, N_runs=1500,
+                                      executor=None, tolerance=None,
+                                      tail_tolerance=0.05, max_runs=None,
+                                      sampling=None, specs=None,
+                                      store_dir=None, seed=None, force=False):
+    """
+    Simulate all scenarios (specs: (name, description, policy) tuples,
+    default policy_scenarios()).
+
+    Fixed mode (tolerance=None): N_runs simulations per scenario. With
+    store_dir, each scenario is stored under its own key (see
+    scenarios.py) with a seed derived from `seed` and that key, and
+    scenarios already in the store are reused (unless force=True)
+    instead of re-simulated.
+
+    Adaptive mode (tolerance set): scenarios are simulated in chunks of
+    SCENARIO_CHUNK and each one stops once the 95% Monte Carlo CI
+    half-width of its mean reduction is below `tolerance` (percentage
+    points) and that of its 95th percentile is below `tail_tolerance`
+    (relative), or at max_runs (default 10 * N_runs).
+
+    sampling: restaurant configuration scheme per chunk (None, 'stratified',
+    'antithetic', 'stratified-antithetic'; see worker.simulate_sizes).
+    """
+
+    from tqdm import tqdm
+
+    specs = policy_scenarios() if specs is None else specs
 
     print("=" * 70)
-    print("COMPREHENSIVE POLICY ANALYSIS - 16 SCENARIOS")
+    print(f"COMPREHENSIVE POLICY ANALYSIS - {len(specs)} SCENARIOS")
     print("=" * 70)
-    print(f"\nSimulations per scenario: {N_runs}")
+    if tolerance is None:
+        print(f"\nSimulations per scenario: {N_runs}")
+    else:
+        max_runs = max_runs or 10 * N_runs
+        print(f"\nAdaptive: mean reduction ±{tolerance} pp, "
+              f"95th pct ±{tail_tolerance:.0%}, max {max_runs} runs")
     print(f"\nCalibrated parameters:")
     for k, v in calibrated_params.items():
         print(f"  {k}: {v}")
     print()
 
+    if tolerance is not None:
+        scenarios = _run_adaptive(specs, calibrated_params, executor,
+                                  tolerance, tail_tolerance, max_runs,
+                                  sampling)
+        print("\n✓ All scenarios completed!")
+        return scenarios
+
+    if store_dir is not None:
+        scenarios = _run_incremental(specs, calibrated_params, N_runs,
+                                     executor, sampling, store_dir, seed,
+                                     force)
+        print("\n✓ All scenarios completed!")
+        return scenarios
+
+    # Split every scenario into fixed-size chunks so all 16 keep the
+    # (warm) workers busy; seeds are per chunk, independent of worker count.
+    # Workers write into row i of a shared (scenarios, N_runs) buffer.
+    tasks = []
+    for i, (name, _, policy) in enumerate(specs):
+        params = dict(calibrated_params, **policy)
+        for start in range(0, N_runs, SCENARIO_CHUNK):
+            tasks.append((i, start, 'policy', params,
+                          min(SCENARIO_CHUNK, N_runs - start)))
+    tasks = [t + (task_seed, sampling)
+             for t, task_seed in zip(tasks, task_seeds(len(tasks)))]
+
+    spec, buf = result_buffer((len(specs), N_runs), executor)
+    for _ in tqdm(imap_into_buffer(tasks, spec, buf, executor),
+                  total=len(tasks), desc="Scenarios", leave=False):
+        pass
+
+    # One copy out of shared memory; scenarios are row views of it
+    results = np.array(buf)
+    del buf
+    release_buffer(spec)
+
     scenarios = {}
-    compliances = [0.3, 0.6, 1.0]
-    hygiene_levels = {
-        'Moderate': 0.7,
-        'Strict': 0.4
-    }
+    for i, (name, desc, _) in enumerate(specs):
+        print(f"Ran {desc}")
+        scenarios[name] = results[i]
 
-    # SCENARIO A: Baseline
-    print("Running A: Baseline (no intervention)...")
-    scenarios["A_Baseline"] = np.array([
-        simulate_outbreak_policy(**calibrated_params)
-        for _ in tqdm(range(N_runs), desc="Baseline", leave=False)
-    ])
+    print("\n✓ All scenarios completed!")
+    return scenarios
 
-    # SCENARIO B: Exclusion only
-    for c in compliances:
-        c_pct = int(c * 100)
-        print(f"Running B: Exclusion {c_pct}% compliance...")
-        scenarios[f"B_Exclusion_{c_pct}%"] = np.array([
-            simulate_outbreak_policy(
-                **calibrated_params,
-                policy_exclusion=True,
-                compliance=c
-            ) for _ in tqdm(range(N_runs), desc=f"Exclusion {c_pct}%", leave=False)
-        ])
-
-    # SCENARIO C: Hygiene only (Moderate + Strict)
-    for hygiene_name, beta_mult in hygiene_levels.items():
-        for c in compliances:
-            c_pct = int(c * 100)
-            print(f"Running C: {hygiene_name} Hygiene {c_pct}% compliance...")
-            scenarios[f"C_{hygiene_name}_{c_pct}%"] = np.array([
-                simulate_outbreak_policy(
-                    **calibrated_params,
-                    policy_hygiene=True,
-                    compliance=c,
-                    beta_mult=beta_mult
-                ) for _ in tqdm(range(N_runs), desc=f"{hygiene_name} {c_pct}%", leave=False)
-            ])
-
-    # SCENARIO D: Combined (Moderate + Strict)
-    for hygiene_name, beta_mult in hygiene_levels.items():
-        for c in compliances:
-            c_pct = int(c * 100)
-            print(f"Running D: {hygiene_name} + Exclusion {c_pct}% compliance...")
-            scenarios[f"D_{hygiene_name}_Combined_{c_pct}%"] = np.array([
-                simulate_outbreak_policy(
-                    **calibrated_params,
-                    policy_exclusion=True,
-                    policy_hygiene=True,
-                    compliance=c,
-                    beta_mult=beta_mult
-                ) for _ in tqdm(range(N_runs), desc=f"{hygiene_name}+Excl {c_pct}%", leave=False)
-            ])
 
-    print("\n✓ All scenarios completed!")
+def _run_incremental(specs, calibrated_params, N_runs, executor, sampling,
+                     store_dir, seed, force=False):
+
+    from pipeline import source_hash
+    from worker import get_engine
+
+    modules = ['simulation.py', 'policy_simulation.py', 'worker.py']
+    if get_engine() == 'kernel':
+        modules.append('kernel.py')
+    sources = source_hash(*modules)
+    if seed is None:
+        seed = np.random.randint(0, 2**31 - 1)
+
+    scenarios, todo = {}, []
+    for name, desc, policy in specs:
+        key = scenario_key(policy, calibrated_params, N_runs, sampling,
+                           seed, SCENARIO_CHUNK, sources)
+        run_dir = os.path.join(store_dir, key)
+        if not force and os.path.exists(os.path.join(run_dir,
+                                                     "metadata.json")):
+            scenarios[name] = load_run(run_dir)[0]['sizes']
+            print(f"Reused {desc} ({key})")
+        else:
+            todo.append((name, desc, policy, key))
+
+    if todo:
+        # Chunk seeds come from each scenario's own seed, so results do
+        # not depend on which other scenarios are (re)run
+        starts = list(range(0, N_runs, SCENARIO_CHUNK))
+        tasks = []
+        for i, (_, _, policy, key) in enumerate(todo):
+            params = dict(calibrated_params, **policy)
+            chunk_seeds = np.random.SeedSequence(
+                scenario_seed(seed, key)).spawn(len(starts))
+            for start, ss in zip(starts, chunk_seeds):
+                tasks.append((i, start, 'policy', params,
+                              min(SCENARIO_CHUNK, N_runs - start),
+                              int(ss.generate_state(1)[0]), sampling))
+
+        spec, buf = result_buffer((len(todo), N_runs), executor)
+        for _ in imap_into_buffer(tasks, spec, buf, executor):
+            pass
+
+        for i, (name, desc, policy, key) in enumerate(todo):
+            save_run(os.path.join(store_dir, key), {'sizes': buf[i]},
+                     {'kind': 'policy_scenario', 'scenario': name,
+                      'description': desc, 'policy': policy,
+                      'params': calibrated_params, 'n_runs': N_runs,
+                      'sampling': sampling, 'seed': seed, 'key': key})
+            scenarios[name] = np.array(buf[i])
+            print(f"Ran {desc} ({key})")
+
+        del buf
+        release_buffer(spec)
+
+    return {name: scenarios[name] for name, _, _ in specs}
+
+
+# SEQUENTIAL STOPPING
+
+def mc_halfwidths(data, baseline_mean, z=1.96, q=0.95):
+    """
+    95% Monte Carlo CI half-widths from one scenario's own sample:
+    its contribution to the mean-reduction CI (percentage points) and
+    its q-th percentile (relative, order-statistic interval).
+
+    The reduction CI combines this term for the scenario and for the
+    baseline (delta method), so stopping both at tolerance / sqrt(2)
+    bounds the full CI by the tolerance.
+    """
+
+    n = len(data)
+    red_hw = z * 100 * np.std(data, ddof=1) / np.sqrt(n) / baseline_mean
+
+    k = z * np.sqrt(n * q * (1 - q))
+    lo = int(np.clip(np.floor(n * q - k), 0, n - 1))
+    hi = int(np.clip(np.ceil(n * q + k), 0, n - 1))
+    part = np.partition(data, [lo, hi])
+    tail_hw = (part[hi] - part[lo]) / 2 / max(np.percentile(data, q * 100), 1)
+
+    return red_hw, tail_hw
+
+
+def _run_adaptive(specs, calibrated_params, executor, tolerance,
+                  tail_tolerance, max_runs, sampling=None):
+
+    n_scen = len(specs)
+    base = baseline_index(specs)
+    params = [dict(calibrated_params, **policy) for _, _, policy in specs]
+    base_seed = np.random.randint(0, 2**31 - 1)
+
+    spec, buf = result_buffer((n_scen, max_runs), executor)
+    counts = np.zeros(n_scen, dtype=int)
+    active = list(range(n_scen))
+    rnd = 0
+
+    while active:
+
+        # One chunk for every scenario that is not yet precise enough
+        tasks = []
+        for i in active:
+            n = min(SCENARIO_CHUNK, max_runs - counts[i])
+            seed = int(np.random.SeedSequence([base_seed, i, rnd])
+                       .generate_state(1)[0])
+            tasks.append((i, counts[i], 'policy', params[i], n, seed,
+                          sampling))
+        for _ in imap_into_buffer(tasks, spec, buf, executor):
+            pass
+        for i, start, _, _, n, _, _ in tasks:
+            counts[i] = start + n
+        rnd += 1
+
+        # Re-check precision of every scenario against the baseline
+        baseline_mean = np.mean(buf[base, :counts[base]])
+        still = []
+        for i in range(n_scen):
+            red_hw, tail_hw = mc_halfwidths(buf[i, :counts[i]], baseline_mean)
+            precise = (red_hw <= tolerance / np.sqrt(2) and
+                       tail_hw <= tail_tolerance)
+            if not precise and counts[i] < max_runs:
+                still.append(i)
+        active = still
+
+        print(f"  round {rnd}: {len(active)} scenarios still imprecise, "
+              f"{counts.sum()} runs so far")
+
+    scenarios = {}
+    for i, (name, desc, _) in enumerate(specs):
+        scenarios[name] = np.array(buf[i, :counts[i]])
+        print(f"Ran {desc}: {counts[i]} runs")
+
+    del buf
+    release_buffer(spec)
     return scenarios
 
 
-# SUMMARY TABLE
+# PARAMETER ENSEMBLES
 
-def create_summary_table(scenarios):
+def ensemble_runs(N_runs, n_members):
+    """Runs per member: N_runs / sqrt(members), rounded up to whole chunks,
+    so total cost grows like sqrt(members)."""
+    n = int(np.ceil(N_runs / np.sqrt(n_members)))
+    return int(np.ceil(n / SCENARIO_CHUNK) * SCENARIO_CHUNK)
 
-    baseline = scenarios["A_Baseline"]
-    baseline_mean = np.mean(baseline)
-    baseline_median = np.median(baseline)
+
+def run_ensemble_policy_analysis(param_sets, N_runs=1500, runs_per_member=None,
+                                 executor=None, sampling=None, specs=None):
+    """
+    Simulate all scenarios for every member of a parameter ensemble
+    (e.g. the k-fold parameter sets) in one batched job.
+
+    Chunk j of every (member, scenario) pair reuses the same seed, so all
+    members and scenarios see the same restaurant configurations (common
+    random numbers): differences between members reflect the parameters,
+    not sampling noise.
+
+    Returns {scenario: (members, runs_per_member) array}; pass it to
+    create_ensemble_summary, or ravel() each entry for the pooled
+    (posterior predictive) distribution.
+    """
+
+    from tqdm import tqdm
+
+    members = len(param_sets)
+    n = runs_per_member or ensemble_runs(N_runs, members)
+    specs = policy_scenarios() if specs is None else specs
+
+    print("=" * 70)
+    print(f"ENSEMBLE POLICY ANALYSIS - {len(specs)} SCENARIOS "
+          f"x {members} PARAMETER SETS")
+    print("=" * 70)
+    print(f"\nSimulations per scenario and member: {n} "
+          f"({members * n} per scenario)\n")
+
+    starts = list(range(0, n, SCENARIO_CHUNK))
+    chunk_seeds = task_seeds(len(starts))
+
+    # Row s * members + m of the buffer holds scenario s under member m
+    tasks = []
+    for s, (_, _, policy) in enumerate(specs):
+        for m, member in enumerate(param_sets):
+            params = dict(member, **policy)
+            for start, seed in zip(starts, chunk_seeds):
+                tasks.append((s * members + m, start, 'policy', params,
+                              min(SCENARIO_CHUNK, n - start), seed, sampling))
+
+    spec, buf = result_buffer((len(specs) * members, n), executor)
+    for _ in tqdm(imap_into_buffer(tasks, spec, buf, executor),
+                  total=len(tasks), desc="Ensemble", leave=False):
+        pass
+
+    results = np.array(buf).reshape(len(specs), members, n)
+    del buf
+    release_buffer(spec)
+
+    print("\n✓ All scenarios completed!")
+    return {name: results[s] for s, (name, _, _) in enumerate(specs)}
+
+
+def _ensemble_components(estimates, noise):
+    """
+    Parameter SD and Monte Carlo SE for per-member estimates (members,)
+    whose per-run noise terms (members, runs) are paired by run index
+    (shared seeds). The Monte Carlo part of the between-member variance
+    is the member x run interaction (two-way ANOVA without replication).
+    """
+
+    members, n = noise.shape
+    mc_se = float(np.sqrt(np.var(noise.mean(axis=0), ddof=1) / n))
+    if members < 2:
+        return np.nan, mc_se
+
+    interaction = noise - noise.mean(axis=0)
+    ms_int = np.sum(interaction**2) / ((members - 1) * (n - 1))
+    param_var = np.var(estimates, ddof=1) - ms_int / n
+    return float(np.sqrt(max(param_var, 0))), mc_se
+
+
+def create_ensemble_summary(ensemble, baseline=BASELINE):
+    """
+    Per-scenario summary across ensemble members, separating parameter
+    uncertainty (between-member SD, Monte Carlo part removed) from the
+    Monte Carlo error of the ensemble average.
+
+    Reductions are computed per member against that member's baseline;
+    their noise terms come from the delta method on paired runs.
+    """
+
+    import pandas as pd
+
+    base = np.asarray(ensemble[baseline], dtype=float)
+    members, n = base.shape
+    base_mean = base.mean(axis=1)
 
     rows = []
+    for name, data in ensemble.items():
+        data = np.asarray(data, dtype=float)
+
+        means = data.mean(axis=1)
+        mean_sd, mean_se = _ensemble_components(
+            means, data - means[:, None])
+
+        ratio = means / base_mean
+        red = 100 * (1 - ratio)
+        red_sd, red_se = _ensemble_components(
+            red, -100 * (data - ratio[:, None] * base) / base_mean[:, None])
+
+        rows.append({
+            'Scenario': name,
+            'Members': members,
+            'Runs_per_member': n,
+            'Mean': f"{means.mean():.1f}",
+            'Mean_Param_SD': f"{mean_sd:.2f}",
+            'Mean_MC_SE': f"{mean_se:.2f}",
+            'Mean_Reduction_%': f"{red.mean():.1f}",
+            'Reduction_Param_SD': f"{red_sd:.2f}",
+            'Reduction_MC_SE': f"{red_se:.2f}",
+            'Reduction_Min': f"{red.min():.1f}",
+            'Reduction_Max': f"{red.max():.1f}",
+        })
+
+    return pd.DataFrame(rows)
+
+
+# SUMMARY TABLE
+
+def create_summary_table(scenarios, baseline=BASELINE):
+
+    stats = {}
     for name, data in scenarios.items():
-        mean_val = np.mean(data)
-        median_val = np.median(data)
-        std_val = np.std(data)
-        p25 = np.percentile(data, 25)
-        p75 = np.percentile(data, 75)
-        p95 = np.percentile(data, 95)
+        if isinstance(data, dict):
+            stats[name] = count_stats(data['counts'])
+            continue
+        p25, median, p75, p95 = np.percentile(data, [25, 50, 75, 95])
+        stats[name] = {'runs': len(data), 'mean': np.mean(data),
+                       'median': median, 'std': np.std(data),
+                       'p25': p25, 'p75': p75, 'p95': p95}
+    return _summary_from_stats(stats, baseline)
+
+
+def create_summary_table_from_counts(counts, baseline=BASELINE):
+    """Summary table from streamed size histograms (name -> counts)."""
+    return _summary_from_stats({name: count_stats(c)
+                                for name, c in counts.items()}, baseline)
+
+
+def _summary_from_stats(stats, baseline=BASELINE):
+
+    import pandas as pd
+
+    baseline_mean = stats[baseline]['mean']
+    baseline_median = stats[baseline]['median']
+
+    rows = []
+    for name, s in stats.items():
+        mean_val = s['mean']
+        median_val = s['median']
+        std_val = s['std']
+        p25, p75, p95 = s['p25'], s['p75'], s['p95']
 
         mean_reduction = (baseline_mean - mean_val) / baseline_mean * 100
         median_reduction = (baseline_median - median_val) / baseline_median * 100
@@ -104,6 +440,7 @@ def create_summary_table(scenarios):
 
         rows.append({
             'Scenario': name,
+            'Runs': s['runs'],
             'Mean': f"{mean_val:.1f}",
             'Median': f"{median_val:.1f}",
             'Std': f"{std_val:.1f}",
@@ -117,14 +454,32 @@ def create_summary_table(scenarios):
 
     return pd.DataFrame(rows)
 
+# FIGURES
+#
+# The figures take {name: sizes} with raw samples or size summaries
+# (streaming.size_summary). Everything is drawn from the summaries, so
+# figure cost does not grow with the number of simulated outbreaks.
+
+def _summaries(scenarios):
+    """Size summaries and mean outbreak size of every scenario."""
+    summaries = size_summaries(scenarios)
+    return summaries, {name: count_mean(s['counts'])
+                       for name, s in summaries.items()}
+
+
 # FIGURE 1
 
-def create_figure1_overview(scenarios, summary_df):
+def create_figure1_overview(scenarios, summary_df, out_dir='.', show=True):
     """
     FIGURE 1: Policy Overview
     4-panel figure showing distributions and main effects
     """
 
+    import matplotlib.pyplot as plt
+
+    scenarios, means = _summaries(scenarios)
+    from matplotlib.gridspec import GridSpec
+
     fig = plt.figure(figsize=(16, 10))
     gs = GridSpec(2, 2, figure=fig, hspace=0.3, wspace=0.3)
 
@@ -139,21 +494,17 @@ def create_figure1_overview(scenarios, summary_df):
     # Panel A: Baseline vs Best of Each Policy Type
     ax1 = fig.add_subplot(gs[0, 0])
 
-    data_to_plot = [
-        scenarios['A_Baseline'],
-        scenarios['B_Exclusion_100%'],
-        scenarios['C_Moderate_100%'],
-        scenarios['C_Strict_100%'],
-        scenarios['D_Moderate_Combined_100%'],
-        scenarios['D_Strict_Combined_100%']
-    ]
+    keys = ['A_Baseline', 'B_Exclusion_100%', 'C_Moderate_100%',
+            'C_Strict_100%', 'D_Moderate_Combined_100%',
+            'D_Strict_Combined_100%']
     labels = ['Baseline', 'Exclusion\n(100%)', 'Moderate\nHygiene',
               'Strict\nHygiene', 'Moderate\nCombined', 'Strict\nCombined']
     colors = [color_baseline, color_exclusion, color_moderate,
               color_strict, color_combined_mod, color_combined_strict]
 
-    bp = ax1.boxplot(data_to_plot, labels=labels, patch_artist=True,
-                     showfliers=False, widths=0.6)
+    # Box statistics from the size histograms (bxp, not boxplot)
+    bp = ax1.bxp([count_bxp(scenarios[k]['counts']) for k in keys],
+                 patch_artist=True, showfliers=False, widths=0.6)
 
     for patch, color in zip(bp['boxes'], colors):
         patch.set_facecolor(color)
@@ -176,42 +527,42 @@ def create_figure1_overview(scenarios, summary_df):
 
     # Exclusion
     excl_means = [
-        np.mean(scenarios['A_Baseline']),
-        np.mean(scenarios['B_Exclusion_30%']),
-        np.mean(scenarios['B_Exclusion_60%']),
-        np.mean(scenarios['B_Exclusion_100%'])
+        means['A_Baseline'],
+        means['B_Exclusion_30%'],
+        means['B_Exclusion_60%'],
+        means['B_Exclusion_100%']
     ]
 
     # Moderate hygiene
     mod_means = [
-        np.mean(scenarios['A_Baseline']),
-        np.mean(scenarios['C_Moderate_30%']),
-        np.mean(scenarios['C_Moderate_60%']),
-        np.mean(scenarios['C_Moderate_100%'])
+        means['A_Baseline'],
+        means['C_Moderate_30%'],
+        means['C_Moderate_60%'],
+        means['C_Moderate_100%']
     ]
 
     # Strict hygiene
     strict_means = [
-        np.mean(scenarios['A_Baseline']),
-        np.mean(scenarios['C_Strict_30%']),
-        np.mean(scenarios['C_Strict_60%']),
-        np.mean(scenarios['C_Strict_100%'])
+        means['A_Baseline'],
+        means['C_Strict_30%'],
+        means['C_Strict_60%'],
+        means['C_Strict_100%']
     ]
 
     # Combined moderate
     comb_mod_means = [
-        np.mean(scenarios['A_Baseline']),
-        np.mean(scenarios['D_Moderate_Combined_30%']),
-        np.mean(scenarios['D_Moderate_Combined_60%']),
-        np.mean(scenarios['D_Moderate_Combined_100%'])
+        means['A_Baseline'],
+        means['D_Moderate_Combined_30%'],
+        means['D_Moderate_Combined_60%'],
+        means['D_Moderate_Combined_100%']
     ]
 
     # Combined strict
     comb_strict_means = [
-        np.mean(scenarios['A_Baseline']),
-        np.mean(scenarios['D_Strict_Combined_30%']),
-        np.mean(scenarios['D_Strict_Combined_60%']),
-        np.mean(scenarios['D_Strict_Combined_100%'])
+        means['A_Baseline'],
+        means['D_Strict_Combined_30%'],
+        means['D_Strict_Combined_60%'],
+        means['D_Strict_Combined_100%']
     ]
 
     ax2.plot(compliances, excl_means, marker='o', linewidth=3, markersize=10,
@@ -236,7 +587,7 @@ def create_figure1_overview(scenarios, summary_df):
     # Panel C: Percent Reduction Heatmap
     ax3 = fig.add_subplot(gs[1, 0])
 
-    baseline_mean = np.mean(scenarios['A_Baseline'])
+    baseline_mean = means['A_Baseline']
 
     # Create reduction matrix
     policies = ['Exclusion', 'Moderate\nHygiene', 'Strict\nHygiene',
@@ -250,7 +601,7 @@ def create_figure1_overview(scenarios, summary_df):
         row = []
         for comp in comp_levels:
             key = f"{policy_type}_{comp}"
-            mean_val = np.mean(scenarios[key])
+            mean_val = means[key]
             reduction = (baseline_mean - mean_val) / baseline_mean * 100
             row.append(reduction)
         reduction_matrix.append(row)
@@ -289,31 +640,31 @@ def create_figure1_overview(scenarios, summary_df):
 
     for comp in comp_levels:
         # Exclusion
-        cases = baseline_mean - np.mean(scenarios[f'B_Exclusion_{comp}'])
+        cases = baseline_mean - means[f'B_Exclusion_{comp}']
         cases_averted_data.append(cases)
         policy_labels.append(f'Excl\n{comp}')
         policy_colors.append(color_exclusion)
 
         # Moderate
-        cases = baseline_mean - np.mean(scenarios[f'C_Moderate_{comp}'])
+        cases = baseline_mean - means[f'C_Moderate_{comp}']
         cases_averted_data.append(cases)
         policy_labels.append(f'Mod\n{comp}')
         policy_colors.append(color_moderate)
 
         # Strict
-        cases = baseline_mean - np.mean(scenarios[f'C_Strict_{comp}'])
+        cases = baseline_mean - means[f'C_Strict_{comp}']
         cases_averted_data.append(cases)
         policy_labels.append(f'Strict\n{comp}')
         policy_colors.append(color_strict)
 
         # Mod Combined
-        cases = baseline_mean - np.mean(scenarios[f'D_Moderate_Combined_{comp}'])
+        cases = baseline_mean - means[f'D_Moderate_Combined_{comp}']
         cases_averted_data.append(cases)
         policy_labels.append(f'M+E\n{comp}')
         policy_colors.append(color_combined_mod)
 
         # Strict Combined
-        cases = baseline_mean - np.mean(scenarios[f'D_Strict_Combined_{comp}'])
+        cases = baseline_mean - means[f'D_Strict_Combined_{comp}']
         cases_averted_data.append(cases)
         policy_labels.append(f'S+E\n{comp}')
         policy_colors.append(color_combined_strict)
@@ -330,24 +681,33 @@ def create_figure1_overview(scenarios, summary_df):
     ax4.grid(axis='y', alpha=0.3, linestyle='--')
     ax4.axhline(y=0, color='black', linestyle='-', linewidth=0.8)
 
-    plt.savefig('Figure1_Policy_Overview.png', dpi=300, bbox_inches='tight')
-    plt.savefig('Figure1_Policy_Overview.pdf', bbox_inches='tight')
-    plt.show()
+    plt.savefig(os.path.join(out_dir, 'Figure1_Policy_Overview.png'),
+                dpi=300, bbox_inches='tight')
+    plt.savefig(os.path.join(out_dir, 'Figure1_Policy_Overview.pdf'),
+                bbox_inches='tight')
+    if show:
+        plt.show()
+    else:
+        plt.close(fig)
 
     print("✓ Saved: Figure1_Policy_Overview.png/pdf")
 
 
 # FIGURE 2
 
-def create_figure2_hygiene_comparison(scenarios):
+def create_figure2_hygiene_comparison(scenarios, out_dir='.', show=True):
     """
     FIGURE 2: Moderate vs Strict Hygiene Comparison
     Shows whether intensity or compliance matters more
     """
 
+    import matplotlib.pyplot as plt
+
+    scenarios, means = _summaries(scenarios)
+
     fig, axes = plt.subplots(1, 3, figsize=(18, 6))
 
-    baseline_mean = np.mean(scenarios['A_Baseline'])
+    baseline_mean = means['A_Baseline']
     compliances = [30, 60, 100]
 
     # Panel A: Outbreak size by hygiene intensity
@@ -356,11 +716,11 @@ def create_figure2_hygiene_comparison(scenarios):
     x = np.arange(len(compliances))
     width = 0.35
 
-    moderate_means = [np.mean(scenarios[f'C_Moderate_{c}%']) for c in compliances]
-    strict_means = [np.mean(scenarios[f'C_Strict_{c}%']) for c in compliances]
+    moderate_means = [means[f'C_Moderate_{c}%'] for c in compliances]
+    strict_means = [means[f'C_Strict_{c}%'] for c in compliances]
 
-    moderate_std = [np.std(scenarios[f'C_Moderate_{c}%']) for c in compliances]
-    strict_std = [np.std(scenarios[f'C_Strict_{c}%']) for c in compliances]
+    moderate_std = [count_std(scenarios[f'C_Moderate_{c}%']['counts']) for c in compliances]
+    strict_std = [count_std(scenarios[f'C_Strict_{c}%']['counts']) for c in compliances]
 
     bars1 = ax1.bar(
         x - width/2, moderate_means, width,
@@ -449,24 +809,33 @@ def create_figure2_hygiene_comparison(scenarios):
         )
 
     plt.tight_layout()
-    plt.savefig('Figure2_Hygiene_Comparison.png', dpi=300, bbox_inches='tight')
-    plt.savefig('Figure2_Hygiene_Comparison.pdf', bbox_inches='tight')
-    plt.show()
+    plt.savefig(os.path.join(out_dir, 'Figure2_Hygiene_Comparison.png'),
+                dpi=300, bbox_inches='tight')
+    plt.savefig(os.path.join(out_dir, 'Figure2_Hygiene_Comparison.pdf'),
+                bbox_inches='tight')
+    if show:
+        plt.show()
+    else:
+        plt.close(fig)
 
     print("✓ Saved: Figure2_Hygiene_Comparison.png/pdf")
 
 
 # FIGURE 3
 
-def create_figure3_policy_interactions(scenarios):
+def create_figure3_policy_interactions(scenarios, out_dir='.', show=True):
     """
     FIGURE 3: Policy Interactions and Synergy
     Shows whether combined policies are additive, synergistic, or antagonistic
     """
 
+    import matplotlib.pyplot as plt
+
+    scenarios, means = _summaries(scenarios)
+
     fig, axes = plt.subplots(1, 2, figsize=(16, 6))
 
-    baseline_mean = np.mean(scenarios['A_Baseline'])
+    baseline_mean = means['A_Baseline']
     compliances = [30, 60, 100]
 
     # Panel A: Moderate hygiene interactions
@@ -475,9 +844,9 @@ def create_figure3_policy_interactions(scenarios):
     x = np.arange(len(compliances))
     width = 0.25
 
-    excl_only = [np.mean(scenarios[f'B_Exclusion_{c}%']) for c in compliances]
-    mod_only = [np.mean(scenarios[f'C_Moderate_{c}%']) for c in compliances]
-    mod_combined = [np.mean(scenarios[f'D_Moderate_Combined_{c}%']) for c in compliances]
+    excl_only = [means[f'B_Exclusion_{c}%'] for c in compliances]
+    mod_only = [means[f'C_Moderate_{c}%'] for c in compliances]
+    mod_combined = [means[f'D_Moderate_Combined_{c}%'] for c in compliances]
 
     # Expected additive effect
     expected_additive = []
@@ -514,9 +883,9 @@ def create_figure3_policy_interactions(scenarios):
 
     for c in compliances:
         # Moderate
-        excl = np.mean(scenarios[f'B_Exclusion_{c}%'])
-        mod = np.mean(scenarios[f'C_Moderate_{c}%'])
-        mod_comb = np.mean(scenarios[f'D_Moderate_Combined_{c}%'])
+        excl = means[f'B_Exclusion_{c}%']
+        mod = means[f'C_Moderate_{c}%']
+        mod_comb = means[f'D_Moderate_Combined_{c}%']
 
         excl_effect = baseline_mean - excl
         mod_effect = baseline_mean - mod
@@ -526,8 +895,8 @@ def create_figure3_policy_interactions(scenarios):
         mod_synergy.append(synergy)
 
         # Strict
-        strict = np.mean(scenarios[f'C_Strict_{c}%'])
-        strict_comb = np.mean(scenarios[f'D_Strict_Combined_{c}%'])
+        strict = means[f'C_Strict_{c}%']
+        strict_comb = means[f'D_Strict_Combined_{c}%']
 
         strict_effect = baseline_mean - strict
         expected_additive_strict = baseline_mean - (excl_effect + strict_effect)
@@ -566,24 +935,33 @@ def create_figure3_policy_interactions(scenarios):
                      fontweight='bold', fontsize=10)
 
     plt.tight_layout()
-    plt.savefig('Figure3_Policy_Interactions.png', dpi=300, bbox_inches='tight')
-    plt.savefig('Figure3_Policy_Interactions.pdf', bbox_inches='tight')
-    plt.show()
+    plt.savefig(os.path.join(out_dir, 'Figure3_Policy_Interactions.png'),
+                dpi=300, bbox_inches='tight')
+    plt.savefig(os.path.join(out_dir, 'Figure3_Policy_Interactions.pdf'),
+                bbox_inches='tight')
+    if show:
+        plt.show()
+    else:
+        plt.close(fig)
 
     print("✓ Saved: Figure3_Policy_Interactions.png/pdf")
 
 
 # FIGURE 4
 
-def create_figure4_cost_effectiveness(scenarios):
+def create_figure4_cost_effectiveness(scenarios, out_dir='.', show=True):
     """
     FIGURE 4: Policy Efficiency Analysis
     Shows cost-effectiveness and optimal strategies
     """
 
+    import matplotlib.pyplot as plt
+
+    scenarios, means = _summaries(scenarios)
+
     fig, axes = plt.subplots(1, 2, figsize=(16, 6))
 
-    baseline_mean = np.mean(scenarios['A_Baseline'])
+    baseline_mean = means['A_Baseline']
     compliances = [30, 60, 100]
 
     # Panel A: Efficiency frontier (reduction per compliance %)
@@ -600,7 +978,7 @@ def create_figure4_cost_effectiveness(scenarios):
     for policy_name, (policy_key, color) in policies.items():
         reductions = []
         for c in compliances:
-            mean_val = np.mean(scenarios[f'{policy_key}_{c}%'])
+            mean_val = means[f'{policy_key}_{c}%']
             reduction = (baseline_mean - mean_val) / baseline_mean * 100
             reductions.append(reduction)
 
@@ -620,20 +998,14 @@ def create_figure4_cost_effectiveness(scenarios):
     # Panel B: Pareto frontier
     ax2 = axes[1]
 
-    cost_per_compliance = {
-        'B_Exclusion': 1.5,
-        'C_Moderate': 0.8,
-        'C_Strict': 1.2,
-        'D_Moderate_Combined': 2.0,
-        'D_Strict_Combined': 2.5
-    }
+    from policy_optimizer import COST_PER_COMPLIANCE
 
     all_points = []
 
-    for policy_key, cost_factor in cost_per_compliance.items():
+    for policy_key, cost_factor in COST_PER_COMPLIANCE.items():
         for c in compliances:
             scenario_name = f'{policy_key}_{c}%'
-            mean_val = np.mean(scenarios[scenario_name])
+            mean_val = means[scenario_name]
             reduction = (baseline_mean - mean_val) / baseline_mean * 100
 
             cost = c * cost_factor
@@ -706,18 +1078,30 @@ def create_figure4_cost_effectiveness(scenarios):
     ax2.legend(handles=legend_elements, frameon=True, shadow=True, fontsize=10)
 
     plt.tight_layout()
-    plt.savefig('Figure4_Cost_Effectiveness.png', dpi=300, bbox_inches='tight')
-    plt.savefig('Figure4_Cost_Effectiveness.pdf', bbox_inches='tight')
-    plt.show()
+    plt.savefig(os.path.join(out_dir, 'Figure4_Cost_Effectiveness.png'),
+                dpi=300, bbox_inches='tight')
+    plt.savefig(os.path.join(out_dir, 'Figure4_Cost_Effectiveness.pdf'),
+                bbox_inches='tight')
+    if show:
+        plt.show()
+    else:
+        plt.close(fig)
 
     print("✓ Saved: Figure4_Cost_Effectiveness.png/pdf")
 
-def create_figure5_distribution_comparisons(scenarios):
+def create_figure5_distribution_comparisons(scenarios, out_dir='.', show=True,
+                                            tail_estimates=None):
     """
     FIGURE 5: Distribution Comparisons
     Detailed distributional effects of key policies
+    tail_estimates: optional rare_events.estimate_policy_tails() output
+    used for panel D (with 95% CI error bars) instead of raw frequencies
     """
 
+    import matplotlib.pyplot as plt
+
+    scenarios, means = _summaries(scenarios)
+
     fig, axes = plt.subplots(2, 2, figsize=(16, 12))
 
     # Panel A: Baseline vs best interventions (full distributions)
@@ -731,9 +1115,9 @@ def create_figure5_distribution_comparisons(scenarios):
     ]
 
     for key, label, color in policies_to_compare:
-        data = scenarios[key]
-        ax1.hist(data, bins=50, alpha=0.5, label=label, color=color,
-                edgecolor='black', linewidth=0.5, density=True)
+        values, weights = count_values(scenarios[key]['counts'])
+        ax1.hist(values, bins=50, weights=weights, alpha=0.5, label=label,
+                 color=color, edgecolor='black', linewidth=0.5, density=True)
 
     ax1.set_xlabel('Outbreak Size (cases)', fontweight='bold', fontsize=12)
     ax1.set_ylabel('Probability Density', fontweight='bold', fontsize=12)
@@ -747,10 +1131,9 @@ def create_figure5_distribution_comparisons(scenarios):
     ax2 = axes[0, 1]
 
     for key, label, color in policies_to_compare:
-        data = scenarios[key]
-        sorted_data = np.sort(data)
-        cdf = np.arange(1, len(sorted_data)+1) / len(sorted_data)
-        ax2.plot(sorted_data, cdf, label=label, color=color, linewidth=3)
+        values, cdf = count_cdf(scenarios[key]['counts'])
+        ax2.plot(values, cdf, label=label, color=color, linewidth=3,
+                 drawstyle='steps-post')
 
     ax2.set_xlabel('Outbreak Size (cases)', fontweight='bold', fontsize=12)
     ax2.set_ylabel('Cumulative Probability', fontweight='bold', fontsize=12)
@@ -763,8 +1146,8 @@ def create_figure5_distribution_comparisons(scenarios):
     # Panel C: Percentile reduction across all policies
     ax3 = axes[1, 0]
 
-    baseline = scenarios['A_Baseline']
-    baseline_percentiles = np.percentile(baseline, [25, 50, 75, 90, 95, 99])
+    baseline_percentiles = count_percentiles(
+        scenarios['A_Baseline']['counts'], [25, 50, 75, 90, 95, 99])
 
     percentile_labels = ['25th', '50th', '75th', '90th', '95th', '99th']
 
@@ -779,7 +1162,8 @@ def create_figure5_distribution_comparisons(scenarios):
     width = 0.18
 
     for i, (key, label, color) in enumerate(compare_policies):
-        policy_percentiles = np.percentile(scenarios[key], [25, 50, 75, 90, 95, 99])
+        policy_percentiles = count_percentiles(scenarios[key]['counts'],
+                                               [25, 50, 75, 90, 95, 99])
         reductions = (baseline_percentiles - policy_percentiles) / baseline_percentiles * 100
 
         offset = (i - 1.5) * width
@@ -813,15 +1197,23 @@ def create_figure5_distribution_comparisons(scenarios):
     width = 0.2
 
     for i, (key, label, color) in enumerate(policies_for_tail):
-        data = scenarios[key]
+        counts = scenarios[key]['counts']
         percentages = []
-        for threshold in thresholds:
-            pct = (np.sum(data > threshold) / len(data)) * 100
-            percentages.append(pct)
+        errors = None
+        if tail_estimates is not None and key in tail_estimates:
+            # Importance-sampling estimates with 95% CI error bars
+            est = tail_estimates[key]
+            percentages = [est[t]['p'] * 100 for t in thresholds]
+            errors = [1.96 * est[t]['se'] * 100 for t in thresholds]
+        else:
+            for threshold in thresholds:
+                pct = count_exceed(counts, threshold) * 100
+                percentages.append(pct)
 
         offset = (i - 1.5) * width
         ax4.bar(x + offset, percentages, width, label=label, color=color,
-               alpha=0.8, edgecolor='black', linewidth=1)
+               alpha=0.8, edgecolor='black', linewidth=1,
+               yerr=errors, capsize=3 if errors else 0)
 
     ax4.set_ylabel('Probability of Large Outbreak (%)', fontweight='bold', fontsize=12)
     ax4.set_xlabel('Outbreak Size Threshold (cases)', fontweight='bold', fontsize=12)
@@ -832,18 +1224,72 @@ def create_figure5_distribution_comparisons(scenarios):
     ax4.grid(axis='y', alpha=0.3, linestyle='--')
 
     plt.tight_layout()
-    plt.savefig('Figure5_Distribution_Comparisons.png', dpi=300, bbox_inches='tight')
-    plt.savefig('Figure5_Distribution_Comparisons.pdf', bbox_inches='tight')
-    plt.show()
+    plt.savefig(os.path.join(out_dir, 'Figure5_Distribution_Comparisons.png'),
+                dpi=300, bbox_inches='tight')
+    plt.savefig(os.path.join(out_dir, 'Figure5_Distribution_Comparisons.pdf'),
+                bbox_inches='tight')
+    if show:
+        plt.show()
+    else:
+        plt.close(fig)
 
     print("✓ Saved: Figure5_Distribution_Comparisons.png/pdf")
 
 
+# HEADLESS RENDERING
+
+def render_policy_figures(scenarios, summary_df, out_dir='.', parallel=True,
+                          force=False, tail_estimates=None):
+    """
+    Render Figures 1-5 non-interactively from precomputed results.
+    Each figure is drawn in its own worker process with the Agg backend;
+    figures whose inputs are unchanged since the last render are skipped.
+    Samples are reduced to size summaries first, so what is hashed and
+    sent to the figure processes does not grow with the run count.
+    """
+
+    scenarios = size_summaries(scenarios)
+
+    jobs = [
+        {'name': 'Figure1', 'func': create_figure1_overview,
+         'args': (scenarios, summary_df),
+         'outputs': ['Figure1_Policy_Overview.png',
+                     'Figure1_Policy_Overview.pdf']},
+        {'name': 'Figure2', 'func': create_figure2_hygiene_comparison,
+         'args': (scenarios,),
+         'outputs': ['Figure2_Hygiene_Comparison.png',
+                     'Figure2_Hygiene_Comparison.pdf']},
+        {'name': 'Figure3', 'func': create_figure3_policy_interactions,
+         'args': (scenarios,),
+         'outputs': ['Figure3_Policy_Interactions.png',
+                     'Figure3_Policy_Interactions.pdf']},
+        {'name': 'Figure4', 'func': create_figure4_cost_effectiveness,
+         'args': (scenarios,),
+         'outputs': ['Figure4_Cost_Effectiveness.png',
+                     'Figure4_Cost_Effectiveness.pdf']},
+        {'name': 'Figure5', 'func': create_figure5_distribution_comparisons,
+         'args': (scenarios,),
+         'kwargs': {'tail_estimates': tail_estimates},
+         'outputs': ['Figure5_Distribution_Comparisons.png',
+                     'Figure5_Distribution_Comparisons.pdf']},
+    ]
+
+    return render_figures(jobs, out_dir=out_dir, parallel=parallel,
+                          force=force)
+
+
 # FULL WORKFLOW
 
-def run_complete_analysis(calibrated_params, n_sims=1500):
+def run_complete_analysis(calibrated_params, n_sims=1500, headless=False,
+                          store_dir=None, metadata=None, executor=None,
+                          tolerance=None, tail_tolerance=0.05,
+                          sampling=None):
     """
     Run complete comprehensive policy analysis.
+    With headless=True figures are rendered in parallel with the Agg
+    backend and never block on plt.show().
+    With store_dir set, the raw scenario arrays are saved to the results
+    store (see regenerate_from_store).
     """
 
     print("\n" + "="*70)
@@ -852,7 +1298,18 @@ def run_complete_analysis(calibrated_params, n_sims=1500):
     print("="*70)
 
     # Run scenarios
-    scenarios = run_comprehensive_policy_analysis(calibrated_params, N_runs=n_sims)
+    scenarios = run_comprehensive_policy_analysis(
+        calibrated_params, N_runs=n_sims, executor=executor,
+        tolerance=tolerance, tail_tolerance=tail_tolerance,
+        sampling=sampling)
+
+    if store_dir is not None:
+        meta = {'kind': 'policy_scenarios', 'params': calibrated_params,
+                'n_sims': n_sims, 'tolerance': tolerance,
+                'tail_tolerance': tail_tolerance, 'sampling': sampling}
+        meta.update(metadata or {})
+        save_run(store_dir, scenarios, meta)
+        print(f"\n✓ Saved raw scenario arrays: {store_dir}")
 
     # Create summary table
     print("\n" + "="*70)
@@ -868,11 +1325,14 @@ def run_complete_analysis(calibrated_params, n_sims=1500):
     print("GENERATING PUBLICATION FIGURES")
     print("="*70)
 
-    create_figure1_overview(scenarios, summary_df)
-    create_figure2_hygiene_comparison(scenarios)
-    create_figure3_policy_interactions(scenarios)
-    create_figure4_cost_effectiveness(scenarios)
-    create_figure5_distribution_comparisons(scenarios)
+    if headless:
+        render_policy_figures(scenarios, summary_df)
+    else:
+        create_figure1_overview(scenarios, summary_df)
+        create_figure2_hygiene_comparison(scenarios)
+        create_figure3_policy_interactions(scenarios)
+        create_figure4_cost_effectiveness(scenarios)
+        create_figure5_distribution_comparisons(scenarios)
 
     print("\n" + "="*70)
     print("ANALYSIS COMPLETE!")
@@ -888,6 +1348,52 @@ def run_complete_analysis(calibrated_params, n_sims=1500):
 
     return scenarios, summary_df
 
+# REGENERATE FROM STORED RUNS
+
+def regenerate_from_store(run_dir, out_dir='.', headless=True):
+    """
+    Rebuild the summary table and Figures 1-5 from a stored run
+    without re-simulating. Arrays are memory-mapped read-only.
+    """
+
+    scenarios, meta = load_run(run_dir)
+    print(f"Loaded {len(scenarios)} scenarios from {run_dir} "
+          f"(created {meta.get('created')})")
+
+    summary_df = create_summary_table(scenarios)
+    summary_df.to_csv(os.path.join(out_dir, 'Comprehensive_Policy_Summary.csv'),
+                      index=False)
+
+    if headless:
+        render_policy_figures(scenarios, summary_df, out_dir=out_dir)
+    else:
+        create_figure1_overview(scenarios, summary_df, out_dir=out_dir)
+        create_figure2_hygiene_comparison(scenarios, out_dir=out_dir)
+        create_figure3_policy_interactions(scenarios, out_dir=out_dir)
+        create_figure4_cost_effectiveness(scenarios, out_dir=out_dir)
+        create_figure5_distribution_comparisons(scenarios, out_dir=out_dir)
+
+    return scenarios, summary_df
+
+
+def compare_runs(run_dirs, stat=np.mean):
+    """
+    Scenario-by-run table of a summary statistic (default: mean outbreak
+    size) across stored runs.
+    """
+
+    import pandas as pd
+
+    columns = {}
+    for run_dir in run_dirs:
+        scenarios, _ = load_run(run_dir)
+        columns[os.path.basename(os.path.normpath(run_dir))] = {
+            name: float(stat(data)) for name, data in scenarios.items()
+        }
+
+    return pd.DataFrame(columns)
+
+
 # Example usage (standalone mode)
 
 if __name__ == "__main__":
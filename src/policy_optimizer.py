@@ -0,0 +1,416 @@
+"""
+Policy optimization over the cost-effectiveness frontier
+
+Figure 4 builds its Pareto frontier from the 15 registry scenarios. Here
+the frontier is searched over continuous policy settings instead:
+
+    family       searched controls
+    exclusion    compliance, xi_max
+    hygiene      compliance, beta_mult
+    combined     compliance, beta_mult, xi_max
+
+Costs come from policy_cost, the continuous version of the figure's cost
+factors (COST_PER_COMPLIANCE); it reproduces the figure's cost for every
+registry scenario.
+
+Every candidate and the baseline are simulated on the same random
+streams: block b of every point uses the same seed, and with stratified
+sampling (the default) the same restaurant configurations, so reductions
+are paired differences against the baseline with little Monte Carlo
+noise. The search is adaptive:
+
+  1. a Sobol design per family, init_blocks blocks of runs per point
+  2. points that cannot be ruled off the frontier (within two standard
+     errors of it) get more blocks, up to max_blocks
+  3. new candidates are proposed around the current frontier points
+     (shrinking steps) and into the widest cost gaps
+  4. repeat until only the final share of the budget (polish) is left
+  5. spend that on the frontier alone: frontier points get more blocks,
+     up to max_blocks, until the frontier stops changing or the budget
+     is spent, so the reported frontier is not a set of lucky draws
+
+    res = optimize_policies(calibrated_params, executor=get_executor())
+    res['points']    -> DataFrame of every evaluated setting
+    res['frontier']  -> its Pareto frontier (cost up, reduction up)
+"""
+
+import numpy as np
+
+from worker import draw_configurations, get_engine, simulate_sizes
+from sensitivity import POLICY_BOUNDS
+from streaming import count_mean, size_summaries
+
+
+# Relative implementation cost per % compliance (Figure 4)
+COST_PER_COMPLIANCE = {
+    'B_Exclusion': 1.5,
+    'C_Moderate': 0.8,
+    'C_Strict': 1.2,
+    'D_Moderate_Combined': 2.0,
+    'D_Strict_Combined': 2.5
+}
+
+# beta_mult of the moderate / strict registry scenarios, and the default
+# xi_max the exclusion cost refers to
+MODERATE_BETA_MULT = 0.7
+STRICT_BETA_MULT = 0.4
+DEFAULT_XI_MAX = 0.4
+
+FAMILIES = {
+    'exclusion': (['compliance', 'xi_max'], True, False),
+    'hygiene': (['compliance', 'beta_mult'], False, True),
+    'combined': (['compliance', 'beta_mult', 'xi_max'], True, True),
+}
+
+# Design columns passed to the simulator
+NAMES = ['policy_exclusion', 'policy_hygiene', 'compliance', 'beta_mult',
+         'xi_max']
+DEFAULTS = {'compliance': 0.0, 'beta_mult': MODERATE_BETA_MULT,
+            'xi_max': DEFAULT_XI_MAX}
+
+
+def _lerp_beta_mult(moderate, strict, beta_mult):
+    t = (MODERATE_BETA_MULT - beta_mult) / \
+        (MODERATE_BETA_MULT - STRICT_BETA_MULT)
+    return moderate + t * (strict - moderate)
+
+
+def policy_cost(policy_exclusion=False, policy_hygiene=False, compliance=0.0,
+                beta_mult=MODERATE_BETA_MULT, xi_max=DEFAULT_XI_MAX):
+    """
+    Relative implementation cost: compliance (%) times a cost factor. The
+    factor interpolates COST_PER_COMPLIANCE linearly in beta_mult between
+    the moderate and strict settings; exclusion scales with xi_max.
+    """
+
+    c = COST_PER_COMPLIANCE
+    excl = c['B_Exclusion'] * xi_max / DEFAULT_XI_MAX
+    if policy_exclusion and policy_hygiene:
+        factor = _lerp_beta_mult(c['D_Moderate_Combined'],
+                                 c['D_Strict_Combined'], beta_mult) + \
+            excl - c['B_Exclusion']
+    elif policy_hygiene:
+        factor = _lerp_beta_mult(c['C_Moderate'], c['C_Strict'], beta_mult)
+    elif policy_exclusion:
+        factor = excl
+    else:
+        factor = 0.0
+    return 100 * compliance * max(factor, 0.0)
+
+
+def pareto_front(cost, reduction):
+    """Indices of the non-dominated points (lower cost, higher
+    reduction), in order of cost."""
+
+    order = np.lexsort((-np.asarray(reduction), np.asarray(cost)))
+    front, best = [], -np.inf
+    for i in order:
+        if reduction[i] > best:
+            front.append(i)
+            best = reduction[i]
+    return np.array(front, dtype=int)
+
+
+def _rows(family, U):
+    """Design rows (NAMES) for unit-cube points of one family."""
+
+    controls, excl, hyg = FAMILIES[family]
+    X = np.empty((len(U), len(NAMES)))
+    X[:, 0], X[:, 1] = excl, hyg
+    for name in ('compliance', 'beta_mult', 'xi_max'):
+        col = NAMES.index(name)
+        if name in controls:
+            lo, hi = POLICY_BOUNDS[name]
+            X[:, col] = lo + U[:, controls.index(name)] * (hi - lo)
+        else:
+            X[:, col] = DEFAULTS[name]
+    return X
+
+
+def _unit(family, X):
+    controls = FAMILIES[family][0]
+    return np.column_stack([
+        (X[:, NAMES.index(name)] - POLICY_BOUNDS[name][0]) /
+        (POLICY_BOUNDS[name][1] - POLICY_BOUNDS[name][0])
+        for name in controls])
+
+
+def _policy(row):
+    """Simulator kwargs for one design row."""
+    policy = dict(zip(NAMES, row.tolist()))
+    policy['policy_exclusion'] = bool(policy['policy_exclusion'])
+    policy['policy_hygiene'] = bool(policy['policy_hygiene'])
+    return policy
+
+
+def _simulate_block_task(task):
+    """
+    n outbreaks for every row, on common random numbers: outbreak j of
+    every row gets the same restaurant and its own seed, so one flipped
+    draw in one outbreak does not shift the stream of the next.
+    """
+
+    base_params, X, n, seed, sampling = task
+    if get_engine() == 'kernel':
+        # The kernel already gives every outbreak its own streams, with
+        # exclusion decisions on a separate one
+        return np.array([
+            simulate_sizes('policy', dict(base_params, **_policy(row)), n,
+                           seed, sampling)
+            for row in X])
+
+    np.random.seed(seed)
+    configs = draw_configurations(n, sampling) or {}
+    seeds = np.random.randint(0, 2**31 - 1, n)
+    out = np.empty((len(X), n), dtype=np.int64)
+    for j in range(n):
+        config = {k: v[j] for k, v in configs.items()}
+        for r, row in enumerate(X):
+            params = dict(base_params, **_policy(row), **config)
+            out[r, j] = simulate_sizes('policy', params, 1, seeds[j])[0]
+    return out
+
+
+def _run_blocks(requests, X, base_params, block, block_seeds, executor,
+                sampling):
+    """
+    Simulate block b for every (point, b) in requests; every point runs
+    block b on the same seed. Returns {(point, b): sizes}.
+    """
+
+    by_block = {}
+    for i, b in requests:
+        by_block.setdefault(b, []).append(i)
+
+    tasks, keys = [], []
+    for b, points in sorted(by_block.items()):
+        for start in range(0, len(points), 64):
+            rows = points[start:start + 64]
+            tasks.append((base_params, X[rows], block, block_seeds[b],
+                          sampling))
+            keys.append((b, rows))
+
+    results = map(_simulate_block_task, tasks) if executor is None else \
+        executor.map(_simulate_block_task, tasks)
+
+    out = {}
+    for (b, rows), sizes in zip(keys, results):
+        for i, s in zip(rows, sizes):
+            out[(i, b)] = s
+    return out
+
+
+def optimize_policies(calibrated_params, budget=72000, n_init=16, block=100,
+                      init_blocks=2, max_blocks=16, n_propose=12,
+                      polish=1 / 3, executor=None, sampling='stratified',
+                      seed=0):
+    """
+    Adaptive search for the cost / mean-reduction Pareto front. budget:
+    total outbreak simulations (default 3 x the 16-scenario analysis at
+    1500 runs), of which a polish share is kept for refining the final
+    frontier. The block seeds, Sobol scrambles and proposals all derive
+    from seed, so a seed gives the same frontier on every run. Returns
+    dict with 'points' and 'frontier' DataFrames.
+    """
+
+    import pandas as pd
+    from scipy.stats import qmc
+
+    block_ss, design_ss, search_ss = np.random.SeedSequence(seed).spawn(3)
+    block_seeds = [int(ss.generate_state(1)[0])
+                   for ss in block_ss.spawn(max_blocks)]
+    design_seeds = design_ss.spawn(len(FAMILIES))
+    rng = np.random.default_rng(search_ss)
+
+    # Baseline on every block (the reference for all paired differences)
+    base_X = np.zeros((1, len(NAMES)))
+    base_X[0, 2:] = [0.0, DEFAULTS['beta_mult'], DEFAULTS['xi_max']]
+    base_runs = _run_blocks([(0, b) for b in range(max_blocks)], base_X,
+                            calibrated_params, block, block_seeds, executor,
+                            sampling)
+    base = np.array([base_runs[(0, b)] for b in range(max_blocks)])
+    base_cum = np.cumsum(base.sum(1))
+    used = base.size
+
+    families, X = [], np.empty((0, len(NAMES)))
+    sum_d, sum_d2, blocks = [], [], []
+    steps = {}
+
+    def add_points(family, U):
+        nonlocal X
+        new = _rows(family, np.clip(U, 0, 1))
+        start = len(X)
+        X = np.vstack([X, new])
+        families.extend([family] * len(new))
+        sum_d.extend([0.0] * len(new))
+        sum_d2.extend([0.0] * len(new))
+        blocks.extend([0] * len(new))
+        return list(range(start, len(X)))
+
+    def evaluate(requests):
+        nonlocal used
+        sizes = _run_blocks(requests, X, calibrated_params, block,
+                            block_seeds, executor, sampling)
+        for (i, b), s in sizes.items():
+            d = base[b] - s
+            sum_d[i] += d.sum()
+            sum_d2[i] += (d.astype(float) ** 2).sum()
+            blocks[i] = max(blocks[i], b + 1)
+        used += len(requests) * block
+
+    def stats():
+        k = np.array(blocks)
+        n = k * block
+        mean_d = np.array(sum_d) / n
+        var_d = np.maximum(np.array(sum_d2) / n - mean_d ** 2, 0)
+        base_mean = base_cum[k - 1] / n
+        reduction = 100 * mean_d / base_mean
+        se = 100 * np.sqrt(var_d / n) / base_mean
+        cost = np.array([policy_cost(*row) for row in X])
+        return cost, reduction, se
+
+    # 1. Initial Sobol design per family
+    for (family, (controls, _, _)), ss in zip(FAMILIES.items(),
+                                              design_seeds):
+        U = qmc.Sobol(d=len(controls), scramble=True,
+                      seed=np.random.default_rng(ss)).random(n_init)
+        idx = add_points(family, U)
+        evaluate([(i, b) for i in idx for b in range(init_blocks)])
+    print(f"Policy optimizer: {len(X)} initial settings, "
+          f"{used:,} simulations")
+
+    search_budget = budget - int(polish * budget)
+    rnd = 0
+    while used < search_budget:
+        rnd += 1
+        cost, reduction, se = stats()
+        front = pareto_front(cost, reduction)
+
+        # 2. Refine everything within two SE of the frontier envelope
+        order = np.argsort(cost)
+        envelope = np.maximum.accumulate(reduction[order])
+        env = np.empty_like(envelope)
+        env[order] = envelope
+        near = np.flatnonzero(reduction + 2 * se >= env)
+        requests = []
+        for i in near:
+            k = blocks[i]
+            extra = min(max_blocks, 2 * k) - k
+            requests += [(i, b) for b in range(k, k + extra)]
+
+        # 3. Proposals around frontier points and into cost gaps
+        proposals = []
+        picks = front if len(front) <= n_propose else \
+            rng.choice(front, n_propose, replace=False)
+        for i in picks:
+            f = families[i]
+            step = steps.get(i, 0.1)
+            steps[i] = step * 0.7
+            u = _unit(f, X[i:i + 1])[0]
+            proposals.append((f, u + step * rng.standard_normal(len(u))))
+        gaps = np.diff(cost[front])
+        for g in np.argsort(-gaps)[:max(1, n_propose // 4)]:
+            a, b_ = front[g], front[g + 1]
+            if families[a] == families[b_]:
+                f = families[a]
+                u = (_unit(f, X[a:a + 1])[0] + _unit(f, X[b_:b_ + 1])[0]) / 2
+                proposals.append((f, u))
+
+        remaining = (search_budget - used) // block
+        new = []
+        for f, u in proposals:
+            if len(requests) + len(new) * init_blocks + init_blocks > \
+                    remaining:
+                break
+            new += add_points(f, u[None])
+        requests = requests[:max(0, remaining - len(new) * init_blocks)]
+        requests += [(i, b) for i in new for b in range(init_blocks)]
+        if not requests:
+            break
+        evaluate(requests)
+
+        cost, reduction, se = stats()
+        print(f"  round {rnd}: {len(X)} settings, "
+              f"{len(pareto_front(cost, reduction))} on the frontier, "
+              f"{used:,} simulations")
+
+    # 5. Polish the frontier
+    while used < budget:
+        cost, reduction, se = stats()
+        front = pareto_front(cost, reduction)
+        requests = []
+        for i in front:
+            k = blocks[i]
+            requests += [(i, b) for b in range(k, min(max_blocks, 2 * k))]
+        requests = requests[:(budget - used) // block]
+        if not requests:
+            break
+        evaluate(requests)
+    print(f"  final frontier: {len(pareto_front(*stats()[:2]))} settings, "
+          f"{used:,} simulations")
+
+    cost, reduction, se = stats()
+    points = pd.DataFrame(X[:, 2:], columns=NAMES[2:])
+    points.insert(0, 'family', families)
+    points['cost'] = cost
+    points['reduction'] = reduction
+    points['reduction_se'] = se
+    points['runs'] = np.array(blocks) * block
+    front = pareto_front(cost, reduction)
+    points['on_frontier'] = False
+    points.loc[front, 'on_frontier'] = True
+
+    return {'points': points,
+            'frontier': points.loc[front].reset_index(drop=True),
+            'simulations': int(used)}
+
+
+def plot_policy_frontier(result, scenarios=None, out_dir='.', show=True):
+    """Optimized frontier over all evaluated settings, with the registry
+    scenarios' points (Figure 4) for reference when scenarios are given."""
+
+    import os
+    import matplotlib.pyplot as plt
+
+    points, frontier = result['points'], result['frontier']
+    colors = {'exclusion': '#3498DB', 'hygiene': '#27AE60',
+              'combined': '#E67E22'}
+
+    fig, ax = plt.subplots(figsize=(9, 6))
+    for family, color in colors.items():
+        sel = points[points['family'] == family]
+        ax.scatter(sel['cost'], sel['reduction'], s=12, alpha=0.35,
+                   color=color, label=f'{family} (evaluated)')
+    ax.errorbar(frontier['cost'], frontier['reduction'],
+                yerr=1.96 * frontier['reduction_se'], color='red',
+                linestyle='--', marker='.', linewidth=2,
+                label='Optimized frontier (95% CI)')
+
+    if scenarios is not None:
+        means = {name: count_mean(s['counts'])
+                 for name, s in size_summaries(scenarios).items()}
+        baseline_mean = means['A_Baseline']
+        for key, factor in COST_PER_COMPLIANCE.items():
+            for c in [30, 60, 100]:
+                name = f'{key}_{c}%'
+                if name in scenarios:
+                    red = (baseline_mean - means[name]) / \
+                        baseline_mean * 100
+                    ax.scatter(c * factor, red, marker='x', color='black')
+        ax.scatter([], [], marker='x', color='black',
+                   label='Registry scenarios')
+
+    ax.set_xlabel('Relative Implementation Cost', fontweight='bold')
+    ax.set_ylabel('Outbreak Reduction (%)', fontweight='bold')
+    ax.set_title('Optimized Cost-Effectiveness Frontier', fontweight='bold')
+    ax.grid(alpha=0.3, linestyle='--')
+    ax.legend(frameon=True, fontsize=9)
+
+    plt.tight_layout()
+    plt.savefig(os.path.join(out_dir, 'Policy_Frontier.png'), dpi=300,
+                bbox_inches='tight')
+    if show:
+        plt.show()
+    else:
+        plt.close(fig)
+    print("✓ Saved: Policy_Frontier.png")
@@ -1,6 +1,37 @@
 
 import numpy as np
 
+from simulation import (
+    FOOD_HANDLERS_TABLE,
+    OTHER_STAFF_TABLE,
+    INIT_INFECTED_TABLE,
+    PATRONS_TABLE
+)
+
+
+def policy_rates(beta_staff_staff, beta_handler_patron,
+                 prob_food_contamination, policy_exclusion=False,
+                 policy_hygiene=False, compliance=0.0, xi_max=0.4,
+                 beta_mult=0.70):
+    """
+    Effective (beta_staff_staff, beta_handler_patron,
+    prob_food_contamination, daily exclusion probability) under the
+    hygiene and exclusion policies.
+    """
+
+    if policy_hygiene:
+        hygiene_factor = 1 - (1 - beta_mult) * compliance
+        beta_ss_eff = beta_staff_staff * hygiene_factor
+        beta_hp_eff = beta_handler_patron * hygiene_factor
+        prob_contam_eff = prob_food_contamination * hygiene_factor
+    else:
+        beta_ss_eff = beta_staff_staff
+        beta_hp_eff = beta_handler_patron
+        prob_contam_eff = prob_food_contamination
+
+    xi_eff = compliance * xi_max if policy_exclusion else 0
+    return beta_ss_eff, beta_hp_eff, prob_contam_eff, xi_eff
+
 
 def simulate_outbreak_policy(
     # Staff + restaurant defaults
@@ -31,39 +62,65 @@ def simulate_outbreak_policy(
     compliance=0.0,
     xi_max=0.4,
     omega=0.2,
-    beta_mult=0.70
+    beta_mult=0.70,
+
+    # IMPORTANCE SAMPLING (rare-event mode, see rare_events.py)
+    is_contamination_mult=None,
+    is_size_shift=0.0,
+    is_init_infected_p=None,
+    return_weight=False,
+
+    # DAILY TRAJECTORY (optional (max_days, 4) int array, see below)
+    trajectory=None
 ):
-    """Simulate outbreak with policy interventions."""
+    """
+    Simulate outbreak with policy interventions.
+
+    Rare-event mode: draws come from a tilted proposal and the returned
+    weight is the likelihood ratio (nominal / proposal), so
+    mean(weight * (size > t)) is unbiased for P(size > t).
+      is_contamination_mult - food contamination prob. multiplied by this
+      is_size_shift         - added to the contamination lognormal log-mean
+      is_init_infected_p    - proposal probs. for init_infected (1, 2, 3)
+    With return_weight=True the result is (size, weight).
+
+    Trajectory mode: daily new infections per channel (staff,
+    handler-patron, other-patron, food) are added to `trajectory`; the
+    random stream and the returned size are unchanged.
+    """
+
+    weight = 1.0
 
     # Sample restaurant characteristics
     if n_food_handlers is None:
-        n_food_handlers = np.random.choice([3, 4, 5, 6, 7],
-                                           p=[0.1, 0.2, 0.4, 0.2, 0.1])
+        n_food_handlers = np.random.choice(FOOD_HANDLERS_TABLE[0],
+                                           p=FOOD_HANDLERS_TABLE[1])
     if n_other_staff is None:
-        n_other_staff = np.random.choice([3, 4, 5, 6],
-                                         p=[0.2, 0.3, 0.3, 0.2])
+        n_other_staff = np.random.choice(OTHER_STAFF_TABLE[0],
+                                         p=OTHER_STAFF_TABLE[1])
     if init_infected is None:
-        init_infected = np.random.choice([1, 2, 3],
-                                         p=[0.6, 0.3, 0.1])
+        if is_init_infected_p is None:
+            init_infected = np.random.choice(INIT_INFECTED_TABLE[0],
+                                             p=INIT_INFECTED_TABLE[1])
+        else:
+            k = np.random.choice(len(INIT_INFECTED_TABLE[0]),
+                                 p=is_init_infected_p)
+            init_infected = INIT_INFECTED_TABLE[0][k]
+            weight *= INIT_INFECTED_TABLE[1][k] / is_init_infected_p[k]
     if patrons_per_shift is None:
-        patrons_per_shift = np.random.choice(
-            [100, 125, 150, 175, 200],
-            p=[0.2, 0.2, 0.3, 0.2, 0.1]
-        )
+        patrons_per_shift = np.random.choice(PATRONS_TABLE[0],
+                                             p=PATRONS_TABLE[1])
 
-    # Apply hygiene policy
-    if policy_hygiene:
-        hygiene_factor = 1 - (1 - beta_mult) * compliance
-        beta_ss_eff = beta_staff_staff * hygiene_factor
-        beta_hp_eff = beta_handler_patron * hygiene_factor
-        prob_contam_eff = prob_food_contamination * hygiene_factor
-    else:
-        beta_ss_eff = beta_staff_staff
-        beta_hp_eff = beta_handler_patron
-        prob_contam_eff = prob_food_contamination
+    # Apply hygiene and exclusion policies
+    beta_ss_eff, beta_hp_eff, prob_contam_eff, xi_eff = policy_rates(
+        beta_staff_staff, beta_handler_patron, prob_food_contamination,
+        policy_exclusion, policy_hygiene, compliance, xi_max, beta_mult)
 
-    # Apply exclusion policy
-    xi_eff = compliance * xi_max if policy_exclusion else 0
+    # Proposal for the food contamination event
+    if is_contamination_mult is not None:
+        prob_contam_is = min(0.9, prob_contam_eff * is_contamination_mult)
+    else:
+        prob_contam_is = prob_contam_eff
 
     # Initialize staff states
     total_staff = n_food_handlers + n_other_staff
@@ -80,6 +137,8 @@ def simulate_outbreak_policy(
 
     total_staff_inf = init_infected
     total_pat_inf = 0
+    if trajectory is not None:
+        trajectory[0, 0] += init_infected
 
     # Main simulation loop
     for day in range(max_days):
@@ -126,6 +185,8 @@ def simulate_outbreak_policy(
                     staff_states[s] = "E"
                     staff_infection_day[s] = day + np.random.uniform(0, 1)
                     total_staff_inf += 1
+                    if trajectory is not None:
+                        trajectory[day, 0] += 1
                     break
 
         # Shifts
@@ -143,26 +204,49 @@ def simulate_outbreak_policy(
 
             # Handler-patron transmission
             for _ in infectious_handlers:
-                total_pat_inf += np.random.binomial(patrons_per_handler, beta_hp_eff)
+                k = np.random.binomial(patrons_per_handler, beta_hp_eff)
+                total_pat_inf += k
+                if trajectory is not None:
+                    trajectory[day, 1] += k
 
             # Other staff-patron transmission
             if len(infectious_other) > 0:
-                total_pat_inf += np.random.binomial(
+                k = np.random.binomial(
                     patrons_per_shift,
                     beta_other_patron * len(infectious_other)
                 )
+                total_pat_inf += k
+                if trajectory is not None:
+                    trajectory[day, 2] += k
 
             # Food contamination
             if len(infectious_handlers) > 0:
-                if np.random.rand() < prob_contam_eff:
+                contaminated = np.random.rand() < prob_contam_is
+                if prob_contam_is != prob_contam_eff:
+                    if contaminated:
+                        weight *= prob_contam_eff / prob_contam_is
+                    else:
+                        weight *= (1 - prob_contam_eff) / (1 - prob_contam_is)
+                if contaminated:
                     sig = np.sqrt(np.log(
                         1 + (contamination_size_std / contamination_size_mean) ** 2))
                     mu = np.log(contamination_size_mean) - sig ** 2 / 2
-                    contam_size = int(np.random.lognormal(mu, sig))
+                    if is_size_shift:
+                        raw = np.random.lognormal(mu + is_size_shift, sig)
+                        weight *= np.exp(
+                            (is_size_shift ** 2 - 2 * is_size_shift *
+                             (np.log(raw) - mu)) / (2 * sig ** 2))
+                    else:
+                        raw = np.random.lognormal(mu, sig)
+                    contam_size = int(raw)
                     contam_size = max(
                         10,
                         min(contam_size, int(patrons_per_shift * 0.9))
                     )
                     total_pat_inf += contam_size
+                    if trajectory is not None:
+                        trajectory[day, 3] += contam_size
 
+    if return_weight:
+        return total_staff_inf + total_pat_inf, weight
     return total_staff_inf + total_pat_inf
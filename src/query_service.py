@@ -0,0 +1,390 @@
+"""
+What-if query service
+
+Answers "outcome distribution for parameters X under policy Y at
+compliance Z" without a 16-scenario script run. One long-lived process
+keeps the calibrated parameters, the response surface and the warm
+worker pool, and resolves each query from the cheapest source that can
+answer it:
+
+  1. memory: an LRU cache of recent answers (microseconds)
+  2. store: answers simulated earlier, in the results store (ms)
+  3. surface: interpolated statistics from the precomputed response
+     surface, for exclusion / hygiene / combined at the calibrated
+     parameters (sub-ms; only the surface statistics, no histogram)
+  4. simulation: n_runs outbreaks in SCENARIO_CHUNK chunks on the pool,
+     alongside the chunks of every other query in flight
+
+Concurrent identical queries are coalesced onto one computation. Seeds
+derive from the query key (as for stored scenarios), so an answer does
+not depend on what else was running and the memory / store caches are
+exact.
+
+In process:
+
+    service = WhatIfService(final_params, executor=get_executor(),
+                            surface=surface, store_dir='results_store/query')
+    await service.query({'policy': 'combined', 'compliance': 0.45,
+                         'beta_mult': 0.55})
+
+Over HTTP (python3 main.py serve):
+
+    curl 'localhost:8765/query?policy=hygiene&compliance=0.6&beta_mult=0.4'
+    curl -d '{"policy": "C_Strict_60%", "params":
+              {"beta_staff_staff": 0.1}}' localhost:8765/query
+
+Query fields: policy (baseline, exclusion, hygiene, combined or a
+registry scenario name), compliance, beta_mult, xi_max, params
+(simulator kwargs overriding the calibrated ones; in GET queries any
+other simulator kwarg; counts such as max_days must be integers), runs,
+source ('simulate' skips the surface) and histogram (include the size
+histogram).
+"""
+
+import os
+import json
+import time
+import asyncio
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qsl
+
+import numpy as np
+
+from pipeline import source_hash, stage_key
+from policy_analysis import SCENARIO_CHUNK, policy_scenarios
+from response_surface import SURFACE_POLICIES, query_surface
+from results_store import load_run, save_run
+from scenarios import POLICY_KWARGS, scenario_seed
+from streaming import accumulate_counts, count_percentiles, count_stats
+from worker import get_engine, simulate_sizes
+
+
+FAMILIES = dict(SURFACE_POLICIES, baseline={})
+CONTROLS = ['compliance', 'beta_mult', 'xi_max']
+POLICY_KEYS = {'policy_exclusion', 'policy_hygiene', *CONTROLS}
+# Simulator kwargs that are counts (several default to None: sampled)
+INT_KWARGS = {'n_food_handlers', 'n_other_staff', 'init_infected',
+              'patrons_per_shift', 'patrons_per_handler', 'shifts_per_day',
+              'max_days'}
+MEMORY_ENTRIES = 4096
+PORT = 8765
+
+
+class QueryError(ValueError):
+    """A query that cannot be answered as asked (HTTP 400)."""
+
+
+def _number(value, name):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise QueryError(f"{name} must be a number, got {value!r}")
+
+
+def _integer(value, name):
+    number = _number(value, name)
+    if not number.is_integer():
+        raise QueryError(f"{name} must be an integer, got {value!r}")
+    return int(number)
+
+
+def _override(value, name):
+    if isinstance(value, bool):
+        return value
+    if name in INT_KWARGS:
+        return _integer(value, name)
+    return _number(value, name)
+
+
+_REGISTRY = {}
+
+
+def _registry():
+    if not _REGISTRY:
+        _REGISTRY.update((n, p) for n, _, p in policy_scenarios())
+    return _REGISTRY
+
+
+def parse_query(query):
+    """
+    Normalize a query dict into (policy kwargs, parameter overrides,
+    options). Raises QueryError on unknown names or values.
+    """
+
+    query = dict(query)
+    name = query.pop('policy', 'baseline')
+    if name in FAMILIES:
+        policy = dict(FAMILIES[name])
+    else:
+        registry = _registry()
+        if name not in registry:
+            raise QueryError(
+                f"unknown policy {name!r}; use one of {sorted(FAMILIES)} "
+                f"or a scenario name")
+        policy = dict(registry[name])
+
+    for key in CONTROLS:
+        if key in query:
+            policy[key] = _number(query.pop(key), key)
+
+    options = {
+        'runs': _integer(query.pop('runs', 0), 'runs') or None,
+        'source': query.pop('source', None),
+        'histogram': str(query.pop('histogram', '')).lower() in
+        ('1', 'true', 'yes'),
+    }
+
+    overrides = query.pop('params', None) or {}
+    overrides.update(query)   # GET queries: simulator kwargs inline
+    unknown = set(overrides) - POLICY_KWARGS
+    if unknown:
+        raise QueryError(f"unknown simulator kwargs {sorted(unknown)}")
+    if set(overrides) & POLICY_KEYS:
+        raise QueryError("set the policy with policy / compliance / "
+                         "beta_mult / xi_max, not in params")
+    overrides = {k: _override(v, k) for k, v in overrides.items()}
+    return policy, overrides, options
+
+
+def distribution(counts, baseline_mean=None, histogram=False):
+    """Answer statistics from a size histogram (see streaming.py)."""
+
+    stats = count_stats(counts)
+    stats['p90'], stats['p99'] = count_percentiles(counts, [90, 99])
+    stats = {k: float(v) for k, v in stats.items()}
+    errors = {'mean': stats['std'] / np.sqrt(stats['runs'])}
+    if baseline_mean is not None:
+        stats['reduction'] = 100 * (1 - stats['mean'] / baseline_mean)
+        errors['reduction'] = 100 * errors['mean'] / baseline_mean
+    out = {'stats': stats, 'errors': errors}
+    if histogram:
+        out['histogram'] = counts.tolist()
+    return out
+
+
+class WhatIfService:
+    """
+    Query resolver around calibrated parameters, an optional response
+    surface (response_surface.build_response_surface / load_surface), an
+    executor (None: simulate in a thread) and an optional store_dir for
+    simulated answers.
+    """
+
+    def __init__(self, calibrated_params, executor=None, surface=None,
+                 store_dir=None, n_runs=1500, sampling=None, seed=0):
+
+        self.params = dict(calibrated_params)
+        self.executor = executor
+        self.surface = surface
+        self.store_dir = store_dir
+        self.n_runs = n_runs
+        self.sampling = sampling
+        self.seed = seed
+        modules = ['simulation.py', 'policy_simulation.py', 'worker.py']
+        if get_engine() == 'kernel':
+            modules.append('kernel.py')
+        self.sources = source_hash(*modules)
+        self._memory = OrderedDict()
+        self._inflight = {}
+        self.counts = dict.fromkeys(
+            ['memory', 'store', 'surface', 'simulation', 'coalesced'], 0)
+
+    async def query(self, query):
+        """Answer one query dict (see the module docstring)."""
+
+        t0 = time.perf_counter()
+        policy, overrides, options = parse_query(query)
+        answer = self._from_surface(policy, overrides, options)
+        if answer is None:
+            answer = await self._distribution(
+                dict(self.params, **overrides, **policy),
+                options['runs'] or self.n_runs, options['histogram'])
+        answer = dict(answer, policy=policy, params=overrides,
+                      elapsed_ms=round(1000 * (time.perf_counter() - t0), 3))
+        return answer
+
+    # Surface
+
+    def _from_surface(self, policy, overrides, options):
+        if self.surface is None or overrides or options['histogram'] or \
+                options['runs'] or options['source'] == 'simulate':
+            return None
+        # The surface covers the policy families at default xi_max
+        flags = {k: True for k in ('policy_exclusion', 'policy_hygiene')
+                 if policy.get(k)}
+        family = next((f for f, p in SURFACE_POLICIES.items()
+                       if p == flags), None)
+        if family not in self.surface['policies'] or 'xi_max' in policy:
+            return None
+        try:
+            res = query_surface(self.surface, family,
+                                policy.get('compliance', 0.0),
+                                policy.get('beta_mult', 0.7))
+        except ValueError:
+            return None   # outside the lattice: simulate instead
+        self.counts['surface'] += 1
+        return {'source': 'surface',
+                'stats': {k: v for k, (v, _) in res.items()},
+                'errors': {k: e for k, (_, e) in res.items()}}
+
+    # Simulated distributions, cached and coalesced
+
+    async def _distribution(self, kwargs, n_runs, histogram):
+        # Reduction against the same parameters without a policy (one
+        # baseline for all policy settings)
+        baseline = {k: v for k, v in kwargs.items() if k not in POLICY_KEYS}
+        if baseline == kwargs or not (kwargs.get('policy_exclusion') or
+                                      kwargs.get('policy_hygiene')):
+            counts, source = await self._counts(baseline, n_runs)
+            return dict(distribution(counts, None, histogram),
+                        source=source)
+
+        (counts, source), (base_counts, _) = await asyncio.gather(
+            self._counts(kwargs, n_runs), self._counts(baseline, n_runs))
+        return dict(distribution(counts, count_stats(base_counts)['mean'],
+                                 histogram), source=source)
+
+    def _key(self, kwargs, n_runs):
+        return stage_key('query', {
+            'kwargs': kwargs, 'n_runs': n_runs, 'sampling': self.sampling,
+            'seed': self.seed, 'chunk': SCENARIO_CHUNK,
+            'sources': self.sources})
+
+    async def _counts(self, kwargs, n_runs):
+        """(size histogram, source) for one full set of simulator kwargs."""
+
+        key = self._key(kwargs, n_runs)
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.counts['memory'] += 1
+            return self._memory[key], 'memory'
+
+        if key in self._inflight:
+            self.counts['coalesced'] += 1
+            counts, _ = await asyncio.shield(self._inflight[key])
+            return counts, 'coalesced'
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self._load_or_simulate(key, kwargs, n_runs)
+            future.set_result(result)
+        except BaseException as exc:
+            future.set_exception(exc)
+            future.exception()   # retrieved: coalesced waiters re-raise
+            raise
+        finally:
+            del self._inflight[key]
+
+        self._memory[key] = result[0]
+        if len(self._memory) > MEMORY_ENTRIES:
+            self._memory.popitem(last=False)
+        return result
+
+    async def _load_or_simulate(self, key, kwargs, n_runs):
+
+        run_dir = None if self.store_dir is None else \
+            os.path.join(self.store_dir, key)
+        if run_dir is not None and \
+                os.path.exists(os.path.join(run_dir, 'metadata.json')):
+            self.counts['store'] += 1
+            return np.array(load_run(run_dir)[0]['counts']), 'store'
+
+        # Chunk seeds from the query key, as for stored scenarios
+        starts = list(range(0, n_runs, SCENARIO_CHUNK))
+        seeds = np.random.SeedSequence(
+            scenario_seed(self.seed, key)).spawn(len(starts))
+        loop = asyncio.get_running_loop()
+        chunks = []
+        for start, ss in zip(starts, seeds):
+            args = ('policy', kwargs, min(SCENARIO_CHUNK, n_runs - start),
+                    int(ss.generate_state(1)[0]), self.sampling)
+            if self.executor is None:
+                chunks.append(loop.run_in_executor(None, simulate_sizes,
+                                                   *args))
+            else:
+                chunks.append(asyncio.wrap_future(
+                    self.executor.submit(simulate_sizes, *args)))
+
+        counts = None
+        for sizes in await asyncio.gather(*chunks):
+            counts = accumulate_counts(counts, sizes)
+        self.counts['simulation'] += 1
+
+        if run_dir is not None:
+            await loop.run_in_executor(None, save_run, run_dir,
+                                       {'counts': counts},
+                                       {'kind': 'query', 'kwargs': kwargs,
+                                        'n_runs': n_runs, 'key': key,
+                                        'sampling': self.sampling})
+        return counts, 'simulation'
+
+
+# HTTP
+#
+# A minimal HTTP/1.1 front end on asyncio streams (no web framework):
+# GET /query?..., POST /query with a JSON body, GET /status.
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+            500: 'Internal Server Error'}
+
+
+async def _handle(service, reader, writer):
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            method, target, _ = line.decode('latin-1').split(' ', 2)
+            headers = {}
+            while True:
+                h = await reader.readline()
+                if h in (b'\r\n', b'\n', b''):
+                    break
+                k, _, v = h.decode('latin-1').partition(':')
+                headers[k.strip().lower()] = v.strip()
+            body = await reader.readexactly(
+                int(headers.get('content-length', 0)))
+
+            status, payload = await _respond(service, method, target, body)
+            data = json.dumps(payload).encode()
+            writer.write(
+                f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(data)}\r\n\r\n".encode() + data)
+            await writer.drain()
+            if headers.get('connection', '').lower() == 'close':
+                break
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def _respond(service, method, target, body):
+    url = urlsplit(target)
+    if url.path == '/status':
+        return 200, {'params': service.params, 'counts': service.counts,
+                     'surface': service.surface is not None,
+                     'cached': len(service._memory)}
+    if url.path != '/query':
+        return 404, {'error': f"unknown path {url.path}"}
+    try:
+        query = json.loads(body) if method == 'POST' and body else \
+            dict(parse_qsl(url.query))
+        return 200, await service.query(query)
+    except (QueryError, json.JSONDecodeError) as exc:
+        return 400, {'error': str(exc)}
+    except Exception as exc:
+        return 500, {'error': f"{type(exc).__name__}: {exc}"}
+
+
+async def serve(service, host='127.0.0.1', port=PORT):
+    """Serve the HTTP API until cancelled."""
+
+    server = await asyncio.start_server(
+        lambda r, w: _handle(service, r, w), host, port)
+    print(f"What-if service on http://{host}:{port}/query "
+          f"(surface: {'yes' if service.surface is not None else 'no'})")
+    async with server:
+        await server.serve_forever()
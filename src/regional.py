@@ -0,0 +1,294 @@
+"""
+Regional multi-restaurant simulation
+
+simulate_outbreak_policy follows one isolated restaurant through one
+outbreak. simulate_region follows a whole region of restaurants through
+a season, with the same disease progression, staff / patron transmission
+and policy logic (policy_rates), plus links between sites:
+
+  - community introductions: each susceptible staff member is infected
+    from outside with probability intro_rate per day
+  - shared staff pools: restaurants in groups of pool_size share staff,
+    so infectious staff also expose susceptible staff at the other sites
+    of their pool (beta_pool per contact)
+  - chain kitchens: a chain_share of restaurants belong to chains of
+    chain_size sites sharing a central kitchen; on each shift with an
+    infectious handler anywhere in the chain, the kitchen contaminates
+    food at every site with probability chain_contamination_prob
+  - common-source food: on supplier event days (supplier_event_prob per
+    day, region-wide) each restaurant receives the contaminated lot with
+    probability supplier_reach; patrons there get a contamination-sized
+    cluster and each susceptible staff member is infected with
+    probability supplier_staff_attack
+
+State is held in struct-of-arrays form (one array per staff attribute
+over every staff member in the region, restaurant attributes over every
+restaurant) and advanced in vectorized daily steps. Within a day, the
+per-contact loops of the single-restaurant simulator collapse to
+equivalent per-person probabilities: a susceptible staff member at a
+site with a asymptomatic and s symptomatic infectious staff escapes with
+probability (1 - beta)^a (1 - beta / 2)^s, and k present handlers infect
+Binomial(30 k, beta_hp) patrons.
+
+Chains and pools never straddle a shard, so the region is split into
+independent shards that run on the worker pool; supplier event days are
+drawn once for the whole region.
+
+    out = simulate_region(params, {'n_restaurants': 10**6},
+                          executor=get_executor())
+    out['daily']              # (days, channels) new infections per day
+    out['restaurant_cases']   # season cases per restaurant
+"""
+
+import inspect
+
+import numpy as np
+
+from simulation import (
+    FOOD_HANDLERS_TABLE,
+    OTHER_STAFF_TABLE,
+    PATRONS_TABLE
+)
+from policy_simulation import policy_rates, simulate_outbreak_policy
+from worker import task_seeds
+
+
+REGION_DEFAULTS = {
+    'n_restaurants': 10000,
+    'days': 120,
+    'intro_rate': 2e-4,
+    'pool_size': 4,
+    'beta_pool': 0.01,
+    'chain_share': 0.3,
+    'chain_size': 12,
+    'chain_contamination_prob': 0.02,
+    'supplier_event_prob': 0.03,
+    'supplier_reach': 0.002,
+    'supplier_staff_attack': 0.1,
+}
+
+# Columns of the daily output
+REGION_CHANNELS = ['staff', 'handler_patron', 'other_patron', 'food',
+                   'chain_food', 'supplier_food', 'active_restaurants']
+
+# Restaurants per shard (rounded to whole chains and pools)
+REGION_SHARD = 50000
+
+# States (same as kernel.py)
+S, E, IA, IS, R = 0, 1, 2, 3, 4
+
+_POLICY_DEFAULTS = {
+    name: p.default for name, p in
+    inspect.signature(simulate_outbreak_policy).parameters.items()}
+
+
+def _contamination_sizes(k, patrons, mean, std):
+    """Food contamination cluster sizes (as in simulate_outbreak_policy)."""
+    sig = np.sqrt(np.log(1 + (std / mean) ** 2))
+    mu = np.log(mean) - sig ** 2 / 2
+    raw = np.random.lognormal(mu, sig, k).astype(np.int64)
+    return np.maximum(10, np.minimum(raw, (patrons * 0.9).astype(np.int64)))
+
+
+def _simulate_shard(task):
+    """One shard of restaurants over the season; returns (daily, cases)."""
+
+    params, region, start, n, seed, supplier_days = task
+    np.random.seed(seed)
+    q = dict(_POLICY_DEFAULTS, **params)
+    beta_ss, beta_hp, prob_contam, xi_eff = policy_rates(
+        q['beta_staff_staff'], q['beta_handler_patron'],
+        q['prob_food_contamination'], q['policy_exclusion'],
+        q['policy_hygiene'], q['compliance'], q['xi_max'], q['beta_mult'])
+    c_mean = q['contamination_size_mean']
+    c_std = q['contamination_size_std']
+    days = len(supplier_days)
+
+    # Restaurants (shards start on a chain and pool boundary, so local
+    # chain / pool ids start at 0)
+    n_handlers = np.random.choice(FOOD_HANDLERS_TABLE[0], n,
+                                  p=FOOD_HANDLERS_TABLE[1])
+    n_other = np.random.choice(OTHER_STAFF_TABLE[0], n,
+                               p=OTHER_STAFF_TABLE[1])
+    patrons = np.random.choice(PATRONS_TABLE[0], n, p=PATRONS_TABLE[1])
+    pool = np.arange(n) // region['pool_size']
+    chain = region_chains(region)[start:start + n]
+    in_chain = chain >= 0
+    chain[in_chain] -= start // region['chain_size']
+    n_chains = chain.max() + 1
+    chain_sites = np.flatnonzero(in_chain)
+
+    # Staff (struct of arrays; staff of restaurant r are contiguous)
+    n_staff = n_handlers + n_other
+    rest = np.repeat(np.arange(n), n_staff)
+    first = np.cumsum(n_staff) - n_staff
+    handler = np.arange(len(rest)) - first[rest] < n_handlers[rest]
+    state = np.zeros(len(rest), dtype=np.int8)
+    infection_day = np.zeros(len(rest), dtype=np.float32)
+    excluded = np.zeros(len(rest), dtype=bool)
+
+    daily = np.zeros((days, len(REGION_CHANNELS)), dtype=np.int64)
+    cases = np.zeros(n, dtype=np.int64)
+
+    def infect(staff_idx, day):
+        state[staff_idx] = E
+        infection_day[staff_idx] = day + np.random.random_sample(
+            len(staff_idx))
+        daily[day, 0] += len(staff_idx)
+        cases[:] += np.bincount(rest[staff_idx], minlength=n)
+
+    def food(rest_idx, day, channel):
+        sizes = _contamination_sizes(len(rest_idx), patrons[rest_idx],
+                                     c_mean, c_std)
+        daily[day, channel] += sizes.sum()
+        cases[rest_idx] += sizes
+
+    for day in range(days):
+
+        # Disease progression
+        since = day - infection_day
+        recover = ((state == IA) | (state == IS)) & \
+            (since >= q['latent_period'] + q['infectious_period'])
+        onset = np.flatnonzero((state == E) & (since >= q['latent_period']))
+        state[onset] = np.where(
+            np.random.random_sample(len(onset)) < q['prob_symptomatic'],
+            IS, IA)
+        state[recover] = R
+
+        # Staff exclusion and return
+        if q['policy_exclusion']:
+            cand = np.flatnonzero((state == IS) & ~excluded)
+            excluded[cand[np.random.random_sample(len(cand)) < xi_eff]] = \
+                True
+            out = np.flatnonzero(excluded)
+            back = out[np.random.random_sample(len(out)) < q['omega']]
+            excluded[back] = False
+            state[back] = R
+
+        on_site = ~excluded
+        sympt = (state == IS) & on_site
+        asympt = (state == IA) & on_site
+        n_is = np.bincount(rest[sympt], minlength=n)
+        n_ia = np.bincount(rest[asympt], minlength=n)
+        daily[day, 6] = np.count_nonzero(n_is + n_ia)
+
+        # Staff infections: own site, pool sites, community
+        n_pool = np.bincount(pool, weights=n_is + n_ia)[pool] - n_is - n_ia
+        escape = ((1 - beta_ss) ** n_ia * (1 - beta_ss / 2) ** n_is *
+                  (1 - region['beta_pool']) ** n_pool)
+        sus = np.flatnonzero(state == S)
+        p_inf = 1 - escape[rest[sus]] * (1 - region['intro_rate'])
+        infect(sus[np.random.random_sample(len(sus)) < p_inf], day)
+
+        # Common-source (supplier) food event
+        if supplier_days[day]:
+            hit = np.random.random_sample(n) < region['supplier_reach']
+            if hit.any():
+                food(np.flatnonzero(hit), day, 5)
+                exposed = np.flatnonzero((state == S) & hit[rest])
+                infect(exposed[np.random.random_sample(len(exposed)) <
+                               region['supplier_staff_attack']], day)
+
+        # Shifts (symptomatic staff miss half of them)
+        inf_idx = np.flatnonzero(sympt | asympt)
+        for sh in range(q['shifts_per_day']):
+            present = inf_idx[(state[inf_idx] != IS) |
+                              (np.random.random_sample(len(inf_idx)) >= 0.5)]
+            h = np.bincount(rest[present[handler[present]]], minlength=n)
+            o = np.bincount(rest[present[~handler[present]]], minlength=n)
+
+            active = np.flatnonzero(h)
+            k = np.random.binomial(q['patrons_per_handler'] * h[active],
+                                   beta_hp)
+            daily[day, 1] += k.sum()
+            cases[active] += k
+
+            active = np.flatnonzero(o)
+            k = np.random.binomial(
+                patrons[active],
+                np.minimum(1.0, q['beta_other_patron'] * o[active]))
+            daily[day, 2] += k.sum()
+            cases[active] += k
+
+            local = np.flatnonzero(h)
+            local = local[np.random.random_sample(len(local)) < prob_contam]
+            if len(local):
+                food(local, day, 3)
+
+            if n_chains > 0:
+                ch = np.bincount(chain[chain_sites], weights=h[chain_sites],
+                                 minlength=n_chains)
+                events = (ch > 0) & (np.random.random_sample(n_chains) <
+                                     region['chain_contamination_prob'])
+                sites = chain_sites[events[chain[chain_sites]]]
+                if len(sites):
+                    food(sites, day, 4)
+
+    return daily, cases
+
+
+def region_chains(region):
+    """Chain id per restaurant (-1: independent); chain sites come first."""
+    idx = np.arange(region['n_restaurants'])
+    n_sites = int(round(region['chain_share'] * region['n_restaurants']))
+    return np.where(idx < n_sites, idx // region['chain_size'], -1)
+
+
+def region_shards(region, shard=REGION_SHARD):
+    """(start, n) shards aligned to whole chains and staff pools."""
+
+    n = region['n_restaurants']
+    unit = np.lcm(region['chain_size'], region['pool_size'])
+    step = max(unit, shard // unit * unit)
+    return [(s, min(step, n - s)) for s in range(0, n, step)]
+
+
+def simulate_region(params, region=None, executor=None, shard=REGION_SHARD):
+    """
+    One season over a region of restaurants. params: simulator kwargs
+    (calibrated transmission parameters plus any policy), region:
+    overrides of REGION_DEFAULTS. Returns dict with 'daily' (days x
+    REGION_CHANNELS new infections, last column the restaurants with
+    infectious staff on site), 'restaurant_cases' and 'chain' (chain id
+    per restaurant, -1 for independents).
+    """
+
+    region = dict(REGION_DEFAULTS, **(region or {}))
+    days = region['days']
+
+    supplier_days = np.random.random_sample(days) < \
+        region['supplier_event_prob']
+    shards = region_shards(region, shard)
+    tasks = [(params, region, start, n, seed, supplier_days)
+             for (start, n), seed in zip(shards, task_seeds(len(shards)))]
+
+    if executor is None:
+        results = map(_simulate_shard, tasks)
+    else:
+        results = executor.map(_simulate_shard, tasks)
+
+    daily = np.zeros((days, len(REGION_CHANNELS)), dtype=np.int64)
+    cases = []
+    for d, c in results:
+        daily += d
+        cases.append(c)
+
+    return {
+        'daily': daily,
+        'restaurant_cases': np.concatenate(cases),
+        'chain': region_chains(region),
+        'supplier_days': np.flatnonzero(supplier_days),
+        'region': region,
+    }
+
+
+def summarize_region(out, outbreak_size=2):
+    """Season totals per channel and restaurants with an outbreak (at
+    least outbreak_size cases)."""
+
+    totals = dict(zip(REGION_CHANNELS[:-1], out['daily'][:, :-1].sum(0)))
+    cases = out['restaurant_cases']
+    totals['total_cases'] = int(cases.sum())
+    totals['restaurants_with_outbreak'] = int((cases >= outbreak_size).sum())
+    totals['peak_active_restaurants'] = int(out['daily'][:, -1].max())
+    return {k: int(v) for k, v in totals.items()}
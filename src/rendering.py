@@ -0,0 +1,153 @@
+"""
+Headless figure rendering
+
+Renders figure functions non-interactively (Agg backend), one worker
+process per figure, and skips any figure whose inputs and plotting code
+are unchanged since the last render. A small JSON manifest next to the
+outputs records the input digest of every rendered figure.
+"""
+
+import os
+import json
+import hashlib
+import inspect
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+MANIFEST_NAME = ".figure_manifest.json"
+
+
+def use_headless_backend():
+    """Force the non-interactive Agg backend (safe after pyplot import)."""
+    import matplotlib
+    matplotlib.use("Agg", force=True)
+
+
+def _update_digest(h, obj):
+
+    if isinstance(obj, np.ndarray):
+        arr = np.ascontiguousarray(obj)
+        h.update(f"ndarray{arr.dtype}{arr.shape}".encode())
+        h.update(arr.tobytes())
+    elif isinstance(obj, dict):
+        h.update(b"dict")
+        for k in sorted(obj, key=str):
+            h.update(str(k).encode())
+            _update_digest(h, obj[k])
+    elif isinstance(obj, (list, tuple)):
+        h.update(f"seq{len(obj)}".encode())
+        for v in obj:
+            _update_digest(h, v)
+    elif hasattr(obj, "to_csv"):
+        # pandas DataFrame / Series
+        h.update(obj.to_csv().encode())
+    else:
+        h.update(repr(obj).encode())
+
+
+def digest_inputs(func, args):
+    """Hash of a figure function's source code and its input arguments."""
+    h = hashlib.sha256()
+    h.update(func.__qualname__.encode())
+    try:
+        h.update(inspect.getsource(func).encode())
+    except (OSError, TypeError):
+        pass
+    _update_digest(h, args)
+    return h.hexdigest()
+
+
+def _load_manifest(out_dir):
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _render_one(func, args, kwargs, out_dir):
+    use_headless_backend()
+    func(*args, out_dir=out_dir, show=False, **kwargs)
+    return func.__name__
+
+
+def render_figures(jobs, out_dir=".", parallel=True, force=False,
+                   max_workers=None):
+    """
+    Render figure jobs without blocking.
+
+    jobs: list of dicts with keys
+        'name'    - manifest key
+        'func'    - figure function accepting (*args, out_dir=, show=)
+        'args'    - tuple of positional inputs
+        'kwargs'  - optional dict of keyword inputs
+        'outputs' - file names the function writes into out_dir
+
+    Returns the list of job names that were (re)rendered.
+    """
+
+    os.makedirs(out_dir, exist_ok=True)
+    use_headless_backend()
+
+    manifest = _load_manifest(out_dir)
+    todo = []
+
+    for job in jobs:
+        digest = digest_inputs(job["func"],
+                               (job["args"], job.get("kwargs") or {}))
+        outputs_exist = all(
+            os.path.exists(os.path.join(out_dir, o)) for o in job["outputs"]
+        )
+        if not force and outputs_exist and manifest.get(job["name"]) == digest:
+            print(f"  (unchanged) {job['name']}")
+            continue
+        todo.append((job, digest))
+
+    if not todo:
+        return []
+
+    error = None
+
+    if parallel and len(todo) > 1:
+        n_workers = max_workers or min(len(todo), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=n_workers,
+                                 initializer=use_headless_backend) as ex:
+            futures = [
+                (job, digest, ex.submit(_render_one, job["func"], job["args"],
+                                        job.get("kwargs") or {}, out_dir))
+                for job, digest in todo
+            ]
+            for job, digest, fut in futures:
+                try:
+                    fut.result()
+                    manifest[job["name"]] = digest
+                except Exception as e:
+                    error = error or e
+    else:
+        for job, digest in todo:
+            try:
+                _render_one(job["func"], job["args"],
+                            job.get("kwargs") or {}, out_dir)
+                manifest[job["name"]] = digest
+            except Exception as e:
+                error = error or e
+
+    # Record the figures that did render before surfacing any failure
+    _save_manifest(out_dir, manifest)
+    if error is not None:
+        raise error
+
+    return [job["name"] for job, _ in todo]
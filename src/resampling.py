@@ -0,0 +1,201 @@
+"""
+Resampled validation
+
+The validate stage scores one stratified 5-fold split and one 80/20
+holdout, so its test/train ratios are single noisy draws. Here the fast
+k-fold grid (calibration.kfold_cells) is simulated once, with n_sims
+draws per cell for fitting and n_sims independent draws for testing:
+
+    table = simulate_cell_table(executor=get_executor())
+    kfold = repeated_kfold(sizes, table, k=5, repeats=20)
+    boot = bootstrap_632(sizes, table, n_boot=500)
+
+A split's calibration score against a cell only depends on the cell's
+simulated percentiles (computed once per table) and on the percentiles
+of the split's data, so every resample re-scores all cells with a few
+array operations: hundreds of splits cost little more than one.
+
+  - repeated_kfold: repeats x k stratified folds (validation's folds)
+  - bootstrap_632: fits on bootstrap samples scored on the out-of-bag
+    outbreaks, and the .632 estimate 0.368 * apparent + 0.632 * OOB
+    score (Efron 1983)
+"""
+
+import numpy as np
+
+from calibration import PERCENTILES, WEIGHTS, kfold_cells, simulate_grid
+from validation import KFOLD_SIMS, stratified_folds
+from worker import release_buffer
+
+
+# CELL TABLE
+
+def simulate_cell_table(n_sims=KFOLD_SIMS, executor=None, sampling=None):
+    """
+    2 * n_sims baseline outbreaks per fast-grid cell: columns [:n_sims]
+    fit, [n_sims:] test. Returns {'cells': [...], 'sims': (cells,
+    2 * n_sims) array}.
+    """
+
+    cells = kfold_cells()
+    spec, buf = simulate_grid(
+        [dict(cell, contamination_size_std=30) for cell in cells],
+        2 * n_sims, executor, sampling=sampling)
+    sims = np.array(buf)
+    del buf
+    release_buffer(spec)
+    return {'cells': cells, 'sims': sims}
+
+
+def cell_percentiles(table):
+    """Score percentiles of every cell's fit and test draws, (cells, 7)
+    each."""
+
+    sims = np.asarray(table['sims'])
+    n = sims.shape[1] // 2
+    return (np.percentile(sims[:, :n], PERCENTILES, axis=1).T,
+            np.percentile(sims[:, n:], PERCENTILES, axis=1).T)
+
+
+def _scores(real_pct, cell_pct):
+    """calibration.calculate_score of every (split, cell) pair from
+    percentiles: (splits, 7) x (cells, 7) -> (splits, cells)."""
+    diff = np.abs(real_pct[:, None, :] - cell_pct[None, :, :])
+    return np.average(diff, axis=2, weights=WEIGHTS)
+
+
+def _percentiles(all_sizes, index_sets):
+    return np.array([np.percentile(all_sizes[idx], PERCENTILES)
+                     for idx in index_sets])
+
+
+def evaluate_splits(all_sizes, splits, fit_pct, test_pct):
+    """
+    Fit (best cell on the fit draws) on each split's train indices and
+    score it on the test indices against the cell's test draws. splits:
+    (train_idx, test_idx) pairs. Returns arrays cell, train_score,
+    test_score and ratio (test / train), one entry per split.
+    """
+
+    train_scores = _scores(_percentiles(all_sizes, [s[0] for s in splits]),
+                           fit_pct)
+    best = np.argmin(train_scores, axis=1)
+    test_real = _percentiles(all_sizes, [s[1] for s in splits])
+    test_sc = np.average(np.abs(test_real - test_pct[best]), axis=1,
+                         weights=WEIGHTS)
+    train_sc = train_scores[np.arange(len(splits)), best]
+    return {'cell': best, 'train_score': train_sc, 'test_score': test_sc,
+            'ratio': test_sc / train_sc}
+
+
+# RESAMPLING SCHEMES
+
+def repeated_kfold(all_sizes, table, k=5, repeats=20):
+    """
+    repeats independent stratified k-fold splits (shuffled with the
+    global RNG), each fold fit and scored on the cell table. Returns
+    evaluate_splits' arrays plus repeat and fold numbers.
+    """
+
+    fit_pct, test_pct = cell_percentiles(table)
+    splits, repeat, fold = [], [], []
+    for r in range(repeats):
+        folds = stratified_folds(all_sizes, k)
+        for f in range(k):
+            train = [x for i, g in enumerate(folds) if i != f for x in g]
+            splits.append((np.array(train), np.array(folds[f])))
+            repeat.append(r + 1)
+            fold.append(f + 1)
+
+    res = evaluate_splits(all_sizes, splits, fit_pct, test_pct)
+    return dict(res, repeat=np.array(repeat), fold=np.array(fold))
+
+
+def bootstrap_632(all_sizes, table, n_boot=500):
+    """
+    n_boot bootstrap samples (global RNG), each fit on the sample and
+    scored on its out-of-bag outbreaks. Returns evaluate_splits' arrays
+    per sample plus the apparent score (fit and scored on all data),
+    the mean out-of-bag score and the .632 estimate.
+    """
+
+    fit_pct, test_pct = cell_percentiles(table)
+    n = len(all_sizes)
+    splits = []
+    while len(splits) < n_boot:
+        idx = np.random.randint(0, n, n)
+        oob = np.setdiff1d(np.arange(n), idx)
+        if len(oob):
+            splits.append((idx, oob))
+
+    res = evaluate_splits(all_sizes, splits, fit_pct, test_pct)
+    apparent = _scores(_percentiles(all_sizes, [np.arange(n)]),
+                       fit_pct).min()
+    oob = res['test_score'].mean()
+    res.update(apparent=apparent, oob=oob,
+               err632=0.368 * apparent + 0.632 * oob)
+    return res
+
+
+def resampling_summary(kfold, boot):
+    """Test/train ratio estimates with their spread across resamples."""
+
+    import pandas as pd
+
+    repeat_means = [kfold['ratio'][kfold['repeat'] == r].mean()
+                    for r in np.unique(kfold['repeat'])]
+    rows = [
+        {'method': 'repeated k-fold', 'splits': len(kfold['ratio']),
+         'ratio': kfold['ratio'].mean(), 'ratio_sd': kfold['ratio'].std(),
+         'ratio_p2.5': np.percentile(kfold['ratio'], 2.5),
+         'ratio_p97.5': np.percentile(kfold['ratio'], 97.5),
+         'repeat_sd': np.std(repeat_means)},
+        {'method': 'bootstrap OOB', 'splits': len(boot['ratio']),
+         'ratio': boot['ratio'].mean(), 'ratio_sd': boot['ratio'].std(),
+         'ratio_p2.5': np.percentile(boot['ratio'], 2.5),
+         'ratio_p97.5': np.percentile(boot['ratio'], 97.5),
+         'repeat_sd': np.nan},
+        {'method': 'bootstrap .632', 'splits': len(boot['ratio']),
+         'ratio': boot['err632'] / boot['apparent'], 'ratio_sd': np.nan,
+         'ratio_p2.5': np.nan, 'ratio_p97.5': np.nan, 'repeat_sd': np.nan},
+    ]
+    return pd.DataFrame(rows)
+
+
+def plot_resampling(kfold, boot, out_dir='.', show=True):
+    """Distributions of the k-fold and bootstrap test/train ratios."""
+
+    import os
+    import matplotlib.pyplot as plt
+
+    fig, (axA, axB) = plt.subplots(1, 2, figsize=(12, 5))
+
+    repeats = np.unique(kfold['repeat'])
+    repeat_means = [kfold['ratio'][kfold['repeat'] == r].mean()
+                    for r in repeats]
+    axA.hist(kfold['ratio'], bins=30, alpha=0.6, label='Folds')
+    axA.hist(repeat_means, bins=15, alpha=0.8, label='Repeat means')
+    axA.axvline(1.5, linestyle="--", color="red")
+    axA.set_title(f"Repeated {kfold['fold'].max()}-Fold Ratios "
+                  f"({len(repeats)} repeats)")
+    axA.set_xlabel("Test / train score")
+    axA.legend()
+
+    axB.hist(boot['ratio'], bins=30, alpha=0.6, label='Out-of-bag')
+    axB.axvline(boot['err632'] / boot['apparent'], color='black',
+                label='.632 estimate')
+    axB.axvline(1.5, linestyle="--", color="red")
+    axB.set_title(f"Bootstrap Ratios ({len(boot['ratio'])} samples)")
+    axB.set_xlabel("Test / train score")
+    axB.legend()
+
+    plt.tight_layout()
+    for ext in ['png', 'pdf']:
+        fig.savefig(os.path.join(out_dir,
+                                 f"Calibration_Figure3_Resampling.{ext}"),
+                    dpi=300, bbox_inches="tight")
+    if show:
+        plt.show()
+    else:
+        plt.close(fig)
+    print("✓ Saved: Calibration_Figure3_Resampling.png")
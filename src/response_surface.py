@@ -0,0 +1,222 @@
+"""
+Precomputed policy response surface
+
+Outbreak-size statistics simulated over a fine compliance x beta_mult
+lattice for each policy type, stored in the results store and served by
+bilinear interpolation with Monte Carlo error estimates:
+
+    surface = build_response_surface(calibrated_params, n_runs=500)
+    query_surface(surface, 'combined', compliance=0.45, beta_mult=0.55)
+    ->  {'mean': (value, se), 'median': ..., 'reduction': ...}
+
+Each query is a table lookup (microseconds) instead of a fresh 1500-run
+simulation. The reported error is the Monte Carlo standard error of the
+interpolated value (lattice nodes are independent); interpolation error
+between nodes is not included, so keep the lattice fine.
+"""
+
+import bisect
+
+import numpy as np
+
+from worker import evaluate_design
+from results_store import save_run, load_run
+
+
+SURFACE_POLICIES = {
+    'exclusion': {'policy_exclusion': True},
+    'hygiene': {'policy_hygiene': True},
+    'combined': {'policy_exclusion': True, 'policy_hygiene': True},
+}
+
+COMPLIANCE_GRID = np.round(np.linspace(0.0, 1.0, 21), 3)
+BETA_MULT_GRID = np.round(np.linspace(0.3, 1.0, 15), 3)
+
+SURFACE_STATS = ['mean', 'median', 'p90', 'p95', 'p99', 'reduction']
+QUANTILES = {'median': 0.50, 'p90': 0.90, 'p95': 0.95, 'p99': 0.99}
+
+BASELINE_BLOCKS = 8   # baseline runs = BASELINE_BLOCKS * n_runs
+
+
+def node_statistics(sizes, baseline_mean, baseline_se, z=1.96):
+    """
+    Statistics and their Monte Carlo standard errors for every row of
+    sizes (..., n_runs). Quantile errors come from the order-statistic
+    confidence interval. Returns (values, errors), each (stats, ...).
+    """
+
+    n = sizes.shape[-1]
+    srt = np.sort(sizes, axis=-1)
+    values, errors = {}, {}
+
+    values['mean'] = sizes.mean(axis=-1)
+    errors['mean'] = sizes.std(axis=-1, ddof=1) / np.sqrt(n)
+
+    for stat, q in QUANTILES.items():
+        k = z * np.sqrt(n * q * (1 - q))
+        lo = int(np.clip(np.floor(n * q - k), 0, n - 1))
+        hi = int(np.clip(np.ceil(n * q + k), 0, n - 1))
+        values[stat] = np.percentile(sizes, q * 100, axis=-1)
+        errors[stat] = (srt[..., hi] - srt[..., lo]) / (2 * z)
+
+    # Percent reduction of the mean vs. baseline (delta method)
+    m, se = values['mean'], errors['mean']
+    values['reduction'] = 100 * (1 - m / baseline_mean)
+    errors['reduction'] = 100 * np.sqrt(
+        (se / baseline_mean)**2 + (m * baseline_se / baseline_mean**2)**2)
+
+    return (np.stack([values[s] for s in SURFACE_STATS]),
+            np.stack([errors[s] for s in SURFACE_STATS]))
+
+
+def build_response_surface(calibrated_params, n_runs=500, compliance=None,
+                           beta_mult=None, policies=None, executor=None,
+                           sampling=None):
+    """
+    Simulate n_runs outbreaks at every lattice node of every policy type.
+    Exclusion alone does not use beta_mult, so it is simulated once per
+    compliance level and broadcast.
+
+    Returns the surface dict: policies, compliance, beta_mult, stats,
+    values / errors (stats x policies x compliance x beta_mult),
+    baseline_mean, baseline_se, n_runs.
+    """
+
+    from tqdm import tqdm
+
+    compliance = COMPLIANCE_GRID if compliance is None else compliance
+    beta_mult = BETA_MULT_GRID if beta_mult is None else beta_mult
+    policies = list(SURFACE_POLICIES) if policies is None else policies
+    compliance = np.asarray(compliance, dtype=float)
+    beta_mult = np.asarray(beta_mult, dtype=float)
+    nc, nb = len(compliance), len(beta_mult)
+
+    print("\n" + "="*70)
+    print(" POLICY RESPONSE SURFACE ")
+    print("="*70)
+    print(f"{len(policies)} policies x {nc} compliance x {nb} beta_mult, "
+          f"{n_runs} runs per node")
+
+    # Baseline, in blocks so it is spread over the workers
+    baseline = evaluate_design('policy', calibrated_params, [],
+                               np.empty((BASELINE_BLOCKS, 0)), n_runs,
+                               executor=executor, sampling=sampling).ravel()
+    baseline_mean = baseline.mean()
+    baseline_se = baseline.std(ddof=1) / np.sqrt(len(baseline))
+
+    values = np.empty((len(SURFACE_STATS), len(policies), nc, nb))
+    errors = np.empty_like(values)
+
+    for p, name in enumerate(policies):
+        flags = SURFACE_POLICIES[name]
+        params = dict(calibrated_params, **flags)
+
+        if flags.get('policy_hygiene'):
+            names = ['compliance', 'beta_mult']
+            X = np.array([(c, b) for c in compliance for b in beta_mult])
+        else:
+            names = ['compliance']
+            X = compliance[:, None]
+
+        pbar = tqdm(total=len(X), desc=f"Surface: {name}")
+        sizes = evaluate_design('policy', params, names, X, n_runs,
+                                executor=executor, progress=pbar.update,
+                                sampling=sampling)
+        pbar.close()
+
+        vals, errs = node_statistics(sizes, baseline_mean, baseline_se)
+        values[:, p] = vals.reshape(len(SURFACE_STATS), nc, -1)
+        errors[:, p] = errs.reshape(len(SURFACE_STATS), nc, -1)
+
+    return {
+        'policies': policies, 'compliance': compliance,
+        'beta_mult': beta_mult, 'stats': list(SURFACE_STATS),
+        'values': values, 'errors': errors,
+        'baseline_mean': float(baseline_mean),
+        'baseline_se': float(baseline_se), 'n_runs': n_runs,
+    }
+
+
+# PERSISTENCE
+
+def surface_arrays(surface):
+    """Split a surface into (arrays, metadata) for the results store."""
+    arrays = {key: surface[key]
+              for key in ('compliance', 'beta_mult', 'values', 'errors')}
+    meta = {key: surface[key]
+            for key in ('policies', 'stats', 'baseline_mean',
+                        'baseline_se', 'n_runs')}
+    return arrays, meta
+
+
+def surface_from_run(arrays, meta):
+    """Inverse of surface_arrays (e.g. on load_run / cached_stage output)."""
+    surface = {key: meta[key]
+               for key in ('policies', 'stats', 'baseline_mean',
+                           'baseline_se', 'n_runs')}
+    for key in ('compliance', 'beta_mult', 'values', 'errors'):
+        surface[key] = np.asarray(arrays[key])
+    return surface
+
+
+def save_surface(run_dir, surface, metadata=None):
+    arrays, meta = surface_arrays(surface)
+    save_run(run_dir, arrays, dict(meta, **(metadata or {})))
+
+
+def load_surface(run_dir):
+    # Fully loaded (not memory-mapped): the surface is small and queried
+    # many times
+    return surface_from_run(*load_run(run_dir, mmap_mode=None))
+
+
+# QUERIES
+
+def _bracket(grid, x):
+    """Lower node index and fractional position of x within grid."""
+
+    if not grid[0] <= x <= grid[-1]:
+        raise ValueError(f"{x} outside the surface range "
+                         f"[{grid[0]}, {grid[-1]}]")
+    if len(grid) == 1:
+        return 0, 0.0
+    i = min(bisect.bisect_right(grid, x) - 1, len(grid) - 2)
+    return i, (x - grid[i]) / (grid[i + 1] - grid[i])
+
+
+def query_surface(surface, policy, compliance, beta_mult=0.7, stats=None):
+    """
+    Interpolated statistics for one policy setting. Returns
+    {stat: (value, mc_se)}; beta_mult is ignored for exclusion alone.
+    """
+
+    # Cache plain-Python grids and index maps on the surface dict
+    if '_lookup' not in surface:
+        surface['_lookup'] = (
+            surface['compliance'].tolist(), surface['beta_mult'].tolist(),
+            {p: i for i, p in enumerate(surface['policies'])},
+            {s: i for i, s in enumerate(surface['stats'])})
+    c_grid, b_grid, p_index, s_index = surface['_lookup']
+
+    p = p_index[policy]
+    i, tc = _bracket(c_grid, compliance)
+    if not SURFACE_POLICIES[policy].get('policy_hygiene'):
+        j, tb = 0, 0.0
+    else:
+        j, tb = _bracket(b_grid, beta_mult)
+
+    i1 = min(i + 1, len(c_grid) - 1)
+    j1 = min(j + 1, len(b_grid) - 1)
+    w = np.array([(1 - tc) * (1 - tb), (1 - tc) * tb,
+                  tc * (1 - tb), tc * tb])
+
+    out = {}
+    for stat in (surface['stats'] if stats is None else stats):
+        s = s_index[stat]
+        v = surface['values'][s, p]
+        e = surface['errors'][s, p]
+        nodes_v = np.array([v[i, j], v[i, j1], v[i1, j], v[i1, j1]])
+        nodes_e = np.array([e[i, j], e[i, j1], e[i1, j], e[i1, j1]])
+        out[stat] = (float(w @ nodes_v), float(np.sqrt(w**2 @ nodes_e**2)))
+
+    return out
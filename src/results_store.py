@@ -0,0 +1,192 @@
+"""
+Persistent results store
+
+Each run is a directory holding one .npy file per raw array (outbreak
+sizes per scenario, calibration samples, ...) plus a metadata.json with
+the parameters, seeds and code version that produced it. Arrays are
+reloaded with np.load(mmap_mode='r'), so figures, summaries and
+comparisons can be regenerated from past runs without re-simulation.
+
+    run_dir/
+        metadata.json
+        A_Baseline.npy
+        B_Exclusion_30pct.npy
+        ...
+"""
+
+import os
+import re
+import json
+import glob
+import shutil
+import hashlib
+import subprocess
+from datetime import datetime
+
+import numpy as np
+
+
+METADATA_NAME = "metadata.json"
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def code_version():
+    """Git commit (if available) plus a hash of the src/*.py sources."""
+
+    h = hashlib.sha256()
+    for path in sorted(glob.glob(os.path.join(SRC_DIR, "*.py"))):
+        with open(path, "rb") as f:
+            h.update(os.path.basename(path).encode())
+            h.update(f.read())
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SRC_DIR,
+            capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+
+    return {"git_commit": commit, "source_hash": h.hexdigest()[:16]}
+
+
+def to_jsonable(obj):
+    """Convert numpy scalars/arrays inside params dicts to plain JSON types."""
+    if isinstance(obj, dict):
+        return {str(k): to_jsonable(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [to_jsonable(v) for v in obj]
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return obj
+
+
+def _safe_filename(name, used):
+    base = re.sub(r"[^A-Za-z0-9_.-]", "_", str(name).replace("%", "pct"))
+    fname = base + ".npy"
+    i = 1
+    while fname in used:
+        fname = f"{base}_{i}.npy"
+        i += 1
+    used.add(fname)
+    return fname
+
+
+def new_run_dir(root="results_store", prefix="run"):
+    """Fresh timestamped run directory path under root (not yet created)."""
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    return os.path.join(root, f"{prefix}-{stamp}")
+
+
+def save_run(run_dir, arrays, metadata=None):
+    """
+    Write a dict of arrays plus metadata to run_dir.
+
+    The directory is written under a temporary name and renamed into
+    place, so readers never see a half-written run.
+    """
+
+    tmp_dir = _tmp_run_dir(run_dir)
+
+    used = set()
+    index = {}
+    for name, arr in arrays.items():
+        fname = _safe_filename(name, used)
+        np.save(os.path.join(tmp_dir, fname), np.asarray(arr))
+        index[name] = fname
+
+    return _finish_run(tmp_dir, run_dir, index, metadata)
+
+
+def save_streams(run_dir, streams, metadata=None, dtype=np.int64):
+    """
+    Like save_run for arrays that arrive in chunks: streams maps each
+    name to (length, iterable of chunks). Streams are consumed one after
+    another and written straight into memory-mapped .npy files, so
+    memory use is one chunk whatever the length.
+    """
+
+    tmp_dir = _tmp_run_dir(run_dir)
+
+    used = set()
+    index = {}
+    for name, (length, chunks) in streams.items():
+        fname = _safe_filename(name, used)
+        out = np.lib.format.open_memmap(os.path.join(tmp_dir, fname),
+                                        mode="w+", dtype=dtype,
+                                        shape=(length,))
+        pos = 0
+        for chunk in chunks:
+            out[pos:pos + len(chunk)] = chunk
+            pos += len(chunk)
+        if pos != length:
+            raise ValueError(f"stream {name!r} gave {pos} values, "
+                             f"expected {length}")
+        out.flush()
+        del out
+        index[name] = fname
+
+    return _finish_run(tmp_dir, run_dir, index, metadata)
+
+
+def _tmp_run_dir(run_dir):
+    tmp_dir = run_dir.rstrip(os.sep) + ".tmp"
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+    return tmp_dir
+
+
+def _finish_run(tmp_dir, run_dir, index, metadata):
+    """Write metadata.json and move the finished run into place."""
+
+    meta = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "code_version": code_version(),
+    }
+    meta.update(to_jsonable(metadata or {}))
+    meta["arrays"] = index
+
+    with open(os.path.join(tmp_dir, METADATA_NAME), "w") as f:
+        json.dump(meta, f, indent=2)
+
+    if os.path.exists(run_dir):
+        shutil.rmtree(run_dir)
+    os.replace(tmp_dir, run_dir)
+    return run_dir
+
+
+def load_metadata(run_dir):
+    with open(os.path.join(run_dir, METADATA_NAME)) as f:
+        return json.load(f)
+
+
+def load_run(run_dir, mmap_mode="r"):
+    """
+    Reload a stored run.
+    Returns (arrays, metadata); arrays are read-only memory maps by default.
+    """
+
+    meta = load_metadata(run_dir)
+    arrays = {
+        name: np.load(os.path.join(run_dir, fname), mmap_mode=mmap_mode)
+        for name, fname in meta["arrays"].items()
+    }
+    return arrays, meta
+
+
+def list_runs(root="results_store"):
+    """All complete runs under root, oldest first, as (run_dir, metadata)."""
+
+    runs = []
+    for meta_path in glob.glob(os.path.join(root, "**", METADATA_NAME),
+                               recursive=True):
+        run_dir = os.path.dirname(meta_path)
+        if run_dir.endswith(".tmp"):
+            continue
+        runs.append((run_dir, load_metadata(run_dir)))
+
+    runs.sort(key=lambda r: (r[1].get("created", ""), r[0]))
+    return runs
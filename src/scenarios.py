@@ -0,0 +1,73 @@
+"""
+Declarative policy scenario registry
+
+Scenarios are data, not code: each entry has a name (used by the figures
+and summary table), a description and the policy kwargs passed to
+simulate_outbreak_policy. The default registry is scenarios.json:
+
+    {"name": "B_Exclusion_30%",
+     "description": "B: Exclusion 30% compliance",
+     "policy": {"policy_exclusion": true, "compliance": 0.3}}
+
+Every scenario has its own key: a hash of its policy, the calibrated
+parameters, run count, sampling, seed, chunk size and simulator source
+(not its name or description). Scenario results are stored per key, so
+adding or editing one entry re-simulates only that scenario (see
+run_comprehensive_policy_analysis(store_dir=...)).
+"""
+
+import os
+import json
+import inspect
+
+import numpy as np
+
+from results_store import SRC_DIR
+from pipeline import stage_key
+from policy_simulation import simulate_outbreak_policy
+
+
+SCENARIOS_FILE = os.path.join(SRC_DIR, "scenarios.json")
+
+POLICY_KWARGS = set(inspect.signature(simulate_outbreak_policy).parameters)
+
+
+def validate_scenarios(specs):
+    """Check names are unique and policies only use simulator kwargs."""
+
+    names = set()
+    for spec in specs:
+        if spec['name'] in names:
+            raise ValueError(f"duplicate scenario name {spec['name']!r}")
+        names.add(spec['name'])
+        unknown = set(spec.get('policy', {})) - POLICY_KWARGS
+        if unknown:
+            raise ValueError(f"{spec['name']}: unknown policy kwargs "
+                             f"{sorted(unknown)}")
+    return specs
+
+
+def load_scenarios(path=None):
+    """Scenario specs (dicts with name, description, policy) from JSON."""
+
+    with open(path or SCENARIOS_FILE) as f:
+        specs = json.load(f)
+    for spec in specs:
+        spec.setdefault('description', spec['name'])
+        spec.setdefault('policy', {})
+    return validate_scenarios(specs)
+
+
+def scenario_key(policy, calibrated_params, n_runs, sampling, seed, chunk,
+                 sources):
+    """Hash of everything that determines one scenario's simulated sizes."""
+    return stage_key('scenario', {
+        'policy': policy, 'params': calibrated_params, 'n_runs': n_runs,
+        'sampling': sampling, 'seed': seed, 'chunk': chunk,
+        'sources': sources})
+
+
+def scenario_seed(seed, key):
+    """Seed for one scenario, independent of which others are run."""
+    ss = np.random.SeedSequence([seed, int(key, 16)])
+    return int(ss.generate_state(1)[0])
@@ -0,0 +1,180 @@
+"""
+Global sensitivity analysis of the policy model
+
+Sobol indices for the policy controls (compliance, beta_mult, xi_max,
+omega) and the calibrated transmission parameters, estimated from a
+Saltelli design on a scrambled Sobol sequence (scipy.stats.qmc):
+
+    res = run_sensitivity_analysis(calibrated_params, n_base=4096)
+    res['indices']   ->  DataFrame with S1 / ST and bootstrap CIs
+
+A design with n_base base points and k parameters costs n_base * (k + 2)
+design points (n_reps outbreaks each), simulated in parallel blocks on
+the shared worker pool. The k + 2 points of each base point share a
+random stream (common random numbers), which keeps Monte Carlo noise out
+of the A / AB_i differences. Each point's output is still a noisy mean
+outbreak size; 'noise_share' reports the noise fraction of the output
+variance.
+"""
+
+import numpy as np
+
+from worker import evaluate_design
+
+
+POLICY_BOUNDS = {
+    'compliance': (0.0, 1.0),
+    'beta_mult': (0.3, 1.0),
+    'xi_max': (0.1, 0.8),
+    'omega': (0.05, 0.5),
+}
+
+# Same ranges as the calibration grid
+TRANSMISSION_BOUNDS = {
+    'beta_handler_patron': (0.015, 0.035),
+    'beta_staff_staff': (0.01, 0.2),
+    'prob_food_contamination': (0.10, 0.22),
+    'contamination_size_mean': (35, 65),
+}
+
+SA_BOUNDS = dict(POLICY_BOUNDS, **TRANSMISSION_BOUNDS)
+
+# Both interventions active, so every policy control matters
+SA_POLICY = {'policy_exclusion': True, 'policy_hygiene': True}
+
+
+def saltelli_design(bounds, n_base=1024, seed=None):
+    """
+    Saltelli design for the parameters in bounds (dict name -> (low,
+    high)): base matrices A, B and AB_i (A with column i from B). Rows are
+    grouped by base point, [A_j, B_j, AB_1j, ..., AB_kj] for j = 1..n, so
+    each group can share a random stream. n_base is rounded up to a power
+    of two (Sobol balance properties).
+    Returns (names, X) with X of shape (n_base * (k + 2), k).
+    """
+
+    from scipy.stats import qmc
+
+    names = list(bounds)
+    k = len(names)
+    m = int(np.ceil(np.log2(max(n_base, 2))))
+
+    if seed is None:
+        seed = np.random.randint(0, 2**31 - 1)
+    base = qmc.Sobol(d=2 * k, scramble=True, seed=seed).random_base2(m)
+
+    low = [bounds[n][0] for n in names]
+    high = [bounds[n][1] for n in names]
+    A = qmc.scale(base[:, :k], low, high)
+    B = qmc.scale(base[:, k:], low, high)
+
+    X = np.repeat(A[:, None, :], k + 2, axis=1)
+    X[:, 1] = B
+    for i in range(k):
+        X[:, 2 + i, i] = B[:, i]
+
+    return names, X.reshape(-1, k)
+
+
+def _split(y, k):
+    """fA, fB, fAB (k, n) from outputs in saltelli_design row order."""
+    y = np.asarray(y, dtype=float).reshape(-1, k + 2).T
+    return y[0], y[1], y[2:]
+
+
+def _first_total(fA, fB, fAB):
+    """Saltelli (2010) first-order and Jansen total-order estimators;
+    fA, fB (..., n) and fAB (..., n) for one parameter."""
+
+    var = np.var(np.concatenate([fA, fB], axis=-1), axis=-1)
+    s1 = np.mean(fB * (fAB - fA), axis=-1) / var
+    st = 0.5 * np.mean((fA - fAB)**2, axis=-1) / var
+    return s1, st
+
+
+def sobol_indices(y, k, n_boot=1000, conf=0.95, boot_chunk=100):
+    """
+    First-order (S1) and total (ST) Sobol indices from the outputs of a
+    saltelli_design, with percentile bootstrap CIs over the base points.
+    Returns a dict of arrays (one entry per parameter).
+    """
+
+    fA, fB, fAB = _split(y, k)
+    n = len(fA)
+    alpha = (1 - conf) / 2 * 100
+
+    out = {key: np.empty(k) for key in
+           ('S1', 'S1_lo', 'S1_hi', 'ST', 'ST_lo', 'ST_hi')}
+
+    boot_idx = np.random.randint(0, n, size=(n_boot, n))
+
+    for i in range(k):
+        out['S1'][i], out['ST'][i] = _first_total(fA, fB, fAB[i])
+
+        s1_boot, st_boot = [], []
+        for b in range(0, n_boot, boot_chunk):
+            idx = boot_idx[b:b + boot_chunk]
+            s1, st = _first_total(fA[idx], fB[idx], fAB[i][idx])
+            s1_boot.append(s1)
+            st_boot.append(st)
+
+        out['S1_lo'][i], out['S1_hi'][i] = np.percentile(
+            np.concatenate(s1_boot), [alpha, 100 - alpha])
+        out['ST_lo'][i], out['ST_hi'][i] = np.percentile(
+            np.concatenate(st_boot), [alpha, 100 - alpha])
+
+    return out
+
+
+def run_sensitivity_analysis(calibrated_params, bounds=None, policy=None,
+                             n_base=1024, n_reps=4, n_boot=1000,
+                             executor=None, sampling=None):
+    """
+    Sobol sensitivity of the mean outbreak size under `policy` (default:
+    exclusion + hygiene) to the parameters in `bounds` (default SA_BOUNDS;
+    parameters not varied stay at their calibrated values).
+
+    Returns dict with names, X, sizes (design points x n_reps), Y (point
+    means), indices (DataFrame) and noise_share.
+    """
+
+    import pandas as pd
+    from tqdm import tqdm
+
+    bounds = SA_BOUNDS if bounds is None else bounds
+    policy = SA_POLICY if policy is None else policy
+    base_params = dict(calibrated_params, **policy)
+
+    names, X = saltelli_design(bounds, n_base)
+    k = len(names)
+
+    print("\n" + "="*70)
+    print(" GLOBAL SENSITIVITY ANALYSIS (SOBOL / SALTELLI) ")
+    print("="*70)
+    print(f"{k} parameters, {len(X) // (k + 2)} base points, "
+          f"{len(X)} design points x {n_reps} runs")
+
+    pbar = tqdm(total=len(X), desc="Sensitivity design")
+    sizes = evaluate_design('policy', base_params, names, X, n_reps,
+                            executor=executor, progress=pbar.update,
+                            sampling=sampling, common=k + 2)
+    pbar.close()
+
+    Y = sizes.mean(axis=1)
+    idx = sobol_indices(Y, k, n_boot=n_boot)
+
+    noise_share = np.nan
+    if n_reps > 1:
+        noise = np.mean(np.var(sizes, axis=1, ddof=1)) / n_reps
+        noise_share = float(noise / np.var(Y))
+
+    indices = pd.DataFrame({'Parameter': names,
+                            'Low': [bounds[n][0] for n in names],
+                            'High': [bounds[n][1] for n in names],
+                            **idx})
+
+    print("\n" + indices.to_string(index=False, float_format="%.3f"))
+    print(f"\nMonte Carlo noise share of output variance: {noise_share:.3f}")
+
+    return {'names': names, 'X': X, 'sizes': sizes, 'Y': Y,
+            'indices': indices, 'noise_share': noise_share}
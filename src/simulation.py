@@ -1,6 +1,91 @@
 
 import numpy as np
 
+# Restaurant configuration tables: (values, probabilities)
+FOOD_HANDLERS_TABLE = (np.array([3, 4, 5, 6, 7]),
+                       np.array([0.1, 0.2, 0.4, 0.2, 0.1]))
+OTHER_STAFF_TABLE = (np.array([3, 4, 5, 6]),
+                     np.array([0.2, 0.3, 0.3, 0.2]))
+INIT_INFECTED_TABLE = (np.array([1, 2, 3]),
+                       np.array([0.6, 0.3, 0.1]))
+PATRONS_TABLE = (np.array([100, 125, 150, 175, 200]),
+                 np.array([0.2, 0.2, 0.3, 0.2, 0.1]))
+
+# Channels of the optional per-day trajectory (days x channels, int32):
+# new staff infections (initial cases on day 0), patrons infected by food
+# handlers, by other staff, and by food contamination events
+TRAJECTORY_CHANNELS = ['staff', 'handler_patron', 'other_patron', 'food']
+
+def configuration_grid():
+    """
+    Joint restaurant configuration grid with exact probabilities (product of
+    the tables), ordered by (init_infected, n_food_handlers,
+    patrons_per_shift, n_other_staff) so low/high CDF positions are
+    small/large-outbreak configurations.
+    Returns dict of arrays: n_food_handlers, n_other_staff, init_infected,
+    patrons_per_shift, prob.
+    """
+
+    ii, fh, pa, os_ = np.meshgrid(np.arange(len(INIT_INFECTED_TABLE[0])),
+                                  np.arange(len(FOOD_HANDLERS_TABLE[0])),
+                                  np.arange(len(PATRONS_TABLE[0])),
+                                  np.arange(len(OTHER_STAFF_TABLE[0])),
+                                  indexing='ij')
+    ii, fh, pa, os_ = ii.ravel(), fh.ravel(), pa.ravel(), os_.ravel()
+
+    return {
+        'n_food_handlers': FOOD_HANDLERS_TABLE[0][fh],
+        'n_other_staff': OTHER_STAFF_TABLE[0][os_],
+        'init_infected': INIT_INFECTED_TABLE[0][ii],
+        'patrons_per_shift': PATRONS_TABLE[0][pa],
+        'prob': (INIT_INFECTED_TABLE[1][ii] * FOOD_HANDLERS_TABLE[1][fh] *
+                 PATRONS_TABLE[1][pa] * OTHER_STAFF_TABLE[1][os_]),
+    }
+
+CONFIG_GRID = configuration_grid()
+CONFIG_CDF = np.cumsum(CONFIG_GRID['prob'])
+CONFIG_CDF[-1] = 1.0
+
+def sample_configurations(n, method='stratified', antithetic=False):
+    """
+    n restaurant configurations from the joint grid via inverse CDF.
+
+    method='random'     - iid uniforms (same distribution as the simulators)
+    method='stratified' - one uniform in each of n equal strata of the
+                          joint CDF, so every configuration appears in
+                          proportion to its exact probability
+    antithetic=True     - uniforms come in pairs (u, 1 - u); when
+                          stratified, the pair is mirrored inside each of
+                          ceil(n/2) strata. For odd n one of the 2 *
+                          ceil(n/2) draws, chosen at random, is dropped,
+                          so no stratum or mirror side is favoured
+
+    Every draw has weight 1 (the scheme is self-weighting), so plain
+    means / percentiles of the resulting sizes stay unbiased.
+    Returns dict of arrays usable as simulator kwargs per draw.
+    """
+
+    m = (n + 1) // 2 if antithetic else n
+    v = np.random.rand(m)
+
+    if method == 'stratified':
+        u = (np.arange(m) + v) / m
+        mirror = (np.arange(m) + 1 - v) / m
+    elif method == 'random':
+        u = v
+        mirror = 1 - v
+    else:
+        raise ValueError(f"unknown sampling method: {method}")
+
+    if antithetic:
+        u = np.concatenate([u, mirror])
+        if len(u) > n:
+            u = np.delete(u, np.random.randint(len(u)))
+
+    idx = np.minimum(np.searchsorted(CONFIG_CDF, u, side='right'),
+                     len(CONFIG_CDF) - 1)
+    return {k: v[idx] for k, v in CONFIG_GRID.items() if k != 'prob'}
+
 def simulate_restaurant_outbreak_v3(
         n_food_handlers=None, n_other_staff=None, init_infected=None,
         patrons_per_shift=None, shift_hours=8, shifts_per_day=2,
@@ -8,18 +93,25 @@ def simulate_restaurant_outbreak_v3(
         infectious_period=3.0, prob_symptomatic=0.7,
         beta_staff_staff=0.1, beta_handler_patron=0.02,
         beta_other_patron=0.001, prob_food_contamination=0.15,
-        contamination_size_mean=45, contamination_size_std=30):
+        contamination_size_mean=45, contamination_size_std=30,
+        trajectory=None):
+
+    # trajectory: optional (max_days, 4) int array; daily new infections
+    # per TRAJECTORY_CHANNELS are added to it (same random stream)
 
     # Random restaurant configuration if not specified
     if n_food_handlers is None:
-        n_food_handlers = np.random.choice([3,4,5,6,7], p=[0.1,0.2,0.4,0.2,0.1])
+        n_food_handlers = np.random.choice(FOOD_HANDLERS_TABLE[0],
+                                           p=FOOD_HANDLERS_TABLE[1])
     if n_other_staff is None:
-        n_other_staff = np.random.choice([3,4,5,6], p=[0.2,0.3,0.3,0.2])
+        n_other_staff = np.random.choice(OTHER_STAFF_TABLE[0],
+                                         p=OTHER_STAFF_TABLE[1])
     if init_infected is None:
-        init_infected = np.random.choice([1,2,3], p=[0.6,0.3,0.1])
+        init_infected = np.random.choice(INIT_INFECTED_TABLE[0],
+                                         p=INIT_INFECTED_TABLE[1])
     if patrons_per_shift is None:
-        patrons_per_shift = np.random.choice([100,125,150,175,200],
-                                             p=[0.2,0.2,0.3,0.2,0.1])
+        patrons_per_shift = np.random.choice(PATRONS_TABLE[0],
+                                             p=PATRONS_TABLE[1])
 
     total_staff = n_food_handlers + n_other_staff
     staff_states = ['S'] * total_staff
@@ -34,6 +126,8 @@ def simulate_restaurant_outbreak_v3(
 
     staff_inf_count = init_infected
     pat_inf = 0
+    if trajectory is not None:
+        trajectory[0, 0] += init_infected
 
     # Daily simulation
     for day in range(max_days):
@@ -60,6 +154,8 @@ def simulate_restaurant_outbreak_v3(
                     staff_states[s] = 'E'
                     staff_infection_day[s] = day + np.random.uniform(0,1)
                     staff_inf_count += 1
+                    if trajectory is not None:
+                        trajectory[day, 0] += 1
                     break
 
         # Staff-to-patron transmission
@@ -79,12 +175,18 @@ def simulate_restaurant_outbreak_v3(
 
             # Handler → patron
             for hh in inf_handlers:
-                pat_inf += np.random.binomial(patrons_per_handler, beta_handler_patron)
+                k = np.random.binomial(patrons_per_handler, beta_handler_patron)
+                pat_inf += k
+                if trajectory is not None:
+                    trajectory[day, 1] += k
 
             # Other staff → patron
             if len(inf_other)>0:
-                pat_inf += np.random.binomial(patrons_per_shift,
-                                              beta_other_patron*len(inf_other))
+                k = np.random.binomial(patrons_per_shift,
+                                       beta_other_patron*len(inf_other))
+                pat_inf += k
+                if trajectory is not None:
+                    trajectory[day, 2] += k
 
             # Food contamination event
             if len(inf_handlers)>0:
@@ -94,5 +196,7 @@ def simulate_restaurant_outbreak_v3(
                     sizee = int(np.random.lognormal(mu, sig))
                     sizee = max(10, min(sizee, int(patrons_per_shift*0.9)))
                     pat_inf += sizee
+                    if trajectory is not None:
+                        trajectory[day, 3] += sizee
 
     return staff_inf_count + pat_inf
@@ -0,0 +1,263 @@
+"""
+Streaming simulation
+
+stream_sizes() yields outbreak sizes in chunks instead of building one
+(N,) array, so memory and the time to the first result no longer grow
+with N. Chunks are sized to a memory budget that covers every chunk in
+flight (queued on the workers plus the one being consumed), which makes
+10^8-draw scenarios possible on modest nodes.
+
+Draws are seeded per block of STREAM_BLOCK outbreaks, and a chunk is a
+run of whole blocks, so a stream gives the same sizes for any memory
+budget and any number of workers.
+
+Consumers work chunk by chunk:
+
+  - size_counts / count_stats / count_percentiles: exact summaries from
+    an integer histogram (percentiles match np.percentile)
+  - calibration.score_stream: calibration score of a stream
+  - results_store.save_streams: write streams to a stored run
+  - run_streaming_policy_analysis: policy scenarios as histograms,
+    optionally also stored raw
+  - size_summary: histogram summaries the figures draw from (box
+    plot statistics, CDFs, quantiles), for samples of any size
+"""
+
+from collections import deque
+
+import numpy as np
+
+from worker import executor_workers, simulate_sizes
+
+
+STREAM_BLOCK = 1000             # outbreaks per seed block
+MEMORY_BUDGET = 256 * 2**20     # bytes for all chunks in flight
+BYTES_PER_DRAW = 48             # int64 result + the worker's list of ints
+
+
+def chunk_draws(memory_budget=MEMORY_BUDGET, in_flight=1):
+    """Draws per chunk so that in_flight + 1 chunks fit the budget."""
+    n = memory_budget // ((in_flight + 1) * BYTES_PER_DRAW)
+    return max(STREAM_BLOCK, n // STREAM_BLOCK * STREAM_BLOCK)
+
+
+def block_seed(base, i):
+    """Seed of block i (same as task_seeds' i-th seed for this base)."""
+    ss = np.random.SeedSequence(base, spawn_key=(i,))
+    return int(ss.generate_state(1)[0])
+
+
+def _stream_task(task):
+    kind, params, start, n, base, sampling = task
+    out = np.empty(n, dtype=np.int64)
+    for offset in range(0, n, STREAM_BLOCK):
+        m = min(STREAM_BLOCK, n - offset)
+        seed = block_seed(base, (start + offset) // STREAM_BLOCK)
+        out[offset:offset + m] = simulate_sizes(kind, params, m, seed,
+                                                sampling)
+    return out
+
+
+def stream_sizes(kind, params, n, executor=None, sampling=None,
+                 memory_budget=MEMORY_BUDGET):
+    """
+    Yield n outbreak sizes from the 'baseline' or 'policy' simulator as
+    int64 chunks, in order. With an executor, at most 2 chunks per
+    worker are queued at a time.
+    """
+
+    base = np.random.randint(0, 2**31 - 1)
+
+    if executor is None:
+        step = chunk_draws(memory_budget)
+        for start in range(0, n, step):
+            yield _stream_task((kind, params, start, min(step, n - start),
+                                base, sampling))
+        return
+
+    window = 2 * executor_workers(executor)
+    step = chunk_draws(memory_budget, window)
+    starts = iter(range(0, n, step))
+    pending = deque()
+
+    def submit():
+        start = next(starts, None)
+        if start is not None:
+            pending.append(executor.submit(
+                _stream_task,
+                (kind, params, start, min(step, n - start), base, sampling)))
+
+    for _ in range(window):
+        submit()
+    while pending:
+        chunk = pending.popleft().result()
+        submit()
+        yield chunk
+
+
+# HISTOGRAM SUMMARIES
+#
+# Outbreak sizes are small non-negative integers, so a bincount is an
+# exact, fixed-size summary of any number of draws.
+
+def accumulate_counts(counts, sizes):
+    """Add a chunk of sizes to a histogram (grown as needed)."""
+
+    new = np.bincount(sizes)
+    if counts is None:
+        return new
+    if len(new) > len(counts):
+        new[:len(counts)] += counts
+        return new
+    counts[:len(new)] += new
+    return counts
+
+
+def size_counts(chunks):
+    """Histogram of all sizes in an iterable of chunks."""
+
+    counts = None
+    for chunk in chunks:
+        counts = accumulate_counts(counts, chunk)
+    return np.zeros(1, dtype=np.int64) if counts is None else counts
+
+
+def count_percentiles(counts, q):
+    """np.percentile (linear interpolation) of the sizes behind counts."""
+
+    q = np.asarray(q, dtype=float)
+    cum = np.cumsum(counts)
+    pos = q / 100 * (cum[-1] - 1)
+    lo = np.floor(pos).astype(np.int64)
+    frac = pos - lo
+    x_lo = np.searchsorted(cum, lo, side='right')
+    x_hi = np.searchsorted(cum, np.minimum(lo + 1, cum[-1] - 1),
+                           side='right')
+    return x_lo + frac * (x_hi - x_lo)
+
+
+def count_stats(counts):
+    """Runs, mean, std, median and 25/75/95th percentiles from counts."""
+
+    values = np.arange(len(counts))
+    n = counts.sum()
+    mean = (values * counts).sum() / n
+    p25, median, p75, p95 = count_percentiles(counts, [25, 50, 75, 95])
+    return {
+        'runs': int(n),
+        'mean': mean,
+        'median': median,
+        'std': np.sqrt((counts * (values - mean)**2).sum() / n),
+        'p25': p25,
+        'p75': p75,
+        'p95': p95,
+    }
+
+
+def count_mean(counts):
+    return (np.arange(len(counts)) * counts).sum() / counts.sum()
+
+
+def count_std(counts):
+    values = np.arange(len(counts))
+    mean = count_mean(counts)
+    return np.sqrt((counts * (values - mean)**2).sum() / counts.sum())
+
+
+def count_exceed(counts, threshold):
+    """Share of sizes above threshold."""
+    return counts[int(threshold) + 1:].sum() / counts.sum()
+
+
+def count_values(counts):
+    """(sizes that occur, their counts): weighted sample for ax.hist."""
+    values = np.flatnonzero(counts)
+    return values, counts[values]
+
+
+def count_cdf(counts):
+    """(sizes that occur, CDF at each); plot with drawstyle='steps-post'."""
+    values, weights = count_values(counts)
+    return values, np.cumsum(weights) / counts.sum()
+
+
+def count_bxp(counts, label=None, whis=1.5):
+    """Box plot statistics for ax.bxp, as matplotlib's boxplot computes
+    them from the raw sample (fliers: each outlying size once)."""
+
+    q1, med, q3 = count_percentiles(counts, [25, 50, 75])
+    iqr = q3 - q1
+    values = np.flatnonzero(counts)
+    inside = values[(values >= q1 - whis * iqr) & (values <= q3 + whis * iqr)]
+    whislo, whishi = (inside[0], inside[-1]) if len(inside) else (q1, q3)
+    return {
+        'label': label, 'mean': count_mean(counts), 'med': med,
+        'q1': q1, 'q3': q3, 'iqr': iqr,
+        'whislo': min(whislo, q1), 'whishi': max(whishi, q3),
+        'fliers': values[(values < whislo) | (values > whishi)],
+    }
+
+
+# SAMPLE SUMMARIES
+#
+# The figures take either raw outbreak-size samples or size summaries
+# ({'counts': histogram}): a summary is exact for integer sizes, and
+# its size depends on the largest outbreak, not on the number of draws.
+
+def size_summary(data):
+    """Size summary of a sample of sizes (summaries pass through)."""
+    if isinstance(data, dict):
+        return data
+    return {'counts': np.bincount(np.asarray(data, dtype=np.int64))}
+
+
+def size_summaries(samples):
+    """size_summary of every entry of a {name: sample} dict."""
+    return {name: size_summary(data) for name, data in samples.items()}
+
+
+def _tee_counts(chunks, hist):
+    for chunk in chunks:
+        hist[0] = accumulate_counts(hist[0], chunk)
+        yield chunk
+
+
+# POLICY SCENARIOS
+
+def run_streaming_policy_analysis(calibrated_params, N_runs, specs=None,
+                                  executor=None, sampling=None,
+                                  memory_budget=MEMORY_BUDGET, run_dir=None):
+    """
+    Stream N_runs outbreaks per policy scenario ((name, description,
+    policy) tuples; default: the scenario registry) and return {name:
+    size histogram}. With run_dir, the raw sizes are also written to a
+    stored run as they arrive. Summarize with
+    policy_analysis.create_summary_table_from_counts.
+    """
+
+    from policy_analysis import policy_scenarios
+    from results_store import save_streams
+
+    specs = policy_scenarios() if specs is None else specs
+    hists = {}
+
+    def scenario_stream(name, desc, policy):
+        print(f"  Streaming {desc}: {N_runs:,} runs")
+        hist = hists.setdefault(name, [None])
+        yield from _tee_counts(
+            stream_sizes('policy', {**calibrated_params, **policy},
+                         N_runs, executor, sampling, memory_budget), hist)
+
+    if run_dir is None:
+        for spec in specs:
+            for _ in scenario_stream(*spec):
+                pass
+    else:
+        save_streams(run_dir, {
+            spec[0]: (N_runs, scenario_stream(*spec)) for spec in specs
+        }, metadata={'kind': 'policy_stream',
+                     'params': calibrated_params, 'n_runs': N_runs,
+                     'sampling': sampling,
+                     'scenarios': [list(spec) for spec in specs]})
+
+    return {name: h[0] for name, h in hists.items()}
@@ -0,0 +1,230 @@
+"""
+Surrogate-assisted calibration
+
+calibrate_model scores every cell of a fixed grid, each with n_sims
+simulations. Here a cheap emulator of the score surface (a Gaussian
+process or a quadratic response surface, fit on the unit cube) decides
+where to simulate next:
+
+  1. score an initial Sobol design of n_init points
+  2. fit the surrogate; pick a batch of points with the largest expected
+     improvement among quasi-random + local candidates
+  3. score the batch in parallel, refit, repeat for n_iter rounds
+  4. return the point with the best posterior mean, re-simulated with
+     n_final runs (same return values as calibrate_model)
+
+The cost grows with n_init + n_iter * batch instead of the product of
+grid sizes, so extra parameters (EXTRA_BOUNDS: latent_period,
+infectious_period, prob_symptomatic) can be calibrated too.
+"""
+
+import numpy as np
+
+from calibration import calculate_score, score_rows, simulate_grid
+from worker import release_buffer, simulate_sizes, task_seeds
+from parameter_space import normalize_space, to_values, to_params
+
+
+# Same ranges as the calibrate_model grid
+CALIBRATION_BOUNDS = {
+    'beta_handler_patron': (0.015, 0.035),
+    'prob_food_contamination': (0.10, 0.22),
+    'contamination_size_mean': (35, 65),
+    'beta_staff_staff': (0.01, 0.2),
+}
+
+EXTRA_BOUNDS = {
+    'latent_period': (0.5, 2.0),
+    'infectious_period': (1.5, 5.0),
+    'prob_symptomatic': (0.4, 0.9),
+}
+
+FIXED_PARAMS = {'contamination_size_std': 30}
+
+
+# SURROGATES
+#
+# Both models take inputs on the unit cube and return predict(U) ->
+# (mean, sd) in score units, where sd is the uncertainty of the mean
+# score surface (not of a single noisy evaluation).
+
+def _matern52(A, B, lengths):
+    d = np.sqrt(np.maximum(
+        (((A[:, None, :] - B[None, :, :]) / lengths)**2).sum(-1), 0))
+    s = np.sqrt(5) * d
+    return (1 + s + s**2 / 3) * np.exp(-s)
+
+
+def fit_gp(U, y, n_restarts=3):
+    """
+    GP with a Matern 5/2 ARD kernel and a noise term, hyperparameters by
+    maximum marginal likelihood (scores are standardized first).
+    """
+
+    from scipy.linalg import cho_factor, cho_solve
+    from scipy.optimize import minimize
+
+    n, d = U.shape
+    y_mean, y_sd = y.mean(), max(y.std(), 1e-12)
+    z = (y - y_mean) / y_sd
+
+    def unpack(theta):
+        return np.exp(theta[:d]), np.exp(theta[d]), np.exp(theta[d + 1])
+
+    def nll(theta):
+        lengths, amp, noise = unpack(theta)
+        K = amp * _matern52(U, U, lengths) + (noise + 1e-8) * np.eye(n)
+        try:
+            c = cho_factor(K, lower=True)
+        except np.linalg.LinAlgError:
+            return 1e10
+        alpha = cho_solve(c, z)
+        return 0.5 * z @ alpha + np.log(np.diag(c[0])).sum()
+
+    bounds = [(np.log(0.02), np.log(10))] * d + \
+             [(np.log(0.05), np.log(20)), (np.log(1e-4), np.log(2))]
+    starts = [np.r_[np.full(d, np.log(0.3)), 0.0, np.log(0.1)]]
+    for _ in range(n_restarts):
+        starts.append(np.array([np.random.uniform(lo, hi)
+                                for lo, hi in bounds]))
+
+    best = min((minimize(nll, x0, method='L-BFGS-B', bounds=bounds)
+                for x0 in starts), key=lambda r: r.fun)
+    lengths, amp, noise = unpack(best.x)
+
+    K = amp * _matern52(U, U, lengths) + (noise + 1e-8) * np.eye(n)
+    c = cho_factor(K, lower=True)
+    alpha = cho_solve(c, z)
+
+    def predict(V):
+        Ks = amp * _matern52(V, U, lengths)
+        mu = Ks @ alpha
+        var = amp - np.einsum('ij,ji->i', Ks, cho_solve(c, Ks.T))
+        return (y_mean + y_sd * mu,
+                y_sd * np.sqrt(np.maximum(var, 1e-12)))
+
+    return predict
+
+
+def _quadratic_features(U):
+    n, d = U.shape
+    cols = [np.ones(n)] + [U[:, i] for i in range(d)]
+    cols += [U[:, i] * U[:, j] for i in range(d) for j in range(i, d)]
+    return np.column_stack(cols)
+
+
+def fit_quadratic(U, y, ridge=1e-6):
+    """Full quadratic response surface by (lightly ridged) least squares."""
+
+    F = _quadratic_features(U)
+    A = F.T @ F + ridge * np.eye(F.shape[1])
+    coef = np.linalg.solve(A, F.T @ y)
+    dof = max(len(y) - F.shape[1], 1)
+    s2 = np.sum((y - F @ coef)**2) / dof
+    A_inv = np.linalg.inv(A)
+
+    def predict(V):
+        G = _quadratic_features(V)
+        var = s2 * np.einsum('ij,jk,ik->i', G, A_inv, G)
+        return G @ coef, np.sqrt(np.maximum(var, 1e-12))
+
+    return predict
+
+
+SURROGATES = {'gp': fit_gp, 'quadratic': fit_quadratic}
+
+
+def expected_improvement(mu, sd, best):
+    """EI for minimization."""
+    from scipy.stats import norm
+    imp = best - mu
+    z = imp / sd
+    return imp * norm.cdf(z) + sd * norm.pdf(z)
+
+
+def _select_batch(cand, ei, batch, min_dist):
+    """Greedy top-EI batch, skipping candidates too close to a chosen one."""
+
+    chosen = []
+    for i in np.argsort(-ei):
+        if all(np.linalg.norm(cand[i] - cand[j]) >= min_dist for j in chosen):
+            chosen.append(i)
+            if len(chosen) == batch:
+                break
+    return cand[chosen]
+
+
+# CALIBRATION
+
+def calibrate_surrogate(train_sizes, bounds=None, n_init=64, n_iter=12,
+                        batch=8, n_sims=300, n_final=500, model='gp',
+                        n_candidates=4096, desc="Surrogate calibration",
+                        executor=None, sampling=None):
+    """
+    Surrogate-assisted calibration over bounds (a parameter space, see
+    parameter_space.py; default CALIBRATION_BOUNDS). The surrogate works
+    on the unit cube of prior quantiles. Each evaluated point costs n_sims
+    simulations. Returns (best_params, best_sim, best_score) like
+    calibrate_model.
+    """
+
+    from scipy.stats import qmc
+
+    space = normalize_space(CALIBRATION_BOUNDS if bounds is None else bounds)
+    d = len(space)
+    fixed = {k: v for k, v in FIXED_PARAMS.items() if k not in space}
+    fit = SURROGATES[model]
+
+    def cell(u):
+        return to_params(space, to_values(space, u[None])[0], fixed)
+
+    def evaluate(U):
+        spec, sims = simulate_grid([cell(u) for u in U], n_sims,
+                                   executor, sampling=sampling)
+        scores = score_rows(train_sizes, sims)
+        del sims
+        release_buffer(spec)
+        return scores
+
+    def sobol(n):
+        m = int(np.ceil(np.log2(max(n, 2))))
+        return qmc.Sobol(d=d, scramble=True,
+                         seed=np.random.randint(0, 2**31 - 1)).random_base2(m)
+
+    print(f"{desc}: {d} parameters, {model} surrogate, "
+          f"{n_init} + {n_iter} x {batch} points x {n_sims} sims")
+
+    U = sobol(n_init)[:n_init]
+    y = evaluate(U)
+
+    for it in range(n_iter):
+        predict = fit(U, y)
+        best_mu = predict(U)[0].min()
+
+        # Global quasi-random candidates + local ones around the best
+        u_best = U[np.argmin(predict(U)[0])]
+        local = np.clip(u_best + 0.05 * np.random.randn(n_candidates // 4, d),
+                        0, 1)
+        cand = np.vstack([sobol(n_candidates), local])
+
+        mu, sd = predict(cand)
+        ei = expected_improvement(mu, sd, best_mu)
+        new = _select_batch(cand, ei, batch, min_dist=0.02 * np.sqrt(d))
+
+        U = np.vstack([U, new])
+        y = np.concatenate([y, evaluate(new)])
+        print(f"  round {it + 1}/{n_iter}: best observed {y.min():.3f}, "
+              f"best predicted {best_mu:.3f}")
+
+    # Best posterior mean among evaluated points, re-simulated
+    predict = fit(U, y)
+    best_u = U[np.argmin(predict(U)[0])]
+    best_params = cell(best_u)
+    best_sim = simulate_sizes('baseline', best_params, n_final,
+                              seed=task_seeds(1)[0], sampling=sampling)
+    best_score = calculate_score(train_sizes, best_sim)
+
+    print(f"  {len(y)} points evaluated ({len(y) * n_sims} simulations), "
+          f"final score {best_score:.3f}")
+
+    return best_params, best_sim, best_score
@@ -1,20 +1,23 @@
 
 import numpy as np
-import pandas as pd
-from tqdm import tqdm
 
-from simulation import simulate_restaurant_outbreak_v3
+from worker import (imap_into_buffer, release_buffer, result_buffer,
+                    simulate_sizes, task_seeds)
 from calibration import (
     calculate_score,
-    calibrate_fast_for_kfold,
-    calibrate_model
+    calibrate_model,
+    calibrate_design,
+    kfold_cells,
+    score_rows
 )
+from surrogate import calibrate_surrogate
 
-def step1_kfold_validation(all_sizes, k=5):
+KFOLD_SIMS = 200     # draws per grid cell and per fold test simulation
 
-    print("="*70)
-    print(" STEP 1: K-FOLD (FAST GRID) ")
-    print("="*70)
+
+def stratified_folds(all_sizes, k):
+    """k folds of indices, stratified by size quintile (shuffled with the
+    global RNG)."""
 
     # Compute bins
     bins = np.percentile(all_sizes, [0,20,40,60,80,100])
@@ -41,45 +44,114 @@ def step1_kfold_validation(all_sizes, k=5):
             end = (i+1)*seg if i < k-1 else size
             folds[i].extend(group[start:end])
 
-    results = []
-
-    # Evaluate folds
-    for fold in range(k):
-
-        test_idx = np.array(folds[fold])
-        train_idx = np.array([x for i,f in enumerate(folds) if i != fold for x in f])
-
-        train_vals = all_sizes[train_idx]
-        test_vals  = all_sizes[test_idx]
-
-        print("\nFold", fold+1)
-
-        # Fast calibration
-        par, train_sc = calibrate_fast_for_kfold(train_vals)
-
-        out = np.array([
-            simulate_restaurant_outbreak_v3(**par)
-            for _ in range(200)
-        ])
-
-        test_sc = calculate_score(test_vals, out)
-        ratio = test_sc/train_sc
-
-        print(" train_score:", train_sc)
-        print(" test_score:", test_sc)
-        print(" ratio:", ratio)
+    return folds
+
+
+def fold_seeds(base, n_folds, n_cells):
+    """Per fold: n_cells grid seeds and a test seed, from the fold's own
+    SeedSequence child, so a fold's results do not depend on k, on the
+    order folds finish in or on the number of workers."""
+
+    seeds = []
+    for child in np.random.SeedSequence(base).spawn(n_folds):
+        s = [int(c.generate_state(1)[0]) for c in child.spawn(n_cells + 1)]
+        seeds.append((s[:-1], s[-1]))
+    return seeds
+
+
+def evaluate_folds(all_sizes, folds, executor=None, sampling=None,
+                   n_sims=KFOLD_SIMS):
+    """
+    Fast-grid calibration and test score of every fold, run as one job:
+    the grid cells of all folds go to the executor together (one worker
+    budget, no pool per fold), and each fold's test simulation is
+    submitted as soon as its grid is scored. Returns the fold results in
+    fold order.
+    """
+
+    cells = kfold_cells()
+    sims_cells = [dict(cell, contamination_size_std=30) for cell in cells]
+    n = len(cells)
+    seeds = fold_seeds(np.random.randint(0, 2**31 - 1), len(folds), n)
+
+    spec, sims = result_buffer((len(folds) * n, n_sims), executor)
+    tasks = [
+        (f * n + i, 0, 'baseline', cell, n_sims, grid_seeds[i], sampling)
+        for f, (grid_seeds, _) in enumerate(seeds)
+        for i, cell in enumerate(sims_cells)
+    ]
+
+    fits, tests = [], []
+    for row in imap_into_buffer(tasks, spec, sims, executor):
+        if (row + 1) % n:
+            continue
+        f = row // n
+        train_idx = np.array([x for i, fold in enumerate(folds) if i != f
+                              for x in fold])
+        scores = score_rows(all_sizes[train_idx], sims[f * n:(f + 1) * n])
+        best = int(np.argmin(scores))
+        fits.append((cells[best], scores[best]))
+
+        test = ('baseline', cells[best], n_sims, seeds[f][1], sampling)
+        tests.append(simulate_sizes(*test) if executor is None else
+                     executor.submit(simulate_sizes, *test))
+
+    del sims
+    release_buffer(spec)
 
+    results = []
+    for f, ((par, train_sc), out) in enumerate(zip(fits, tests)):
+        if executor is not None:
+            out = out.result()
+        test_sc = calculate_score(all_sizes[np.array(folds[f])], out)
         results.append({
-            'fold': fold+1,
+            'fold': f+1,
             'train_score': train_sc,
             'test_score': test_sc,
-            'ratio': ratio,
+            'ratio': test_sc/train_sc,
             'params': par
         })
+    return results
+
+
+def step1_kfold_validation(all_sizes, k=5, executor=None, sampling=None):
+
+    print("="*70)
+    print(" STEP 1: K-FOLD (FAST GRID) ")
+    print("="*70)
+
+    folds = stratified_folds(all_sizes, k)
+    results = evaluate_folds(all_sizes, folds, executor, sampling)
+
+    for r in results:
+        print("\nFold", r['fold'])
+        print(" train_score:", r['train_score'])
+        print(" test_score:", r['test_score'])
+        print(" ratio:", r['ratio'])
 
     return results, np.mean([r['ratio'] for r in results]), np.std([r['ratio'] for r in results])
 
-def step2_holdout_validation(all_sizes):
+def _calibrate(train_vals, n_sims, desc, executor, sampling, method,
+               options=None):
+    """
+    Full calibration by grid search ('grid'), a quasi-random design over
+    a parameter space ('design') or surrogate-assisted search
+    ('surrogate'); options are passed on to the calibrator.
+    """
+    options = options or {}
+    if method == 'surrogate':
+        return calibrate_surrogate(train_vals, n_final=n_sims, desc=desc,
+                                   executor=executor, sampling=sampling,
+                                   **options)
+    if method == 'design':
+        return calibrate_design(train_vals, n_sims=n_sims, desc=desc,
+                                executor=executor, sampling=sampling,
+                                **options)
+    return calibrate_model(train_vals, n_sims=n_sims, desc=desc,
+                           executor=executor, sampling=sampling)
+
+def step2_holdout_validation(all_sizes, executor=None, sampling=None,
+                             method='grid', options=None):
 
     print("\n" + "="*70)
     print(" STEP 2: HOLDOUT (FULL GRID) ")
@@ -91,27 +163,27 @@ def step2_holdout_validation(all_sizes):
     train_vals = all_sizes[shuf[:n_train]]
     test_vals  = all_sizes[shuf[n_train:]]
 
-    par, sim_train, train_sc = calibrate_model(train_vals, n_sims=300,
-                                               desc="Holdout calibration")
+    par, sim_train, train_sc = _calibrate(train_vals, 300,
+                                          "Holdout calibration",
+                                          executor, sampling, method, options)
 
-    out = np.array([
-        simulate_restaurant_outbreak_v3(**par)
-        for _ in tqdm(range(300))
-    ])
+    out = simulate_sizes('baseline', par, 300, seed=task_seeds(1)[0],
+                         sampling=sampling)
 
     test_sc = calculate_score(test_vals, out)
     ratio = test_sc/train_sc
 
     return par, sim_train, train_vals, out, test_vals, ratio
 
-def step3_full_calibration(all_sizes):
+def step3_full_calibration(all_sizes, executor=None, sampling=None,
+                           method='grid', options=None):
 
     print("\n" + "="*70)
     print(" STEP 3: FULL CALIBRATION ")
     print("="*70)
 
-    par, sim_sizes, sc = calibrate_model(all_sizes, n_sims=500,
-                                         desc="Full calibration")
+    par, sim_sizes, sc = _calibrate(all_sizes, 500, "Full calibration",
+                                    executor, sampling, method, options)
 
     print("\nFinal parameters:")
     for kk,vv in par.items():
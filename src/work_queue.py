@@ -0,0 +1,380 @@
+"""
+Filesystem work queue
+
+A concurrent.futures executor for several nodes that share a directory
+and nothing else (no broker). Anything that takes an executor, e.g.
+calibrate_model and run_comprehensive_policy_analysis, runs on it:
+
+    executor = WorkQueueExecutor('/shared/queue', n_local=8)
+    calibrate_model(sizes, executor=executor)
+
+and on every other node:
+
+    python3 work_queue.py /shared/queue --engine python
+
+The queue directory holds one pickled file per work unit (a function
+and a batch of argument tuples, as in executor.map with chunksize):
+
+    pending/<job>-<seq>.<attempt>.pkl   waiting for a worker
+    leased/<job>-<seq>.<attempt>.pkl    claimed by a worker
+    done/<job>-<seq>.pkl                results (or the error) of a unit
+    tmp/                                files being written
+
+Every move is an atomic rename within the shared filesystem, so exactly
+one worker wins each unit. A worker heartbeats by touching its leased
+file; the submitter re-queues a unit (attempt + 1) when that file's
+mtime has not moved for `lease` seconds of the submitter's own clock (so
+node clocks need not agree), and gives up after max_attempts. A unit
+that was re-queued but finishes twice is harmless: task seeds are part
+of the arguments, so both copies give the same result and the first is
+used.
+
+Units carry their seeds, and results are returned in order like
+ProcessPoolExecutor.map, so a run gives the same results with N local
+processes (n_local=N, the stand-in for N nodes) as on N nodes or on the
+warm pool. Workers here cannot attach to the submitter's shared memory,
+so buffered runs (worker.result_buffer) fall back to returning arrays
+that the submitter writes into its buffer, and from there into the
+results store as usual.
+"""
+
+import os
+import sys
+import time
+import glob
+import pickle
+import secrets
+import threading
+import subprocess
+import traceback
+from concurrent.futures import Executor, Future
+
+from worker import (ENGINES, blas_thread_env, get_engine, init_worker,
+                    set_engine)
+
+
+LEASE = 60.0          # seconds without a heartbeat before a re-queue
+POLL = 0.2            # seconds between directory scans
+MAX_ATTEMPTS = 3      # leases per unit before it fails
+
+SUBDIRS = ['pending', 'leased', 'done', 'tmp']
+
+
+def _write_atomic(path, obj, tmp_dir):
+    tmp = os.path.join(tmp_dir, f"{os.path.basename(path)}.{os.getpid()}."
+                                f"{secrets.token_hex(4)}")
+    with open(tmp, 'wb') as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def _unit_name(filename):
+    """'<job>-<seq>' from '<job>-<seq>.<attempt>.pkl' or '<job>-<seq>.pkl'."""
+    return filename.split('.')[0]
+
+
+def _attempt(filename):
+    return int(filename.split('.')[1])
+
+
+def init_queue(queue_dir):
+    for sub in SUBDIRS:
+        os.makedirs(os.path.join(queue_dir, sub), exist_ok=True)
+
+
+# WORKER
+
+def _heartbeat(path, interval, stop):
+    while not stop.wait(interval):
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return   # lease expired and the unit was re-queued
+
+
+def _run_unit(engine, fn, items):
+    set_engine(engine)
+    return [fn(*args) for args in items]
+
+
+def claim(queue_dir):
+    """Lease the oldest pending unit. Returns its leased path or None."""
+
+    pending = os.path.join(queue_dir, 'pending')
+    for name in sorted(os.listdir(pending)):
+        path = os.path.join(queue_dir, 'leased', name)
+        try:
+            os.rename(os.path.join(pending, name), path)
+        except FileNotFoundError:
+            continue   # another worker was faster
+        os.utime(path)
+        return path
+    return None
+
+
+def run_worker(queue_dir, engine='python', lease=LEASE, idle_timeout=None,
+               parent=None):
+    """
+    Serve work units from queue_dir until a 'stop' file appears in it,
+    no unit arrived for idle_timeout seconds, or (local workers) the
+    parent process is gone. Returns the number of units run.
+    """
+
+    init_queue(queue_dir)
+    init_worker(engine)
+    tmp_dir = os.path.join(queue_dir, 'tmp')
+    done, idle_since, wait = 0, time.time(), POLL
+
+    while not os.path.exists(os.path.join(queue_dir, 'stop')):
+        if parent is not None and os.getppid() != parent:
+            break
+
+        path = claim(queue_dir)
+        if path is None:
+            if idle_timeout is not None and \
+                    time.time() - idle_since > idle_timeout:
+                break
+            time.sleep(wait)
+            wait = min(2 * wait, 1.0)
+            continue
+
+        stop = threading.Event()
+        beat = threading.Thread(target=_heartbeat,
+                                args=(path, lease / 4, stop), daemon=True)
+        beat.start()
+        try:
+            with open(path, 'rb') as f:
+                unit_engine, fn, items = pickle.load(f)
+            result = ('ok', _run_unit(unit_engine, fn, items))
+        except FileNotFoundError:
+            result = None   # re-queued before we could read it
+        except Exception as exc:
+            result = ('error', f"{type(exc).__name__}: {exc}\n"
+                               f"{traceback.format_exc()}")
+        finally:
+            stop.set()
+            beat.join()
+
+        name = os.path.basename(path)
+        if result is not None:
+            _write_atomic(os.path.join(queue_dir, 'done',
+                                       _unit_name(name) + '.pkl'),
+                          result, tmp_dir)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        done += 1
+        idle_since, wait = time.time(), POLL
+
+    return done
+
+
+# SUBMITTER
+
+class WorkQueueExecutor(Executor):
+    """
+    Executor over a shared queue directory. n_local worker processes
+    are started on this machine (0: rely on workers on other nodes);
+    workers is the total expected across nodes, used like a pool's
+    worker count to size chunks. Units run on the engine selected when
+    the executor was created.
+    """
+
+    shares_memory = False
+
+    def __init__(self, queue_dir, n_local=0, workers=None, lease=LEASE,
+                 max_attempts=MAX_ATTEMPTS, engine=None):
+
+        self.queue_dir = os.path.abspath(queue_dir)
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.engine = engine or get_engine()
+        self.max_workers = max(1, workers or n_local)
+        self._job = f"{int(time.time()):x}{secrets.token_hex(4)}"
+        self._seq = 0
+        self._futures = {}
+        self._seen = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self._collector = None
+        init_queue(self.queue_dir)
+
+        self._procs = [
+            subprocess.Popen([sys.executable, os.path.abspath(__file__),
+                              self.queue_dir, '--engine', self.engine,
+                              '--lease', str(lease),
+                              '--parent', str(os.getpid())],
+                             env=blas_thread_env())
+            for _ in range(n_local)
+        ]
+
+    def _submit_unit(self, fn, items):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("cannot submit after shutdown")
+            name = f"{self._job}-{self._seq:08d}"
+            self._seq += 1
+            future = Future()
+            self._futures[name] = future
+            _write_atomic(
+                os.path.join(self.queue_dir, 'pending', f"{name}.1.pkl"),
+                (self.engine, fn, items),
+                os.path.join(self.queue_dir, 'tmp'))
+            if self._collector is None:
+                self._collector = threading.Thread(target=self._collect,
+                                                   daemon=True)
+                self._collector.start()
+        return future
+
+    def submit(self, fn, *args, **kwargs):
+        if kwargs:
+            from functools import partial
+            fn = partial(fn, **kwargs)
+        unit = self._submit_unit(fn, [args])
+        future = Future()
+
+        def unwrap(f):
+            if f.exception() is not None:
+                future.set_exception(f.exception())
+            else:
+                future.set_result(f.result()[0])
+
+        unit.add_done_callback(unwrap)
+        return future
+
+    def map(self, fn, *iterables, timeout=None, chunksize=1):
+        items = list(zip(*iterables))
+        units = [self._submit_unit(fn, items[i:i + chunksize])
+                 for i in range(0, len(items), max(1, chunksize))]
+
+        def results():
+            end = None if timeout is None else time.monotonic() + timeout
+            for unit in units:
+                left = None if end is None else end - time.monotonic()
+                yield from unit.result(left)
+
+        return results()
+
+    # Collector thread: results in, expired leases back to pending
+
+    def _collect(self):
+        while True:
+            with self._lock:
+                if not self._futures:
+                    self._collector = None
+                    return
+            self._collect_done()
+            self._requeue_expired()
+            time.sleep(POLL)
+
+    def _resolve(self, name, result=None, error=None):
+        with self._lock:
+            future = self._futures.pop(name, None)
+        if future is None:
+            return
+        if error is not None:
+            future.set_exception(RuntimeError(error))
+        else:
+            future.set_result(result)
+
+    def _collect_done(self):
+        for path in glob.glob(os.path.join(self.queue_dir, 'done',
+                                           f"{self._job}-*.pkl")):
+            with open(path, 'rb') as f:
+                status, payload = pickle.load(f)
+            os.remove(path)
+            name = _unit_name(os.path.basename(path))
+            if status == 'ok':
+                self._resolve(name, payload)
+            else:
+                self._resolve(name, error=f"work unit {name} failed: "
+                                          f"{payload}")
+
+    def _requeue_expired(self):
+        now = time.monotonic()
+        seen = {}
+        for path in glob.glob(os.path.join(self.queue_dir, 'leased',
+                                           f"{self._job}-*.pkl")):
+            filename = os.path.basename(path)
+            try:
+                mtime = os.stat(path).st_mtime
+            except FileNotFoundError:
+                continue
+            first = self._seen.get(filename)
+            if first is None or first[0] != mtime:
+                seen[filename] = (mtime, now)
+                continue
+            seen[filename] = first
+            if now - first[1] < self.lease:
+                continue
+
+            # No heartbeat for a whole lease: the worker is gone
+            name, attempt = _unit_name(filename), _attempt(filename)
+            if attempt >= self.max_attempts:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                self._resolve(name, error=f"work unit {name} lost "
+                                          f"{attempt} leases")
+                continue
+            try:
+                os.rename(path, os.path.join(self.queue_dir, 'pending',
+                                             f"{name}.{attempt + 1}.pkl"))
+                print(f"  work queue: lease of {name} expired, "
+                      f"re-queued (attempt {attempt + 1})")
+            except FileNotFoundError:
+                pass
+            seen.pop(filename)
+        self._seen = seen
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        with self._lock:
+            self._closed = True
+            futures = list(self._futures.values())
+        if cancel_futures:
+            for future in futures:
+                future.cancel()
+        elif wait:
+            for future in futures:
+                future.exception()
+
+        for proc in self._procs:
+            proc.terminate()
+        for proc in self._procs:
+            proc.wait()
+        self._procs = []
+
+        # Units of this job that are left over (duplicates, cancelled)
+        for sub in SUBDIRS[:3]:
+            for path in glob.glob(os.path.join(self.queue_dir, sub,
+                                               f"{self._job}-*")):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+
+if __name__ == "__main__":
+
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Serve simulation work units from a shared queue "
+                    "directory (touch <queue_dir>/stop to end all workers)")
+    parser.add_argument("queue_dir")
+    parser.add_argument("--engine", default="python", choices=ENGINES)
+    parser.add_argument("--lease", type=float, default=LEASE,
+                        help="seconds without a heartbeat before a unit "
+                             "is re-queued (heartbeat every lease / 4)")
+    parser.add_argument("--idle-timeout", type=float, default=None,
+                        help="exit after this many idle seconds")
+    parser.add_argument("--parent", type=int, default=None,
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    n = run_worker(args.queue_dir, args.engine, args.lease,
+                   args.idle_timeout, args.parent)
+    if args.parent is None:
+        print(f"Worker done: {n} work units")
@@ -0,0 +1,639 @@
+"""
+Lightweight simulation worker
+
+Entry point for process-pool workers. It imports only numpy and the two
+simulators (never pandas / matplotlib / scipy / tqdm), so spawning a
+worker costs little more than starting the interpreter.
+
+One warm executor (get_executor) is shared by every pipeline stage:
+k-fold, holdout and full calibration and the policy analysis all submit
+(kind, params, n, seed) tasks to the same workers, which were started
+once with the simulators and configuration tables preloaded.
+
+Run directly to measure startup cost:
+    python3 worker.py
+"""
+
+import os
+import sys
+import time
+import subprocess
+
+import numpy as np
+
+from simulation import simulate_restaurant_outbreak_v3, sample_configurations
+from policy_simulation import simulate_outbreak_policy
+
+
+SIMULATORS = {
+    'baseline': simulate_restaurant_outbreak_v3,
+    'policy': simulate_outbreak_policy,
+}
+
+HEAVY_MODULES = ['pandas', 'matplotlib', 'scipy', 'tqdm', 'numba']
+
+# Simulation engine: the Python simulators, or the compiled batch kernel
+# (kernel.py, imported only when selected)
+ENGINES = ['python', 'kernel']
+_ENGINE = 'python'
+
+
+def set_engine(engine):
+    """Select the engine used by simulate_sizes in this process (the warm
+    pool passes it on to its workers)."""
+    global _ENGINE
+    if engine not in ENGINES:
+        raise ValueError(f"unknown engine {engine!r}; use one of {ENGINES}")
+    _ENGINE = engine
+
+
+def get_engine():
+    return _ENGINE
+
+
+def simulate_sizes(kind, params, n, seed=None, sampling=None,
+                   trajectories=None):
+    """
+    n outbreak sizes from the 'baseline' or 'policy' simulator.
+
+    sampling=None draws each restaurant configuration inside the simulator;
+    'stratified', 'antithetic' or 'stratified-antithetic' draws the n
+    configurations up front with simulation.sample_configurations.
+
+    trajectories: optional (n, max_days, 4) int array that receives each
+    outbreak's daily new infections per TRAJECTORY_CHANNELS.
+
+    With the 'kernel' engine (set_engine), draws the kernel supports run
+    as one compiled batch; the rest use the Python simulators.
+    """
+
+    if seed is not None:
+        np.random.seed(seed)
+
+    configs = draw_configurations(n, sampling)
+
+    if _ENGINE == 'kernel' and trajectories is None:
+        from kernel import simulate_kernel, supports
+        if supports(params):
+            return simulate_kernel(kind, params, n, seed, configs)
+
+    sim = SIMULATORS[kind]
+    if trajectories is not None:
+        sim = _with_trajectories(sim, trajectories)
+
+    if configs is None:
+        return np.array([sim(**params) for _ in range(n)])
+
+    return np.array([
+        sim(**params,
+            n_food_handlers=configs['n_food_handlers'][i],
+            n_other_staff=configs['n_other_staff'][i],
+            init_infected=configs['init_infected'][i],
+            patrons_per_shift=configs['patrons_per_shift'][i])
+        for i in range(n)
+    ])
+
+
+def draw_configurations(n, sampling=None):
+    """n restaurant configurations for a sampling scheme, or None when
+    the simulators draw their own (sampling None / 'random')."""
+
+    if sampling is None or sampling == 'random':
+        return None
+    method = 'random' if sampling == 'antithetic' else 'stratified'
+    return sample_configurations(n, method=method,
+                                 antithetic='antithetic' in sampling)
+
+
+def _with_trajectories(sim, trajectories):
+    """Wrap sim so call i writes into trajectories[i]."""
+
+    rows = iter(trajectories)
+
+    def wrapped(**kwargs):
+        return sim(**kwargs, trajectory=next(rows))
+
+    return wrapped
+
+
+def simulate_weighted(params, n, seed=None):
+    """n (sizes, likelihood-ratio weights) from the policy simulator in
+    rare-event mode (params include the is_* proposal settings)."""
+
+    if seed is not None:
+        np.random.seed(seed)
+
+    out = [simulate_outbreak_policy(**params, return_weight=True)
+           for _ in range(n)]
+    sizes = np.array([o[0] for o in out])
+    weights = np.array([o[1] for o in out], dtype=float)
+    return sizes, weights
+
+
+def _simulate_task(task):
+    return simulate_sizes(*task)
+
+
+def _simulate_weighted_task(task):
+    return simulate_weighted(*task)
+
+
+def task_seeds(n):
+    """n independent task seeds drawn from the (seeded) global RNG, so results
+    do not depend on the number of workers."""
+    base = np.random.randint(0, 2**31 - 1)
+    return [int(ss.generate_state(1)[0])
+            for ss in np.random.SeedSequence(base).spawn(n)]
+
+
+def executor_workers(executor):
+    """Worker count of an executor (1 for None: inline). Executors may
+    declare max_workers; ProcessPoolExecutor only keeps it privately."""
+    if executor is None:
+        return 1
+    n = getattr(executor, 'max_workers', None)
+    return n if n is not None else getattr(executor, '_max_workers', 1)
+
+
+def imap_tasks(tasks, executor=None, weighted=False):
+    """
+    Yield simulate_sizes results for (kind, params, n, seed[, sampling])
+    tasks, in order (or simulate_weighted results for (params, n, seed)
+    tasks when weighted=True). Runs inline when executor is None.
+    """
+
+    func = _simulate_weighted_task if weighted else _simulate_task
+
+    if executor is None:
+        for task in tasks:
+            yield func(task)
+        return
+
+    n_workers = executor_workers(executor)
+    chunksize = max(1, len(tasks) // (4 * n_workers))
+    yield from executor.map(func, tasks, chunksize=chunksize)
+
+
+# SHARED RESULT BUFFERS
+#
+# Workers write simulated sizes straight into a preallocated (cells, draws)
+# buffer instead of pickling arrays back to the parent. The buffer lives in
+# multiprocessing shared memory, or in a memory-mapped .npy file when a
+# path is given; tasks only carry a small spec to attach to it.
+
+_OPEN_BUFFERS = {}
+_ATTACHED = {}
+MAX_ATTACHED = 8
+
+
+def create_buffer(shape, dtype=np.int64, path=None):
+    """Allocate a result buffer. Returns (spec, array)."""
+
+    dtype = np.dtype(dtype)
+    shape = tuple(int(x) for x in shape)
+
+    if path is not None:
+        arr = np.lib.format.open_memmap(path, mode='w+', dtype=dtype,
+                                        shape=shape)
+        return ('file', path, shape, dtype.str), arr
+
+    from multiprocessing import shared_memory
+    nbytes = max(1, int(np.prod(shape)) * dtype.itemsize)
+    shm = shared_memory.SharedMemory(create=True, size=nbytes)
+    _OPEN_BUFFERS[shm.name] = shm
+    arr = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    return ('shm', shm.name, shape, dtype.str), arr
+
+
+def result_buffer(shape, executor=None, path=None):
+    """Shared buffer when pool workers (or a file) are involved, otherwise
+    a plain in-process array: also for executors whose workers cannot
+    attach to this machine's memory (shares_memory False, e.g.
+    work_queue), which return their results instead. Returns (spec,
+    array)."""
+    if path is None and (executor is None or
+                         not getattr(executor, 'shares_memory', True)):
+        return None, np.empty(shape, dtype=np.int64)
+    return create_buffer(shape, path=path)
+
+
+def release_buffer(spec):
+    """Free a shared-memory buffer (file buffers stay on disk). Drop all
+    views of the array first; anything still referenced is freed when
+    the last view goes away."""
+
+    if spec is None or spec[0] != 'shm':
+        return
+    shm = _OPEN_BUFFERS.pop(spec[1], None)
+    if shm is None:
+        return
+    shm.unlink()
+    try:
+        shm.close()
+    except BufferError:
+        pass
+
+
+def _open_shared_memory(name):
+    """Attach without taking ownership: the parent unlinks the segment."""
+
+    from multiprocessing import shared_memory
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13: workers share the parent's resource tracker (see
+        # get_executor), where a repeated registration is a no-op
+        return shared_memory.SharedMemory(name=name)
+
+
+def _attach_buffer(spec):
+
+    kind, name, shape, dtype = spec
+    if (kind, name) in _ATTACHED:
+        return _ATTACHED[(kind, name)][1]
+
+    if kind == 'file':
+        handle = None
+        arr = np.load(name, mmap_mode='r+')
+    else:
+        handle = _open_shared_memory(name)
+        arr = np.ndarray(shape, dtype=np.dtype(dtype), buffer=handle.buf)
+
+    # Keep a few recent buffers attached; close the oldest beyond that
+    # (drop its array first: close() fails while a view exists)
+    if len(_ATTACHED) >= MAX_ATTACHED:
+        old_handle, old_arr = _ATTACHED.pop(next(iter(_ATTACHED)))
+        del old_arr
+        if old_handle is not None:
+            old_handle.close()
+
+    _ATTACHED[(kind, name)] = (handle, arr)
+    return arr
+
+
+def _simulate_into_task(task):
+    spec, row, start, kind, params, n, seed, *sampling = task
+    out = _attach_buffer(spec)
+    out[row, start:start + n] = simulate_sizes(kind, params, n, seed,
+                                               *sampling)
+    return row
+
+
+def imap_into_buffer(tasks, spec, out, executor=None):
+    """
+    Run (row, start, kind, params, n, seed[, sampling]) tasks, each writing
+    n sizes into out[row, start:start+n]. Yields the row of each finished
+    task, in order. Inline (executor None) or without a shared buffer
+    (spec None) the parent writes into out.
+    """
+
+    if executor is None:
+        for row, start, kind, params, n, seed, *sampling in tasks:
+            out[row, start:start + n] = simulate_sizes(kind, params, n, seed,
+                                                       *sampling)
+            yield row
+        return
+
+    if spec is None:
+        for (row, start, *_), sizes in zip(
+                tasks, imap_tasks([tuple(t[2:]) for t in tasks], executor)):
+            out[row, start:start + len(sizes)] = sizes
+            yield row
+        return
+
+    n_workers = executor_workers(executor)
+    chunksize = max(1, len(tasks) // (4 * n_workers))
+    yield from executor.map(_simulate_into_task,
+                            [(spec,) + tuple(t) for t in tasks],
+                            chunksize=chunksize)
+
+
+# DESIGN EVALUATION
+#
+# Sensitivity designs and response surfaces evaluate many parameter points
+# with a few runs each. A task carries a block of design rows and writes
+# an (rows, n_reps) block of sizes into the shared buffer.
+
+DESIGN_CHUNK = 256   # design points per worker task
+
+
+def simulate_design(kind, base_params, names, X, n_reps, seed=None,
+                    sampling=None, common=1):
+    """
+    n_reps outbreak sizes for every row of X (values for `names` on top
+    of base_params). Returns a (len(X), n_reps) array.
+
+    common > 1 runs each consecutive group of `common` rows on the same
+    random stream (common random numbers), so differences between rows
+    of a group are mostly due to the parameters rather than noise.
+    """
+
+    if seed is not None:
+        np.random.seed(seed)
+
+    X = np.asarray(X, dtype=float)
+    out = np.empty((len(X), n_reps), dtype=np.int64)
+    for j, row in enumerate(X):
+        if common > 1:
+            if j % common == 0:
+                group_seed = np.random.randint(0, 2**31 - 1)
+            np.random.seed(group_seed)
+        params = dict(base_params, **dict(zip(names, row.tolist())))
+        out[j] = simulate_sizes(kind, params, n_reps, sampling=sampling)
+    return out
+
+
+def _simulate_design_task(task):
+    return simulate_design(*task)
+
+
+def _simulate_design_into_task(task):
+    spec, start, *args = task
+    out = _attach_buffer(spec)
+    block = simulate_design(*args)
+    out[start:start + len(block)] = block
+    return start
+
+
+def evaluate_design(kind, base_params, names, X, n_reps=1, executor=None,
+                    progress=None, sampling=None, common=1,
+                    chunk=DESIGN_CHUNK):
+    """
+    Simulate n_reps outbreaks at every row of the design X, in parallel
+    blocks of `chunk` rows written into a shared buffer (see
+    simulate_design for `common`). Returns a (len(X), n_reps) array;
+    progress(rows) is called as blocks finish.
+    """
+
+    X = np.asarray(X, dtype=float)
+    names = list(names)
+    chunk = -(-chunk // common) * common   # never split a group
+    starts = list(range(0, len(X), chunk))
+    tasks = [(start, kind, base_params, names, X[start:start + chunk],
+              n_reps, seed, sampling, common)
+             for start, seed in zip(starts, task_seeds(len(starts)))]
+
+    spec, buf = result_buffer((len(X), n_reps), executor)
+
+    if executor is None:
+        for start, *args in tasks:
+            block = simulate_design(*args)
+            buf[start:start + len(block)] = block
+            if progress is not None:
+                progress(len(block))
+        return buf
+
+    n_workers = executor_workers(executor)
+    chunksize = max(1, len(tasks) // (4 * n_workers))
+    if spec is None:
+        for (start, *_), block in zip(tasks, executor.map(
+                _simulate_design_task, [t[1:] for t in tasks],
+                chunksize=chunksize)):
+            buf[start:start + len(block)] = block
+            if progress is not None:
+                progress(len(block))
+        return buf
+
+    for start in executor.map(_simulate_design_into_task,
+                              [(spec,) + t for t in tasks],
+                              chunksize=chunksize):
+        if progress is not None:
+            progress(min(chunk, len(X) - start))
+
+    out = np.array(buf)
+    del buf
+    release_buffer(spec)
+    return out
+
+
+# TRAJECTORIES
+#
+# Opt-in per-day output: (outbreaks, max_days, 4) int32 blocks, written by
+# the workers into a shared buffer or straight into a .npy memmap, so
+# millions of outbreaks stay a compact array on disk.
+
+TRAJECTORY_CHUNK = 1000   # outbreaks per worker task
+
+
+def _simulate_trajectories_task(task):
+    size_spec, traj_spec, start, kind, params, n, seed, sampling = task
+    if size_spec is None:
+        # No shared memory (e.g. work_queue): return the block instead
+        traj = np.zeros((n, params.get('max_days', 5), 4), dtype=np.int32)
+        sizes = simulate_sizes(kind, params, n, seed, sampling,
+                               trajectories=traj)
+        return start, sizes, traj
+    sizes = _attach_buffer(size_spec)
+    traj = _attach_buffer(traj_spec)
+    traj[start:start + n] = 0
+    sizes[start:start + n] = simulate_sizes(
+        kind, params, n, seed, sampling, trajectories=traj[start:start + n])
+    return start
+
+
+def simulate_trajectories(kind, params, n, executor=None, path=None,
+                          sampling=None, chunk=TRAJECTORY_CHUNK):
+    """
+    n outbreaks with daily trajectories. Returns (sizes, trajectories),
+    trajectories int32 of shape (n, max_days, 4) (channels:
+    simulation.TRAJECTORY_CHANNELS). With path, trajectories are written
+    to that .npy file and returned memory-mapped. Executors whose
+    workers cannot attach to this machine's memory (shares_memory
+    False) return each block, which is written here.
+    """
+
+    max_days = params.get('max_days', 5)
+    shape = (n, max_days, 4)
+    starts = list(range(0, n, chunk))
+    tasks = [(start, kind, params, min(chunk, n - start), seed, sampling)
+             for start, seed in zip(starts, task_seeds(len(starts)))]
+
+    if executor is None or not getattr(executor, 'shares_memory', True):
+        if path is None:
+            traj = np.zeros(shape, dtype=np.int32)
+        else:
+            traj = np.lib.format.open_memmap(path, mode='w+',
+                                             dtype=np.int32, shape=shape)
+        sizes = np.empty(n, dtype=np.int64)
+        if executor is None:
+            for start, kind, params, m, seed, sampling in tasks:
+                sizes[start:start + m] = simulate_sizes(
+                    kind, params, m, seed, sampling,
+                    trajectories=traj[start:start + m])
+        else:
+            for start, block_sizes, block in executor.map(
+                    _simulate_trajectories_task,
+                    [(None, None) + t for t in tasks]):
+                sizes[start:start + len(block_sizes)] = block_sizes
+                traj[start:start + len(block)] = block
+        if path is not None:
+            traj.flush()
+        return sizes, traj
+
+    size_spec, size_buf = create_buffer((n,))
+    traj_spec, traj = create_buffer(shape, np.int32, path=path)
+    for _ in executor.map(_simulate_trajectories_task,
+                          [(size_spec, traj_spec) + t for t in tasks]):
+        pass
+
+    sizes = np.array(size_buf)
+    del size_buf
+    release_buffer(size_spec)
+    if path is None:
+        out = np.array(traj)
+        del traj
+        release_buffer(traj_spec)
+        return sizes, out
+    traj.flush()
+    return sizes, traj
+
+
+# WARM POOL
+
+_EXECUTOR = None
+_EXECUTOR_WORKERS = 0
+_EXECUTOR_ENGINE = None
+
+
+# BLAS / OpenMP thread settings; worker processes use one thread each
+BLAS_THREAD_VARS = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS',
+                    'MKL_NUM_THREADS', 'BLIS_NUM_THREADS',
+                    'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS']
+
+
+def blas_thread_env():
+    """Environment for a fresh worker interpreter: one BLAS thread."""
+    return {**os.environ, **{var: '1' for var in BLAS_THREAD_VARS}}
+
+
+def limit_blas_threads():
+    """
+    One BLAS / OpenMP thread in this process: the worker count is the
+    whole concurrency budget, so threads inside workers would only
+    oversubscribe the cores. Takes effect at once with threadpoolctl
+    (optional); otherwise only processes started from here later pick
+    up the environment.
+    """
+    os.environ.update({var: '1' for var in BLAS_THREAD_VARS})
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        return
+    threadpool_limits(1)
+
+
+def init_worker(engine='python'):
+    """Pool initializer. Importing this module already loaded the
+    simulators and configuration tables; run each simulator once so the
+    first real task pays no first-call overhead. With the kernel engine,
+    compile (or load) the kernel on one thread: the pool already runs one
+    process per core, and BLAS is limited to one thread for the same
+    reason."""
+
+    set_engine(engine)
+    limit_blas_threads()
+    state = np.random.get_state()
+    for sim in SIMULATORS.values():
+        sim()
+    np.random.set_state(state)
+
+    if engine == 'kernel':
+        from kernel import NUMBA, simulate_kernel
+        if NUMBA:
+            import numba
+            numba.set_num_threads(1)
+        simulate_kernel('policy', {}, 1, seed=0)
+
+
+def get_executor(n_workers=None):
+    """
+    The shared warm executor, created on first use and reused by every
+    later call with the same worker count and engine. Returns None (run
+    inline) for n_workers <= 1.
+    """
+
+    global _EXECUTOR, _EXECUTOR_WORKERS, _EXECUTOR_ENGINE
+    from concurrent.futures import ProcessPoolExecutor
+
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    if n_workers <= 1:
+        return None
+
+    if _EXECUTOR is None or _EXECUTOR_WORKERS != n_workers or \
+            _EXECUTOR_ENGINE != _ENGINE:
+        shutdown_executor()
+        # Start the resource tracker before forking so workers attaching
+        # to shared result buffers use the parent's tracker, not their own
+        from multiprocessing import resource_tracker
+        resource_tracker.ensure_running()
+        _EXECUTOR = ProcessPoolExecutor(max_workers=n_workers,
+                                        initializer=init_worker,
+                                        initargs=(_ENGINE,))
+        _EXECUTOR_WORKERS = n_workers
+        _EXECUTOR_ENGINE = _ENGINE
+
+    return _EXECUTOR
+
+
+def shutdown_executor():
+    global _EXECUTOR, _EXECUTOR_WORKERS, _EXECUTOR_ENGINE
+    if _EXECUTOR is not None:
+        _EXECUTOR.shutdown()
+    _EXECUTOR = None
+    _EXECUTOR_WORKERS = 0
+    _EXECUTOR_ENGINE = None
+
+
+def loaded_heavy_modules():
+    return [m for m in HEAVY_MODULES if m in sys.modules]
+
+
+# STARTUP MEASUREMENT
+
+def _time_subprocess(args, repeats):
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable] + args, cwd=os.path.dirname(
+            os.path.abspath(__file__)), capture_output=True, check=True)
+        times.append(time.perf_counter() - t0)
+    return float(np.median(times))
+
+
+def _ping():
+    return loaded_heavy_modules()
+
+
+def measure_startup(repeats=3):
+    """Median wall times (s) for interpreter, worker import, CLI start and
+    a spawned pool round-trip."""
+
+    from concurrent.futures import ProcessPoolExecutor
+    import multiprocessing as mp
+
+    results = {
+        'python': _time_subprocess(['-c', 'pass'], repeats),
+        'import_worker': _time_subprocess(['-c', 'import worker'], repeats),
+        'import_main': _time_subprocess(['-c', 'import main'], repeats),
+        'cli_help': _time_subprocess(['main.py', '--help'], repeats),
+    }
+
+    spawn = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=1,
+                                 mp_context=mp.get_context('spawn')) as ex:
+            heavy = ex.submit(_ping).result()
+        spawn.append(time.perf_counter() - t0)
+    results['spawn_worker'] = float(np.median(spawn))
+    results['worker_heavy_modules'] = heavy
+
+    return results
+
+
+if __name__ == "__main__":
+
+    print("Startup times (median, seconds):")
+    for k, v in measure_startup().items():
+        print(f"  {k:22s} {v}")
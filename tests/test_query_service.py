@@ -0,0 +1,38 @@
+"""HTTP what-if queries with integer simulator kwargs (query_service)."""
+
+import json
+import asyncio
+
+from query_service import WhatIfService, _handle
+
+
+async def _get(service, target):
+    server = await asyncio.start_server(
+        lambda r, w: _handle(service, r, w), '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    async with server:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(f"GET {target} HTTP/1.1\r\nHost: localhost\r\n"
+                     f"Connection: close\r\n\r\n".encode())
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        response = await reader.read()
+        writer.close()
+    return status, json.loads(response.split(b'\r\n\r\n', 1)[1])
+
+
+def test_get_query_with_integer_kwargs(tmp_path):
+
+    service = WhatIfService({}, store_dir=str(tmp_path))
+
+    status, answer = asyncio.run(_get(
+        service, '/query?policy=baseline&max_days=4&n_food_handlers=5'
+                 '&runs=20'))
+    assert status == 200, answer
+    assert answer['params'] == {'max_days': 4, 'n_food_handlers': 5}
+    assert answer['stats']['runs'] == 20
+
+    status, answer = asyncio.run(_get(
+        service, '/query?policy=baseline&max_days=4.5&runs=20'))
+    assert status == 400
+    assert 'max_days must be an integer' in answer['error']
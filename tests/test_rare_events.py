@@ -0,0 +1,38 @@
+"""Importance-sampling tail estimates (rare_events) are unbiased."""
+
+import numpy as np
+
+from rare_events import simulate_tilted, weighted_tail
+from worker import simulate_sizes
+
+
+def test_weighted_tail_exact_likelihood_ratio():
+    # Target Exp(1), proposal Exp(1/5): P(X > t) = exp(-t)
+    rng = np.random.default_rng(0)
+    n, lam = 200000, 0.2
+    x = rng.exponential(1 / lam, n)
+    weights = np.exp(-x) / (lam * np.exp(-lam * x))
+
+    est = weighted_tail(x, weights, [2, 5, 8])
+    for t, e in est.items():
+        assert abs(e['p'] - np.exp(-t)) < 4 * e['se'], (t, e)
+        assert e['vrf'] > 1
+
+
+def test_tilted_simulator_matches_plain_monte_carlo():
+    params = {'beta_handler_patron': 0.035, 'beta_staff_staff': 0.01,
+              'prob_food_contamination': 0.124,
+              'contamination_size_mean': 35.0}
+    tilt = {'is_contamination_mult': 3.0, 'is_size_shift': 0.5,
+            'is_init_infected_p': [0.2, 0.4, 0.4]}
+
+    np.random.seed(5)
+    sizes, weights = simulate_tilted(params, 6000, tilt)
+    plain = simulate_sizes('policy', params, 20000, seed=6)
+
+    # E_q[w] = 1 under the proposal
+    assert abs(weights.mean() - 1) < 4 * weights.std() / np.sqrt(6000)
+    for t, e in weighted_tail(sizes, weights, [50, 100]).items():
+        p_mc = np.mean(plain > t)
+        se_mc = np.sqrt(p_mc * (1 - p_mc) / len(plain))
+        assert abs(e['p'] - p_mc) < 4 * np.hypot(e['se'], se_mc), (t, e)
@@ -0,0 +1,39 @@
+"""Stratified antithetic configuration sampling (simulation)."""
+
+import numpy as np
+
+import simulation
+from simulation import sample_configurations
+
+
+def _strata(monkeypatch, n, calls):
+    """Stratum of every draw, with the joint grid replaced by m equal
+    cells so that a configuration is its stratum number."""
+
+    m = (n + 1) // 2
+    monkeypatch.setattr(simulation, 'CONFIG_GRID', {
+        'prob': np.full(m, 1 / m), 'stratum': np.arange(m)})
+    monkeypatch.setattr(simulation, 'CONFIG_CDF', np.arange(1, m + 1) / m)
+    np.random.seed(3)
+    return [sample_configurations(n, 'stratified', antithetic=True)
+            ['stratum'] for _ in range(calls)]
+
+
+def test_even_n_two_draws_per_stratum(monkeypatch):
+    for strata in _strata(monkeypatch, 8, 50):
+        np.testing.assert_array_equal(np.bincount(strata, minlength=4),
+                                      [2, 2, 2, 2])
+
+
+def test_odd_n_drops_a_random_stratum_draw(monkeypatch):
+    n, calls = 5, 3000
+    short = []
+    for strata in _strata(monkeypatch, n, calls):
+        counts = np.bincount(strata, minlength=3)
+        assert len(strata) == n
+        assert sorted(counts) == [1, 2, 2]
+        short.append(np.argmin(counts))
+
+    # The stratum that loses a draw is uniform, not always the last
+    share = np.bincount(short, minlength=3) / calls
+    assert np.all(np.abs(share - 1 / 3) < 0.04), share
@@ -0,0 +1,32 @@
+"""Histogram summaries (streaming) against the raw-sample statistics."""
+
+import numpy as np
+import pytest
+
+from streaming import count_bxp, count_percentiles, size_counts
+
+
+def _sample(seed, n):
+    rng = np.random.default_rng(seed)
+    return rng.negative_binomial(2, 0.05, n).astype(np.int64)
+
+
+@pytest.mark.parametrize('seed, n', [(0, 1), (1, 2), (2, 17), (3, 5000)])
+def test_count_percentiles_match_np_percentile(seed, n):
+    sizes = _sample(seed, n)
+    counts = size_counts(np.array_split(sizes, 3))
+    q = np.linspace(0, 100, 41)
+    np.testing.assert_allclose(count_percentiles(counts, q),
+                               np.percentile(sizes, q), rtol=0, atol=1e-9)
+
+
+@pytest.mark.parametrize('seed, n', [(4, 5), (5, 200), (6, 5000)])
+def test_count_bxp_matches_boxplot_stats(seed, n):
+    from matplotlib.cbook import boxplot_stats
+
+    sizes = _sample(seed, n)
+    ours = count_bxp(np.bincount(sizes))
+    ref = boxplot_stats(sizes)[0]
+    for key in ['mean', 'med', 'q1', 'q3', 'iqr', 'whislo', 'whishi']:
+        assert ours[key] == pytest.approx(ref[key]), key
+    np.testing.assert_array_equal(ours['fliers'], np.unique(ref['fliers']))
@@ -0,0 +1,39 @@
+"""Work queue results against inline and warm-pool runs, bit for bit."""
+
+import numpy as np
+
+from calibration import simulate_grid
+from worker import get_executor, imap_tasks, shutdown_executor, task_seeds
+from work_queue import WorkQueueExecutor
+
+
+def _runs(executor):
+    np.random.seed(11)
+    tasks = [('policy', {'compliance': c, 'policy_exclusion': True}, 40,
+              seed) for c, seed in zip([0.0, 0.5, 1.0], task_seeds(3))]
+    sizes = list(imap_tasks(tasks, executor))
+    np.random.seed(12)
+    _, grid = simulate_grid([{'beta_staff_staff': b} for b in
+                             [0.01, 0.05, 0.1, 0.2, 0.3]], 30, executor)
+    return np.concatenate(sizes + [np.ravel(grid)])
+
+
+def test_queue_map_matches_inline_and_pool(tmp_path):
+
+    inline = _runs(None)
+
+    try:
+        pool = _runs(get_executor(2))
+    finally:
+        shutdown_executor()
+
+    queue = WorkQueueExecutor(str(tmp_path / 'queue'), n_local=2)
+    try:
+        queued = _runs(queue)
+    finally:
+        queue.shutdown()
+
+    np.testing.assert_array_equal(pool, inline)
+    np.testing.assert_array_equal(queued, inline)
+    for sub in ['pending', 'leased', 'done']:
+        assert not list((tmp_path / 'queue' / sub).iterdir()), sub